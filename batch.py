@@ -0,0 +1,181 @@
+"""
+pytex
+Copyright (C) 2015  Gregory Mitrano
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along
+with this program; if not, write to the Free Software Foundation, Inc.,
+51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+from observer import PackObserver, PrintObserver
+from pytex import AtlasPacker, NewWorkerPool
+import argparse
+import glob
+import json
+import multiprocessing
+import multiprocessing.pool
+import os
+import sys
+import time
+import traceback
+
+class BatchJob(object):
+    """A small data structure describing one atlas of a batch build"""
+
+    def __init__(self, name, inputPatterns, minImageSize, maxImageSize, manifestMode, outputImagePath, outputManifestPath, **packOptions):
+        self.name = name
+        self.inputPatterns = inputPatterns
+        self.minImageSize = minImageSize
+        self.maxImageSize = maxImageSize
+        self.manifestMode = manifestMode
+        self.outputImagePath = outputImagePath
+        self.outputManifestPath = outputManifestPath
+        self.packOptions = packOptions
+
+    def GetImagePaths(self):
+        # Every image matched by any of the patterns, once.
+        imagePaths = set()
+        for pattern in self.inputPatterns:
+            imagePaths.update(glob.glob(pattern))
+        return sorted(imagePaths)
+
+class BatchJobResult(object):
+    """A small data structure for holding the outcome of one job of a batch build"""
+
+    def __init__(self, name, packResult=None, error=None, seconds=0.0):
+        self.name = name
+        self.packResult = packResult
+        self.error = error
+        self.seconds = seconds
+
+    def Succeeded(self):
+        return self.error is None and self.packResult is not None and self.packResult.success
+
+def _BuildJob(job, imagePaths, workerPool=None, observer=None):
+    # Any failure only takes down its own job, including a worker dying under it.
+    start = time.time()
+    try:
+        packResult = AtlasPacker(workerPool=workerPool).Pack(imagePaths, job.minImageSize, job.maxImageSize, job.manifestMode, job.outputImagePath, job.outputManifestPath, observer=observer, **job.packOptions)
+        return BatchJobResult(job.name, packResult, None, time.time() - start)
+    except Exception:
+        return BatchJobResult(job.name, None, traceback.format_exc(), time.time() - start)
+
+def LoadBatchJobs(configPath):
+    """Reads the jobs of a batch build from a json file
+
+    The file holds a list of jobs under "jobs", each with a name, a list of
+    input globs, minSize, maxSize, manifestMode, outputImage, outputManifest
+    and optionally a dictionary of further Pack options. Relative paths are
+    relative to the config file. The workers are shared by the whole batch,
+    so a job can't set its own and a ValueError is raised if it tries."""
+    with open(configPath, "rb") as file:
+        config = json.load(file)
+
+    baseDir = os.path.dirname(os.path.abspath(configPath))
+    def GetPath(path):
+        return os.path.join(baseDir, path)
+
+    jobs = []
+    for jobConfig in config["jobs"]:
+        packOptions = dict((str(key), value) for key, value in jobConfig.get("options", dict()).iteritems())
+        if "workers" in packOptions:
+            raise ValueError("Job %s sets workers, which are given to the whole batch instead" % jobConfig["name"])
+        if packOptions.get("cacheDir") is not None:
+            packOptions["cacheDir"] = GetPath(packOptions["cacheDir"])
+
+        jobs.append(BatchJob(jobConfig["name"], [GetPath(pattern) for pattern in jobConfig["inputs"]], tuple(jobConfig["minSize"]), tuple(jobConfig["maxSize"]), \
+            jobConfig.get("manifestMode", "uv"), GetPath(jobConfig["outputImage"]), GetPath(jobConfig["outputManifest"]), **packOptions))
+
+    return jobs
+
+class BatchBuilder(object):
+    """Builds many atlases in one process on a single shared pool of workers
+
+    The jobs are built on threads of this process, largest first, so the
+    long jobs don't end up running alone at the end. The per image stages
+    of every job go to the same pool of worker processes, which import
+    everything once, so a large job keeps all of them busy once the small
+    ones are done. A worker that dies only fails the job it was working
+    for and is replaced."""
+
+    def __init__(self, workers=None, observer=None):
+        self._workers = workers if workers is not None else multiprocessing.cpu_count()
+        self._observer = observer if observer is not None else PackObserver()
+
+    def _GetJobSize(self, imagePaths):
+        # The encoded size of the images is a cheap estimate of the work in a job.
+        jobSize = 0
+        for imagePath in imagePaths:
+            try:
+                jobSize += os.path.getsize(imagePath)
+            except OSError:
+                pass
+        return jobSize
+
+    def Build(self, jobs):
+        """Builds the jobs and returns a BatchJobResult for each of them, in the same order"""
+        results = [None] * len(jobs)
+        jobArgs = []
+        for jobIndex, job in enumerate(jobs):
+            imagePaths = job.GetImagePaths()
+            if imagePaths:
+                jobArgs.append((jobIndex, job, imagePaths))
+            else:
+                results[jobIndex] = BatchJobResult(job.name, None, "No images matched %s" % ", ".join(job.inputPatterns))
+                self._ReportJob(results[jobIndex])
+
+        # Start the largest jobs first.
+        jobArgs.sort(key=lambda args: -self._GetJobSize(args[2]))
+        self._observer.Message("Building %d atlases on %d workers..." % (len(jobArgs), self._workers))
+
+        if self._workers < 2:
+            for jobIndex, job, imagePaths in jobArgs:
+                results[jobIndex] = _BuildJob(job, imagePaths)
+                self._ReportJob(results[jobIndex])
+        elif jobArgs:
+            workerPool = NewWorkerPool(self._workers)
+            threadPool = multiprocessing.pool.ThreadPool(min(self._workers, len(jobArgs)))
+            def BuildJob(args):
+                jobIndex, job, imagePaths = args
+                return (jobIndex, _BuildJob(job, imagePaths, workerPool))
+            try:
+                for jobIndex, result in threadPool.imap_unordered(BuildJob, jobArgs, 1):
+                    results[jobIndex] = result
+                    self._ReportJob(result)
+            finally:
+                threadPool.close()
+                threadPool.join()
+                workerPool.close()
+                workerPool.join()
+
+        return results
+
+    def _ReportJob(self, result):
+        if result.Succeeded():
+            self._observer.Message("Built %s in %.2fs." % (result.name, result.seconds))
+        elif result.error is not None:
+            self._observer.Message("Failed to build %s:\n%s" % (result.name, result.error))
+        else:
+            self._observer.Message("Failed to build %s, the images didn't fit." % result.name)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Builds all atlases described in a json config in one process.")
+    parser.add_argument("config", help="Json file listing the atlas jobs")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count(), help="Number of worker processes shared by all jobs")
+    args = parser.parse_args()
+
+    start = time.time()
+    results = BatchBuilder(args.workers, PrintObserver()).Build(LoadBatchJobs(args.config))
+    failedCount = sum(1 for result in results if not result.Succeeded())
+    print "Built %d of %d atlases in %.2fs." % (len(results) - failedCount, len(results), time.time() - start)
+    sys.exit(1 if failedCount else 0)
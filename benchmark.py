@@ -0,0 +1,269 @@
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from PIL import Image, ImageDraw
+from pytex import AtlasPacker, ENCODE_PROFILES, PackSettings, PACKERS
+from cygon import CygonRectanglePacker
+from skyline import SkylineRectanglePacker
+
+def GenerateSprites(count, size, background=(0, 0, 0, 0), seed=0):
+    # Generate mostly empty sprites with a single opaque blob somewhere inside.
+    rng = random.Random(seed)
+    sprites = []
+    for i in xrange(count):
+        image = Image.new("RGBA", size, background)
+        x0 = rng.randint(0, size[0] / 2)
+        y0 = rng.randint(0, size[1] / 2)
+        x1 = rng.randint(x0, size[0] - 1)
+        y1 = rng.randint(y0, size[1] - 1)
+        ImageDraw.Draw(image).ellipse([x0, y0, x1, y1], fill=(rng.randint(1, 255), rng.randint(1, 255), rng.randint(1, 255), 255))
+        sprites.append(image)
+    return sprites
+
+def ScanBBox(image, color=(0,0,0,0)):
+    # Reference per-pixel implementation of AtlasPacker._FindBBox, for testing and benchmarking it.
+    alphaTestMode = ( color[3] is 0 )
+    img = image.load()
+    bbox = [0,0,image.size[0],image.size[1]]
+    
+    # Find top
+    for y in xrange( image.size[1] ):
+        emptyRow = True
+        for x in xrange( image.size[0] ):
+            pixel = img[x, y]
+            
+            if alphaTestMode:
+                if pixel[3] != 0:
+                    emptyRow = False
+                    break
+            else:
+                if pixel != color:
+                    emptyRow = False
+                    break
+        
+        if not emptyRow:
+            bbox[1] = y
+            break
+        
+    # Find bottom
+    for y in reversed( xrange( image.size[1] ) ):
+        emptyRow = True
+        for x in reversed( xrange( image.size[0] ) ):
+            pixel = img[x, y]
+            
+            if alphaTestMode:
+                if pixel[3] != 0:
+                    emptyRow = False
+                    break
+            else:
+                if pixel != color:
+                    emptyRow = False
+                    break
+        
+        if not emptyRow:
+            bbox[3] = y+1
+            break
+        
+    # Find left
+    for x in xrange( image.size[0] ):
+        emptyRow = True
+        for y in xrange( image.size[1] ):
+            pixel = img[x, y]
+            
+            if alphaTestMode:
+                if pixel[3] != 0:
+                    emptyRow = False
+                    break
+            else:
+                if pixel != color:
+                    emptyRow = False
+                    break
+        
+        if not emptyRow:
+            bbox[0] = x
+            break
+        
+    # Find right
+    for x in reversed( xrange( image.size[0] ) ):
+        emptyRow = True
+        for y in reversed( xrange( image.size[1] ) ):
+            pixel = img[x, y]
+            
+            if alphaTestMode:
+                if pixel[3] != 0:
+                    emptyRow = False
+                    break
+            else:
+                if pixel != color:
+                    emptyRow = False
+                    break
+        
+        if not emptyRow:
+            bbox[2] = x+1
+            break
+    
+    return tuple( bbox )
+
+def TimeBBox(findBBox, sprites, color):
+    start = time.time()
+    results = [findBBox(sprite, color) for sprite in sprites]
+    return (time.time() - start, results)
+
+def BenchmarkTrim(count, size):
+    packer = AtlasPacker()
+    for modeName, color in [("alpha", (0, 0, 0, 0)), ("color key", (255, 0, 255, 255))]:
+        sprites = GenerateSprites(count, size, color)
+        scanTime, scanResults = TimeBBox(ScanBBox, sprites, color)
+        findTime, findResults = TimeBBox(packer._FindBBox, sprites, color)
+        assert(scanResults == findResults)
+        print "%s: %d sprites of %dx%d, scan %.3fs, vectorized %.3fs (%.1fx)" % (modeName, count, size[0], size[1], scanTime, findTime, scanTime / max(findTime, 1e-9))
+
+def BenchmarkPackers(count, packingAreaSize):
+    # Pack lots of small glyph sized rectangles.
+    rng = random.Random(0)
+    rectangles = [(rng.randint(4, 12), rng.randint(4, 12)) for i in xrange(count)]
+
+    for packerClass in [CygonRectanglePacker, SkylineRectanglePacker]:
+        packer = packerClass(*packingAreaSize)
+        start = time.time()
+        packedCount = sum(1 for rectangle in rectangles if packer.Pack(*rectangle) is not None)
+        print "%s: packed %d of %d rectangles in %.3fs" % (packerClass.__name__, packedCount, count, time.time() - start)
+
+# Functions returning a random sprite size, from small glyphs to large background pieces.
+SIZE_DISTRIBUTIONS = {
+    "glyphs": lambda rng: (rng.randint(4, 24), rng.randint(8, 32)),
+    "icons": lambda rng: (rng.choice([16, 24, 32, 48, 64]),) * 2,
+    "mixed": lambda rng: (rng.randint(8, 256), rng.randint(8, 256)) if rng.random() < 0.05 else (rng.randint(8, 64), rng.randint(8, 64)),
+    "uniform": lambda rng: (rng.randint(8, 128), rng.randint(8, 128)),
+}
+
+def GenerateCorpus(directory, count, distribution="mixed", margin=0.25, duplicateRatio=0.0, seed=0):
+    """Writes a repeatable set of sprites to a directory and returns their paths
+
+    margin: Largest fraction of each side that may be left transparent around the content
+    duplicateRatio: Fraction of the sprites that are copies of an earlier sprite"""
+    rng = random.Random(seed)
+    imagePaths = []
+    for i in xrange(count):
+        imagePath = os.path.join(directory, "sprite%06d.png" % i)
+
+        if imagePaths and rng.random() < duplicateRatio:
+            shutil.copyfile(rng.choice(imagePaths), imagePath)
+        else:
+            contentSize = SIZE_DISTRIBUTIONS[distribution](rng)
+            marginSize = (int(contentSize[0] * rng.uniform(0, margin)), int(contentSize[1] * rng.uniform(0, margin)))
+            image = Image.new("RGBA", (contentSize[0] + marginSize[0] * 2, contentSize[1] + marginSize[1] * 2))
+            color = (rng.randint(1, 255), rng.randint(1, 255), rng.randint(1, 255), 255)
+            contentBox = [marginSize[0], marginSize[1], marginSize[0] + contentSize[0] - 1, marginSize[1] + contentSize[1] - 1]
+            if rng.random() < 0.5:
+                ImageDraw.Draw(image).ellipse(contentBox, fill=color)
+            else:
+                ImageDraw.Draw(image).rectangle(contentBox, fill=color)
+            image.save(imagePath)
+
+        imagePaths.append(imagePath)
+
+    return imagePaths
+
+def GetPeakMemory():
+    # Linux reports kilobytes, OS X reports bytes.
+    peakMemory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peakMemory if sys.platform == "darwin" else peakMemory * 1024
+
+def BenchmarkStages(count, distribution, margin, duplicateRatio, packer, workers, seed=0, encodeProfile="balanced"):
+    """Runs every stage of the pipeline on a generated corpus and returns the measurements"""
+    workDir = tempfile.mkdtemp()
+    try:
+        corpusDir = os.path.join(workDir, "corpus")
+        os.mkdir(corpusDir)
+        imagePaths = GenerateCorpus(corpusDir, count, distribution, margin, duplicateRatio, seed)
+
+        result = {
+            "corpus": {"count": count, "distribution": distribution, "margin": margin, "duplicateRatio": duplicateRatio, "seed": seed},
+            "packer": packer,
+            "workers": workers,
+            "encodeProfile": encodeProfile,
+            "stages": [],
+        }
+
+        atlasPacker = AtlasPacker()
+        atlasPacker._StartWorkers(workers)
+        settings = PackSettings((128, 128), (8192, 8192), packer=packer, deduplicate=duplicateRatio > 0, multiPage=True, encodeProfile=encodeProfile)
+        outputImagePath = os.path.join(workDir, "atlas.png")
+
+        def TimeStage(name, function, *args):
+            start = time.time()
+            stageResult = function(*args)
+            seconds = time.time() - start
+            result["stages"].append({"name": name, "seconds": seconds, "imagesPerSecond": count / max(seconds, 1e-9), "peakMemory": GetPeakMemory()})
+            return stageResult
+
+        try:
+            imageInfoList = TimeStage("GetImageInfo", atlasPacker._GetImageInfo, imagePaths)
+            TimeStage("CropBoundingBoxes", atlasPacker._CropBoundingBoxes, imageInfoList, (0, 0, 0, 0))
+
+            aliasImageInfoList = []
+            if settings.deduplicate:
+                imageInfoList, aliasImageInfoList = TimeStage("DeduplicateImages", atlasPacker._DeduplicateImages, imageInfoList)
+
+            pages = TimeStage("PackImages", atlasPacker._PackPages, imageInfoList, settings)
+            assert(pages is not None)
+
+            packedImageDict = dict()
+            for imageSize, pagePackedImageDict in pages:
+                packedImageDict.update(pagePackedImageDict)
+            atlasPacker._AddAliases(packedImageDict, aliasImageInfoList)
+
+            TimeStage("CompositePackedImages", atlasPacker._CompositePages, outputImagePath, pages, settings.padding, None, encodeProfile)
+            TimeStage("WriteManifestForImages", atlasPacker._WriteManifestForImages, os.path.join(workDir, "atlas.xml"), pages[0][0], "uv", packedImageDict)
+            TimeStage("SliceImage", atlasPacker._SliceImage, atlasPacker._GetPagePath(outputImagePath, 0, len(pages)), (128, 128), workers, False, encodeProfile)
+        finally:
+            atlasPacker._StopWorkers()
+            atlasPacker._imageCache.Clear()
+
+        result["pages"] = [{"width": imageSize[0], "height": imageSize[1], "bytes": os.path.getsize(atlasPacker._GetPagePath(outputImagePath, pageIndex, len(pages))), "occupancy": atlasPacker._GetOccupancy([packedImageData[0] for packedImageData in pagePackedImageDict.values()], imageSize)} \
+        for pageIndex, (imageSize, pagePackedImageDict) in enumerate(pages)]
+        result["seconds"] = sum(stage["seconds"] for stage in result["stages"])
+        result["peakMemory"] = GetPeakMemory()
+        return result
+    finally:
+        shutil.rmtree(workDir)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures the speed, memory use and packing quality of pytex on generated sprite sets.")
+    parser.add_argument("--counts", type=int, nargs="+", default=[100, 1000], help="Numbers of sprites in the generated sets")
+    parser.add_argument("--distribution", choices=sorted(SIZE_DISTRIBUTIONS.keys()), default="mixed", help="Size distribution of the sprites")
+    parser.add_argument("--margin", type=float, default=0.25, help="Largest fraction of each side left transparent around the sprite content")
+    parser.add_argument("--duplicates", type=float, default=0.0, help="Fraction of the sprites that are duplicates")
+    parser.add_argument("--packer", choices=sorted(PACKERS.keys()), default="skyline", help="Rectangle packing algorithm and placement heuristic")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes")
+    parser.add_argument("--encode-profile", choices=sorted(ENCODE_PROFILES.keys()), default="balanced", help="PNG encode profile for the atlas and the tiles")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the sprite generator")
+    parser.add_argument("--output", default="benchmark.json", help="File the results are written to as json")
+    parser.add_argument("--micro", action="store_true", help="Only run the trimming and rectangle packer micro benchmarks")
+    args = parser.parse_args()
+
+    if args.micro:
+        BenchmarkTrim(32, (512, 512))
+        BenchmarkPackers(10000, (2048, 2048))
+    else:
+        results = []
+        for count in args.counts:
+            result = BenchmarkStages(count, args.distribution, args.margin, args.duplicates, args.packer, args.workers, args.seed, args.encode_profile)
+            results.append(result)
+
+            print "%d sprites: %.3fs total, %.1f MB peak memory, %d page(s) with %s occupancy" % (count, result["seconds"], result["peakMemory"] / (1024.0 * 1024.0), len(result["pages"]), \
+            ", ".join("%.1f%%" % page["occupancy"] for page in result["pages"]))
+            for stage in result["stages"]:
+                print "    %-24s %8.3fs %10.1f images/s" % (stage["name"], stage["seconds"], stage["imagesPerSecond"])
+
+        with open(args.output, "wb") as file:
+            json.dump({"python": platform.python_version(), "platform": platform.platform(), "results": results}, file, indent=2, sort_keys=True)
+        print "Results written to %s" % args.output
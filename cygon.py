@@ -62,6 +62,22 @@ http://www.csc.liv.ac.uk/~epa/surveyhtml.html"""
         be found, otherwise returns None"""
         raise NotImplementedError
  
+    def TryPackWithRotation(self, rectangleWidth, rectangleHeight):
+        """Tries to allocate space for a rectangle in the packing area, turning
+        it by 90 degrees if that's the only way it fits
+ 
+        rectangleWidth: Width of the rectangle to allocate
+        rectangleHeight: Height of the rectangle to allocate
+ 
+        Returns a tuple of the Point instance or None and whether the rectangle
+        was rotated"""
+        point = self.TryPack(rectangleWidth, rectangleHeight)
+        if point is None and rectangleWidth != rectangleHeight:
+            point = self.TryPack(rectangleHeight, rectangleWidth)
+            return (point, point is not None)
+ 
+        return (point, False)
+ 
 class CygonRectanglePacker(RectanglePacker):
     """
     Packer using a custom algorithm by Markus 'Cygon' Ewald
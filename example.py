@@ -1,13 +1,50 @@
+import argparse
 import os
-import sys
-from pytex import AtlasPacker
+from manifest import MANIFEST_WRITERS
+from observer import ObserverGroup, PrintObserver, StatsObserver
+from pytex import AtlasPacker, ENCODE_PROFILES, MIP_FILTERS, PACKERS, SORT_MODES
+from watch import AtlasWatcher
 
 IMAGE_EXTENSIONS = {".jpg", ".png"}
+MANIFEST_EXTENSIONS = {"xml": ".xml", "json": ".json", "binary": ".bin"}
+TEXTURE_FORMATS = ["bc1", "bc3", "etc1"]
+PIXEL_FORMATS = ["auto", "rgb565", "rgba4444"]
 
 if __name__ == "__main__":
-    if len(sys.argv) == 2:
-        if os.path.isdir(sys.argv[1]):
-            directoryPath = sys.argv[1]
+    parser = argparse.ArgumentParser(description="Packs a directory of images into a texture atlas, or slices an image into tiles.")
+    parser.add_argument("path", nargs="?", help="A directory of images to pack or an image to slice")
+    parser.add_argument("--workers", type=int, default=1, help="Number of workers used for the per image and per tile work")
+    parser.add_argument("--npot", action="store_true", help="Allow non power of two atlas sizes")
+    parser.add_argument("--sort", choices=sorted(SORT_MODES.keys()) + ["best"], default="name", help="Order in which images are packed, or best to keep the smallest result of all orders")
+    parser.add_argument("--packer", choices=sorted(PACKERS.keys()), default="skyline", help="Rectangle packing algorithm and placement heuristic")
+    parser.add_argument("--rotate", action="store_true", help="Allow images to be rotated by 90 degrees when packing")
+    parser.add_argument("--dedup", action="store_true", help="Pack identical images only once")
+    parser.add_argument("--multipage", action="store_true", help="Spread the images over several atlas pages when they don't fit into one")
+    parser.add_argument("--cache", metavar="DIR", help="Directory for caching trimmed images between builds, so unchanged images aren't decoded again")
+    parser.add_argument("--strip-height", type=int, help="Composite the atlas in strips of this many rows to bound memory use")
+    parser.add_argument("--skip-uniform-tiles", action="store_true", help="Don't write tiles of a single color when slicing, only record their color in the tile index")
+    parser.add_argument("--manifest-format", choices=sorted(MANIFEST_WRITERS.keys()), default="xml", help="File format of the manifest")
+    parser.add_argument("--encode-profile", choices=sorted(ENCODE_PROFILES.keys()), default="balanced", help="Trade PNG encoding speed against file size")
+    parser.add_argument("--extrude", action="store_true", help="Repeat the edge pixels of every image into its padding so filtering doesn't bleed between images")
+    parser.add_argument("--mipmaps", choices=sorted(MIP_FILTERS.keys()), help="Write a mip chain next to the atlas, downsampled with this filter")
+    parser.add_argument("--texture-format", choices=TEXTURE_FORMATS, help="Block compress the atlas, written as KTX for etc1 and DDS otherwise")
+    parser.add_argument("--block-align", action="store_true", help="Pad every image to whole 4x4 blocks so compression doesn't bleed between images")
+    parser.add_argument("--polygons", type=int, metavar="VERTICES", help="Also trim every image to a convex polygon of at most this many vertices and write it to the manifest")
+    parser.add_argument("--pixel-format", choices=PIXEL_FORMATS, help="Write the atlas in fewer bits per pixel, auto picks the smallest format that keeps every pixel")
+    parser.add_argument("--dither", action="store_true", help="Dither the atlas when rounding it to rgb565 or rgba4444")
+    parser.add_argument("--grid", choices=["auto", "always", "never"], default="auto", help="Place the images in a grid of equal cells, by default when they all have the same size")
+    parser.add_argument("--watch", action="store_true", help="Keep running and repack the atlas whenever the images change")
+    parser.add_argument("--stats", metavar="FILE", help="Write the timings and measurements of the run to a json file")
+    args = parser.parse_args()
+    gridLayout = {"auto": None, "always": True, "never": False}[args.grid]
+
+    # Print the progress, and collect the measurements if asked to.
+    statsObserver = StatsObserver()
+    observer = ObserverGroup([PrintObserver(), statsObserver]) if args.stats else PrintObserver()
+
+    if args.path is not None:
+        if os.path.isdir(args.path):
+            directoryPath = args.path
             
             imageFilenames = [os.path.join(directoryPath, x) for x in os.listdir(directoryPath) if os.path.splitext(x)[1].lower() in IMAGE_EXTENSIONS]
             
@@ -16,19 +53,29 @@ if __name__ == "__main__":
                 directoryName = os.path.basename(directoryPath)
                 parentPath = os.path.dirname(directoryPath)
                 outputImagePath = os.path.join(parentPath, directoryName + ".png")
-                outputManifestPath = os.path.join(parentPath, directoryName + ".xml")
-                packer = AtlasPacker()
-                packer.Pack(imageFilenames, (128, 128), (8192, 8192), "uv", outputImagePath, outputManifestPath)
+                if args.texture_format is not None:
+                    outputImagePath = os.path.join(parentPath, directoryName + (".ktx" if args.texture_format == "etc1" else ".dds"))
+                outputManifestPath = os.path.join(parentPath, directoryName + MANIFEST_EXTENSIONS[args.manifest_format])
+                if args.watch:
+                    watcher = AtlasWatcher(directoryPath, (128, 128), (8192, 8192), "uv", outputImagePath, outputManifestPath, workers=args.workers, allowNonPowerOfTwo=args.npot, sortMode=args.sort, packer=args.packer, allowRotation=args.rotate, deduplicate=args.dedup, multiPage=args.multipage, cacheDir=args.cache, stripHeight=args.strip_height, manifestFormat=args.manifest_format, observer=observer, encodeProfile=args.encode_profile, extrude=args.extrude, mipFilter=args.mipmaps, textureFormat=args.texture_format, blockAlign=args.block_align, polygonVertices=args.polygons, gridLayout=gridLayout, pixelFormat=args.pixel_format, dither=args.dither)
+                    watcher.Run()
+                else:
+                    packer = AtlasPacker()
+                    packer.Pack(imageFilenames, (128, 128), (8192, 8192), "uv", outputImagePath, outputManifestPath, workers=args.workers, allowNonPowerOfTwo=args.npot, sortMode=args.sort, packer=args.packer, allowRotation=args.rotate, deduplicate=args.dedup, multiPage=args.multipage, cacheDir=args.cache, stripHeight=args.strip_height, manifestFormat=args.manifest_format, observer=observer, encodeProfile=args.encode_profile, extrude=args.extrude, mipFilter=args.mipmaps, textureFormat=args.texture_format, blockAlign=args.block_align, polygonVertices=args.polygons, gridLayout=gridLayout, pixelFormat=args.pixel_format, dither=args.dither)
             else:
                 print "No images found in directory %s!" % directoryPath
         else:
-            if os.path.exists(sys.argv[1]) and os.path.splitext(sys.argv[1])[1] in IMAGE_EXTENSIONS:
-                imagePath = sys.argv[1]
+            if os.path.exists(args.path) and os.path.splitext(args.path)[1] in IMAGE_EXTENSIONS:
+                imagePath = args.path
                 print "Slicing image %s into 128x128 chunks!" % imagePath
 
                 packer = AtlasPacker()
-                packer.Slice(imagePath, (128, 128))
+                packer.Slice(imagePath, (128, 128), workers=args.workers, skipUniformTiles=args.skip_uniform_tiles, observer=observer, encodeProfile=args.encode_profile)
             else:
                 print "Invalid image path supplied!"
     else:
         print "No directory supplied!"
+
+    if args.stats:
+        statsObserver.Save(args.stats)
+        print "Wrote stats to %s" % args.stats
@@ -0,0 +1,147 @@
+"""This library is free software; you can redistribute it and/or
+modify it under the terms of the IBM Common Public License as
+published by the IBM Corporation; either version 1.0 of the
+License, or (at your option) any later version.
+
+This library is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+IBM Common Public License for more details.
+
+You should have received a copy of the IBM Common Public
+License along with this library
+"""
+from cygon import Point, RectanglePacker
+from maxrects import contactPointScore
+
+class GuillotineRectanglePacker(RectanglePacker):
+    """Packer using the guillotine algorithm
+
+    The packer keeps a list of disjoint free rectangles. Every new rectangle
+    is put into the corner of the free rectangle that scores best under the
+    chosen heuristic, and the rest of that free rectangle is cut in two along
+    the axis that leaves the shorter leftover side.
+
+    Supported heuristics:
+
+    bssf: Best short side fit, minimizes the shorter leftover side
+    baf: Best area fit, picks the smallest free rectangle that fits
+    bl: Bottom left, places rectangles as low and then as far left as possible
+    cp: Contact point, maximizes the perimeter touching other rectangles"""
+
+    HEURISTICS = ("bssf", "baf", "bl", "cp")
+
+    def __init__(self, packingAreaWidth, packingAreaHeight, heuristic="bssf"):
+        """Initializes a new rectangle packer
+
+        packingAreaWidth: Maximum width of the packing area
+        packingAreaHeight: Maximum height of the packing area
+        heuristic: Placement heuristic, one of HEURISTICS"""
+        RectanglePacker.__init__(self, packingAreaWidth, packingAreaHeight)
+        assert(heuristic in self.HEURISTICS)
+        self.heuristic = heuristic
+
+        # At the beginning, the whole packing area is free
+        self.freeRectangles = [(0, 0, packingAreaWidth, packingAreaHeight)]
+        self.usedRectangles = []
+
+    def TryPack(self, rectangleWidth, rectangleHeight):
+        """Tries to allocate space for a rectangle in the packing area
+
+        rectangleWidth: Width of the rectangle to allocate
+        rectangleHeight: Height of the rectangle to allocate
+
+        Returns a Point instance if space for the rectangle could be allocated
+        be found, otherwise returns None"""
+        freeIndex = self.findBestFreeRectangle(rectangleWidth, rectangleHeight)
+        if freeIndex is None:
+            return None
+
+        return self.placeRectangle(freeIndex, rectangleWidth, rectangleHeight)
+
+    def TryPackWithRotation(self, rectangleWidth, rectangleHeight):
+        """Tries to allocate space for a rectangle in the packing area in
+        whichever orientation scores best
+
+        rectangleWidth: Width of the rectangle to allocate
+        rectangleHeight: Height of the rectangle to allocate
+
+        Returns a tuple of the Point instance or None and whether the rectangle
+        was rotated"""
+        score, freeIndex = self.findBestScoredFreeRectangle(rectangleWidth, rectangleHeight)
+        rotatedScore, rotatedFreeIndex = self.findBestScoredFreeRectangle(rectangleHeight, rectangleWidth)
+
+        if rotatedFreeIndex is not None and (freeIndex is None or rotatedScore < score):
+            return (self.placeRectangle(rotatedFreeIndex, rectangleHeight, rectangleWidth), True)
+
+        if freeIndex is None:
+            return (None, False)
+
+        return (self.placeRectangle(freeIndex, rectangleWidth, rectangleHeight), False)
+
+    def placeRectangle(self, freeIndex, rectangleWidth, rectangleHeight):
+        """Places a rectangle into the corner of a free rectangle
+
+        Returns the Point instance the rectangle was placed at"""
+        x, y = self.freeRectangles[freeIndex][:2]
+        self.splitFreeRectangle(freeIndex, rectangleWidth, rectangleHeight)
+        self.usedRectangles.append((x, y, rectangleWidth, rectangleHeight))
+        return Point(x, y)
+
+    def scorePlacement(self, freeRectangle, rectangleWidth, rectangleHeight):
+        """Scores putting a rectangle into the corner of a free rectangle,
+        lower == better!"""
+        x, y, freeWidth, freeHeight = freeRectangle
+
+        if self.heuristic == "bssf":
+            leftoverWidth = freeWidth - rectangleWidth
+            leftoverHeight = freeHeight - rectangleHeight
+            return (min(leftoverWidth, leftoverHeight), max(leftoverWidth, leftoverHeight))
+        elif self.heuristic == "baf":
+            return (freeWidth * freeHeight, min(freeWidth - rectangleWidth, freeHeight - rectangleHeight))
+        elif self.heuristic == "bl":
+            return (y + rectangleHeight, x)
+        else:
+            return (-contactPointScore(x, y, rectangleWidth, rectangleHeight, self.usedRectangles, \
+            self.packingAreaWidth, self.packingAreaHeight), y, x)
+
+    def findBestFreeRectangle(self, rectangleWidth, rectangleHeight):
+        """Returns the index of the best free rectangle to place a rectangle
+        of the given dimensions in, or None if it doesn't fit anywhere"""
+        return self.findBestScoredFreeRectangle(rectangleWidth, rectangleHeight)[1]
+
+    def findBestScoredFreeRectangle(self, rectangleWidth, rectangleHeight):
+        """Returns a tuple of the score and index of the best free rectangle
+        to place a rectangle of the given dimensions in, the index is None if
+        it doesn't fit anywhere"""
+        bestScore = None
+        bestIndex = None
+
+        for index, freeRectangle in enumerate(self.freeRectangles):
+            if rectangleWidth <= freeRectangle[2] and rectangleHeight <= freeRectangle[3]:
+                score = self.scorePlacement(freeRectangle, rectangleWidth, rectangleHeight)
+                if bestScore is None or score < bestScore:
+                    bestScore = score
+                    bestIndex = index
+
+        return (bestScore, bestIndex)
+
+    def splitFreeRectangle(self, freeIndex, rectangleWidth, rectangleHeight):
+        """Cuts the space left over next to a placed rectangle into two new
+        free rectangles"""
+        x, y, freeWidth, freeHeight = self.freeRectangles.pop(freeIndex)
+        leftoverWidth = freeWidth - rectangleWidth
+        leftoverHeight = freeHeight - rectangleHeight
+
+        # Split along the shorter leftover axis so the larger leftover stays
+        # in one piece.
+        if leftoverWidth < leftoverHeight:
+            right = (x + rectangleWidth, y, leftoverWidth, rectangleHeight)
+            bottom = (x, y + rectangleHeight, freeWidth, leftoverHeight)
+        else:
+            right = (x + rectangleWidth, y, leftoverWidth, freeHeight)
+            bottom = (x, y + rectangleHeight, rectangleWidth, leftoverHeight)
+
+        for freeRectangle in [right, bottom]:
+            if freeRectangle[2] > 0 and freeRectangle[3] > 0:
+                self.freeRectangles.append(freeRectangle)
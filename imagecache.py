@@ -0,0 +1,156 @@
+"""
+pytex
+Copyright (C) 2015  Gregory Mitrano
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along
+with this program; if not, write to the Free Software Foundation, Inc.,
+51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+from PIL import Image
+from collections import OrderedDict
+import mmap
+import os
+import shutil
+import tempfile
+
+# Raw buffers handed over from worker processes live in shared memory when the platform has it.
+SHARED_MEMORY_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+class ImageCache(object):
+    """A bounded pool of decoded images that spills the oldest entries to disk once it is full"""
+
+    def __init__(self, maxBytes=256 * 1024 * 1024):
+        self.maxBytes = maxBytes
+        self._images = OrderedDict()
+        self._spilledImages = dict()
+        self._bytes = 0
+        self._spillDir = None
+        self._sharedDir = None
+        self._spillCount = 0
+        self._borrowedBuffers = set()
+        self._sharedBuffers = dict()
+        self._sharedBytes = 0
+
+    def _ImageBytes(self, image):
+        return image.size[0] * image.size[1] * len(image.getbands())
+
+    def _NewSpillPath(self, shared):
+        # Create the spill directories on first use.
+        if self._spillDir is None:
+            self._spillDir = tempfile.mkdtemp(prefix="pytex")
+        if shared and self._sharedDir is None:
+            self._sharedDir = tempfile.mkdtemp(prefix="pytex", dir=SHARED_MEMORY_DIR)
+
+        self._spillCount += 1
+        return os.path.join(self._sharedDir if shared else self._spillDir, "%d.raw" % self._spillCount)
+
+    def _Spill(self, key, image):
+        # Write the raw pixel data out so it can be restored without decoding.
+        spillPath = self._NewSpillPath(False)
+        with open(spillPath, "wb") as file:
+            file.write(image.tobytes())
+
+        self._spilledImages[key] = (spillPath, image.mode, image.size)
+
+    def Put(self, key, image):
+        self.Remove(key)
+
+        # Spill the oldest images until the new one fits into the budget, buffers in shared memory take up part of it.
+        imageBytes = self._ImageBytes(image)
+        while self._images and self._bytes + self._sharedBytes + imageBytes > self.maxBytes:
+            oldestKey, oldestImage = self._images.popitem(last=False)
+            self._bytes -= self._ImageBytes(oldestImage)
+            self._Spill(oldestKey, oldestImage)
+
+        if self._sharedBytes + imageBytes > self.maxBytes:
+            self._Spill(key, image)
+        else:
+            self._images[key] = image
+            self._bytes += imageBytes
+
+    def NewBufferPath(self, maxBytes=0, shared=True):
+        """Returns a path another process can write a raw image buffer of up to maxBytes to for use with PutBuffer
+
+        The buffer goes into shared memory while it fits into the budget along with the cached images,
+        after that and when shared is False it goes to the disk."""
+        shared = shared and SHARED_MEMORY_DIR is not None and self._bytes + self._sharedBytes + maxBytes <= self.maxBytes
+        bufferPath = self._NewSpillPath(shared)
+        if shared:
+            self._sharedBuffers[bufferPath] = maxBytes
+            self._sharedBytes += maxBytes
+        return bufferPath
+
+    def DiscardBuffer(self, bufferPath):
+        """Deletes a buffer from NewBufferPath that never made it into the cache"""
+        self._sharedBytes -= self._sharedBuffers.pop(bufferPath, 0)
+        if os.path.exists(bufferPath):
+            os.remove(bufferPath)
+
+    def PutBuffer(self, key, bufferPath, mode, size, owned=True):
+        """Adds a raw image buffer, which is deleted along with the entry when owned"""
+        self.Remove(key)
+        self._spilledImages[key] = (bufferPath, mode, size)
+        if not owned:
+            self._borrowedBuffers.add(bufferPath)
+
+        # Shared buffers only take up what was actually written to them.
+        if bufferPath in self._sharedBuffers:
+            bufferBytes = size[0] * size[1] * Image.getmodebands(mode)
+            self._sharedBytes += bufferBytes - self._sharedBuffers[bufferPath]
+            self._sharedBuffers[bufferPath] = bufferBytes
+
+    def Get(self, key):
+        if key in self._images:
+            return self._images[key]
+
+        if key in self._spilledImages:
+            spillPath, mode, size = self._spilledImages[key]
+            if size[0] == 0 or size[1] == 0:
+                return Image.new(mode, size)
+
+            # Map the raw pixel data instead of copying it.
+            with open(spillPath, "rb") as file:
+                buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            return Image.frombuffer(mode, size, buffer, "raw", mode, 0, 1)
+
+        return None
+
+    def Remove(self, key):
+        if key in self._images:
+            self._bytes -= self._ImageBytes(self._images.pop(key))
+
+        if key in self._spilledImages:
+            spillPath = self._spilledImages.pop(key)[0]
+            self._sharedBytes -= self._sharedBuffers.pop(spillPath, 0)
+            if spillPath in self._borrowedBuffers:
+                self._borrowedBuffers.remove(spillPath)
+            else:
+                os.remove(spillPath)
+
+    def Clear(self):
+        self._images.clear()
+        self._spilledImages.clear()
+        self._borrowedBuffers.clear()
+        self._sharedBuffers.clear()
+        self._bytes = 0
+        self._sharedBytes = 0
+
+        for spillDir in [self._spillDir, self._sharedDir]:
+            if spillDir is not None:
+                shutil.rmtree(spillDir, ignore_errors=True)
+        self._spillDir = None
+        self._sharedDir = None
+
+    def __contains__(self, key):
+        return key in self._images or key in self._spilledImages
@@ -0,0 +1,288 @@
+"""
+pytex
+Copyright (C) 2015  Gregory Mitrano
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along
+with this program; if not, write to the Free Software Foundation, Inc.,
+51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+from xml.sax.saxutils import escape
+import json
+import struct
+
+# Names of the four coordinates of every image for each manifest mode.
+COORDINATE_NAMES = {"uv": ("u1", "v1", "u2", "v2"), "pixel": ("x1", "y1", "x2", "y2")}
+
+# Layout of the binary manifest. All values are little endian.
+#
+# Header: magic, version, flags, atlas width and height, page count, image
+#         count, string pool offset and string pool size. Bits 8 to 11 of the
+#         flags hold the pixel format of the atlas, as an index into
+#         BINARY_PIXEL_FORMATS
+# Grid: cell width and height, padding, columns and images per page, only
+#       present if the images were placed in a grid. Version 2 files never
+#       have one
+# Pages: name offset and length in the string pool, width and height
+# Images: name offset and length in the string pool, page, flags and the four
+#         coordinates, floats in uv mode and signed integers in pixel mode,
+#         followed by the index of the first vertex and the vertex count if
+#         the atlas has polygons
+# Vertices: pixel and uv coordinates of the polygon vertices as floats, only
+#           present if the atlas has polygons
+#
+# The image records are sorted by name, so a runtime can map the file and
+# binary search it without parsing anything.
+BINARY_MAGIC = "PTEX"
+BINARY_VERSION = 3
+BINARY_HEADER = struct.Struct("<4sHHIIIIII")
+BINARY_PAGE = struct.Struct("<IIII")
+BINARY_IMAGE = {"uv": struct.Struct("<IIHH4f"), "pixel": struct.Struct("<IIHH4i")}
+BINARY_POLYGON_IMAGE = {"uv": struct.Struct("<IIHH4fII"), "pixel": struct.Struct("<IIHH4iII")}
+BINARY_VERTEX = struct.Struct("<4f")
+BINARY_GRID = struct.Struct("<IIIII")
+BINARY_FLAG_PIXEL = 0x1
+BINARY_FLAG_POLYGONS = 0x2
+BINARY_FLAG_GRID = 0x4
+BINARY_PIXEL_FORMAT_SHIFT = 8
+BINARY_PIXEL_FORMAT_MASK = 0xF00
+BINARY_PIXEL_FORMATS = [None, "rgba8888", "rgb888", "la88", "l8", "p8", "rgba4444", "rgb565"]
+BINARY_IMAGE_FLAG_ROTATED = 0x1
+
+class ManifestImage(object):
+    """Data structure for an image entry in the manifest"""
+
+    def __init__(self, name, rotated, page, coordinates, vertices=None, uvVertices=None):
+        self.name = name
+        self.rotated = rotated
+        self.page = page
+        self.coordinates = coordinates
+        self.vertices = vertices
+        self.uvVertices = uvVertices
+
+class ManifestGrid(object):
+    """Data structure for the cells of an atlas whose images were placed in a grid
+
+    The images fill the cells row by row in the order of their names, so
+    image i is on page i / imagesPerPage, in cell c = i % imagesPerPage at
+    column c % columns and row c / columns. Its pixels start padding pixels
+    into the cell."""
+
+    def __init__(self, cellSize, padding, columns, imagesPerPage):
+        self.cellSize = cellSize
+        self.padding = padding
+        self.columns = columns
+        self.imagesPerPage = imagesPerPage
+
+class ManifestTile(object):
+    """Data structure for a tile entry in the tile index"""
+
+    def __init__(self, position, filename, color=None):
+        self.position = position
+        self.filename = filename
+        self.color = color
+
+def _WriteXmlElement(file, depth, tag, attributes, closed=True):
+    # Attributes are sorted so the output doesn't depend on dictionary ordering.
+    file.write("\t" * depth + "<" + tag)
+    for name in sorted(attributes.keys()):
+        file.write(" %s=\"%s\"" % (name, escape(str(attributes[name]), {"\"": "&quot;"})))
+    file.write("/>\n" if closed else ">\n")
+
+def _FormatVertices(vertices):
+    return " ".join("%s,%s" % vertex for vertex in vertices)
+
+def WriteXmlManifest(file, mode, size, pages, images, grid=None, pixelFormat=None):
+    """Writes the manifest as xml one element at a time
+
+    pages is a list of (filename, size) tuples, or None for single page atlases.
+    grid is a ManifestGrid if the images were placed in a grid.
+    pixelFormat names the pixel format the atlas was written in, if one was chosen."""
+    file.write("<?xml version=\"1.0\" ?>\n")
+
+    atlasAttributes = {"width": size[0], "height": size[1]}
+    if pixelFormat is not None:
+        atlasAttributes["format"] = pixelFormat
+    if not pages and not images and grid is None:
+        _WriteXmlElement(file, 0, "atlas", atlasAttributes)
+        return
+    _WriteXmlElement(file, 0, "atlas", atlasAttributes, False)
+
+    if pages:
+        for pageIndex, (pageFilename, pageSize) in enumerate(pages):
+            _WriteXmlElement(file, 1, "page", {"index": pageIndex, "file": pageFilename, "width": pageSize[0], "height": pageSize[1]})
+
+    if grid is not None:
+        _WriteXmlElement(file, 1, "grid", {"cellWidth": grid.cellSize[0], "cellHeight": grid.cellSize[1], "padding": grid.padding, "columns": grid.columns, "imagesPerPage": grid.imagesPerPage})
+
+    for image in images:
+        imageAttributes = {"name": image.name, "rotated": "true" if image.rotated else "false"}
+        if pages:
+            imageAttributes["page"] = image.page
+        imageAttributes.update(zip(COORDINATE_NAMES[mode], image.coordinates))
+        if image.vertices is not None:
+            imageAttributes["vertices"] = _FormatVertices(image.vertices)
+            imageAttributes["uvs"] = _FormatVertices(image.uvVertices)
+        _WriteXmlElement(file, 1, "image", imageAttributes)
+
+    file.write("</atlas>\n")
+
+def WriteTileIndex(file, size, tileSize, tiles):
+    """Writes the index of a sliced image as xml one tile at a time
+
+    Tiles without a filename weren't written because they only contain a
+    single color, which is recorded instead."""
+    file.write("<?xml version=\"1.0\" ?>\n")
+    _WriteXmlElement(file, 0, "tiles", {"width": size[0], "height": size[1], "tileWidth": tileSize[0], "tileHeight": tileSize[1]}, not tiles)
+
+    for tile in tiles:
+        tileAttributes = {"x": tile.position[0], "y": tile.position[1]}
+        if tile.filename is not None:
+            tileAttributes["file"] = tile.filename
+        else:
+            tileAttributes["color"] = ",".join(str(value) for value in tile.color)
+        _WriteXmlElement(file, 1, "tile", tileAttributes)
+
+    if tiles:
+        file.write("</tiles>\n")
+
+def WriteJsonManifest(file, mode, size, pages, images, grid=None, pixelFormat=None):
+    """Writes the manifest as json one image at a time
+
+    pages is a list of (filename, size) tuples, or None for single page atlases.
+    grid is a ManifestGrid if the images were placed in a grid.
+    pixelFormat names the pixel format the atlas was written in, if one was chosen."""
+    file.write("{\"width\": %d, \"height\": %d, \"mode\": %s" % (size[0], size[1], json.dumps(mode)))
+
+    if pixelFormat is not None:
+        file.write(", \"format\": %s" % json.dumps(pixelFormat))
+
+    if pages:
+        pageList = [{"file": pageFilename, "width": pageSize[0], "height": pageSize[1]} for pageFilename, pageSize in pages]
+        file.write(", \"pages\": %s" % json.dumps(pageList))
+
+    if grid is not None:
+        gridDict = {"cellWidth": grid.cellSize[0], "cellHeight": grid.cellSize[1], "padding": grid.padding, "columns": grid.columns, "imagesPerPage": grid.imagesPerPage}
+        file.write(", \"grid\": %s" % json.dumps(gridDict, sort_keys=True))
+
+    file.write(", \"images\": [")
+    for imageIndex, image in enumerate(images):
+        imageDict = {"name": image.name, "rotated": image.rotated}
+        if pages:
+            imageDict["page"] = image.page
+        imageDict.update(zip(COORDINATE_NAMES[mode], image.coordinates))
+        if image.vertices is not None:
+            imageDict["vertices"] = image.vertices
+            imageDict["uvs"] = image.uvVertices
+        file.write(("\n" if imageIndex == 0 else ",\n") + json.dumps(imageDict, sort_keys=True))
+    file.write("\n]}\n")
+
+def WriteBinaryManifest(file, mode, size, pages, images, grid=None, pixelFormat=None):
+    """Writes the manifest as a table of fixed size records sorted by name
+
+    pages is a list of (filename, size) tuples, or None for single page atlases.
+    grid is a ManifestGrid if the images were placed in a grid.
+    pixelFormat names the pixel format the atlas was written in, if one was chosen."""
+    pages = pages or []
+    images = sorted(images, key=lambda image: image.name)
+    hasPolygons = any(image.vertices is not None for image in images)
+    imageStruct = BINARY_POLYGON_IMAGE[mode] if hasPolygons else BINARY_IMAGE[mode]
+    vertexCount = sum(len(image.vertices) for image in images if image.vertices is not None)
+
+    # Collect the names into the string pool.
+    stringPool = []
+    stringPoolSize = 0
+    nameRanges = []
+    for name in [pageFilename for pageFilename, pageSize in pages] + [image.name for image in images]:
+        encodedName = name.encode("utf-8") if isinstance(name, unicode) else name
+        nameRanges.append((stringPoolSize, len(encodedName)))
+        stringPool.append(encodedName)
+        stringPoolSize += len(encodedName)
+
+    gridSize = BINARY_GRID.size if grid is not None else 0
+    stringPoolOffset = BINARY_HEADER.size + gridSize + len(pages) * BINARY_PAGE.size + len(images) * imageStruct.size + vertexCount * BINARY_VERTEX.size
+    flags = BINARY_FLAG_PIXEL if mode == "pixel" else 0
+    if hasPolygons:
+        flags |= BINARY_FLAG_POLYGONS
+    if grid is not None:
+        flags |= BINARY_FLAG_GRID
+    flags |= BINARY_PIXEL_FORMATS.index(pixelFormat) << BINARY_PIXEL_FORMAT_SHIFT
+    file.write(BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, flags, size[0], size[1], len(pages), len(images), stringPoolOffset, stringPoolSize))
+    if grid is not None:
+        file.write(BINARY_GRID.pack(grid.cellSize[0], grid.cellSize[1], grid.padding, grid.columns, grid.imagesPerPage))
+
+    for (pageFilename, pageSize), nameRange in zip(pages, nameRanges):
+        file.write(BINARY_PAGE.pack(nameRange[0], nameRange[1], pageSize[0], pageSize[1]))
+
+    vertexIndex = 0
+    for image, nameRange in zip(images, nameRanges[len(pages):]):
+        imageFlags = BINARY_IMAGE_FLAG_ROTATED if image.rotated else 0
+        record = [nameRange[0], nameRange[1], image.page, imageFlags] + list(image.coordinates)
+        if hasPolygons:
+            imageVertexCount = len(image.vertices) if image.vertices is not None else 0
+            record += [vertexIndex, imageVertexCount]
+            vertexIndex += imageVertexCount
+        file.write(imageStruct.pack(*record))
+
+    for image in images:
+        if image.vertices is not None:
+            for vertex, uvVertex in zip(image.vertices, image.uvVertices):
+                file.write(BINARY_VERTEX.pack(vertex[0], vertex[1], uvVertex[0], uvVertex[1]))
+
+    file.write("".join(stringPool))
+
+def ReadBinaryManifest(data):
+    """Reads a binary manifest back into a tuple of the mode, atlas size, pages, images, grid and pixel format"""
+    magic, version, flags, width, height, pageCount, imageCount, stringPoolOffset, stringPoolSize = BINARY_HEADER.unpack_from(data, 0)
+    assert(magic == BINARY_MAGIC and version <= BINARY_VERSION)
+    mode = "pixel" if flags & BINARY_FLAG_PIXEL else "uv"
+    hasPolygons = bool(flags & BINARY_FLAG_POLYGONS)
+    imageStruct = BINARY_POLYGON_IMAGE[mode] if hasPolygons else BINARY_IMAGE[mode]
+    pixelFormat = BINARY_PIXEL_FORMATS[(flags & BINARY_PIXEL_FORMAT_MASK) >> BINARY_PIXEL_FORMAT_SHIFT]
+
+    def ReadName(nameOffset, nameLength):
+        return data[stringPoolOffset + nameOffset:stringPoolOffset + nameOffset + nameLength]
+
+    offset = BINARY_HEADER.size
+    grid = None
+    if version >= 3 and flags & BINARY_FLAG_GRID:
+        cellWidth, cellHeight, padding, columns, imagesPerPage = BINARY_GRID.unpack_from(data, offset)
+        grid = ManifestGrid((cellWidth, cellHeight), padding, columns, imagesPerPage)
+        offset += BINARY_GRID.size
+
+    pages = []
+    for pageIndex in xrange(pageCount):
+        nameOffset, nameLength, pageWidth, pageHeight = BINARY_PAGE.unpack_from(data, offset)
+        pages.append((ReadName(nameOffset, nameLength), (pageWidth, pageHeight)))
+        offset += BINARY_PAGE.size
+
+    images = []
+    vertexRanges = []
+    for imageIndex in xrange(imageCount):
+        record = imageStruct.unpack_from(data, offset)
+        images.append(ManifestImage(ReadName(record[0], record[1]), bool(record[3] & BINARY_IMAGE_FLAG_ROTATED), record[2], record[4:8]))
+        vertexRanges.append(record[8:])
+        offset += imageStruct.size
+
+    # The vertex table follows the image records.
+    if hasPolygons:
+        for image, (vertexIndex, vertexCount) in zip(images, vertexRanges):
+            if vertexCount == 0:
+                continue
+            vertexRecords = [BINARY_VERTEX.unpack_from(data, offset + (vertexIndex + i) * BINARY_VERTEX.size) for i in xrange(vertexCount)]
+            image.vertices = [vertexRecord[0:2] for vertexRecord in vertexRecords]
+            image.uvVertices = [vertexRecord[2:4] for vertexRecord in vertexRecords]
+
+    return (mode, (width, height), pages, images, grid, pixelFormat)
+
+MANIFEST_WRITERS = {"xml": WriteXmlManifest, "json": WriteJsonManifest, "binary": WriteBinaryManifest}
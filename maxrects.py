@@ -0,0 +1,192 @@
+"""This library is free software; you can redistribute it and/or
+modify it under the terms of the IBM Common Public License as
+published by the IBM Corporation; either version 1.0 of the
+License, or (at your option) any later version.
+
+This library is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+IBM Common Public License for more details.
+
+You should have received a copy of the IBM Common Public
+License along with this library
+"""
+from cygon import Point, RectanglePacker
+
+def commonIntervalLength(start1, end1, start2, end2):
+    """Returns the length of the overlap of two intervals, or 0 if they don't touch"""
+    if end1 < start2 or end2 < start1:
+        return 0
+    return min(end1, end2) - max(start1, start2)
+
+def contactPointScore(x, y, width, height, usedRectangles, packingAreaWidth, packingAreaHeight):
+    """Returns how much of a rectangle's perimeter touches the packing area
+    edges or previously placed rectangles"""
+    score = 0
+
+    if x == 0 or x + width == packingAreaWidth:
+        score += height
+    if y == 0 or y + height == packingAreaHeight:
+        score += width
+
+    for usedX, usedY, usedWidth, usedHeight in usedRectangles:
+        if usedX == x + width or usedX + usedWidth == x:
+            score += commonIntervalLength(usedY, usedY + usedHeight, y, y + height)
+        if usedY == y + height or usedY + usedHeight == y:
+            score += commonIntervalLength(usedX, usedX + usedWidth, x, x + width)
+
+    return score
+
+class MaxRectsRectanglePacker(RectanglePacker):
+    """Packer using the maximal rectangles algorithm
+
+    The packer keeps a list of the largest free rectangles left in the packing
+    area. These may overlap each other. Every new rectangle is put into the
+    corner of the free rectangle that scores best under the chosen heuristic,
+    after which all free rectangles intersecting it are split up and the ones
+    contained within other free rectangles are discarded.
+
+    Supported heuristics:
+
+    bssf: Best short side fit, minimizes the shorter leftover side
+    bl: Bottom left, places rectangles as low and then as far left as possible
+    cp: Contact point, maximizes the perimeter touching other rectangles"""
+
+    HEURISTICS = ("bssf", "bl", "cp")
+
+    def __init__(self, packingAreaWidth, packingAreaHeight, heuristic="bssf"):
+        """Initializes a new rectangle packer
+
+        packingAreaWidth: Maximum width of the packing area
+        packingAreaHeight: Maximum height of the packing area
+        heuristic: Placement heuristic, one of HEURISTICS"""
+        RectanglePacker.__init__(self, packingAreaWidth, packingAreaHeight)
+        assert(heuristic in self.HEURISTICS)
+        self.heuristic = heuristic
+
+        # At the beginning, the whole packing area is free
+        self.freeRectangles = [(0, 0, packingAreaWidth, packingAreaHeight)]
+        self.usedRectangles = []
+
+    def TryPack(self, rectangleWidth, rectangleHeight):
+        """Tries to allocate space for a rectangle in the packing area
+
+        rectangleWidth: Width of the rectangle to allocate
+        rectangleHeight: Height of the rectangle to allocate
+
+        Returns a Point instance if space for the rectangle could be allocated
+        be found, otherwise returns None"""
+        placement = self.findBestPlacement(rectangleWidth, rectangleHeight)
+        if placement is None:
+            return None
+
+        self.placeRectangle((placement.x, placement.y, rectangleWidth, rectangleHeight))
+        return placement
+
+    def TryPackWithRotation(self, rectangleWidth, rectangleHeight):
+        """Tries to allocate space for a rectangle in the packing area in
+        whichever orientation scores best
+
+        rectangleWidth: Width of the rectangle to allocate
+        rectangleHeight: Height of the rectangle to allocate
+
+        Returns a tuple of the Point instance or None and whether the rectangle
+        was rotated"""
+        score, placement = self.findBestScoredPlacement(rectangleWidth, rectangleHeight)
+        rotatedScore, rotatedPlacement = self.findBestScoredPlacement(rectangleHeight, rectangleWidth)
+
+        if rotatedPlacement is not None and (placement is None or rotatedScore < score):
+            self.placeRectangle((rotatedPlacement.x, rotatedPlacement.y, rectangleHeight, rectangleWidth))
+            return (rotatedPlacement, True)
+
+        if placement is not None:
+            self.placeRectangle((placement.x, placement.y, rectangleWidth, rectangleHeight))
+
+        return (placement, False)
+
+    def scorePlacement(self, freeRectangle, rectangleWidth, rectangleHeight):
+        """Scores putting a rectangle into the corner of a free rectangle,
+        lower == better!"""
+        x, y, freeWidth, freeHeight = freeRectangle
+
+        if self.heuristic == "bssf":
+            leftoverWidth = freeWidth - rectangleWidth
+            leftoverHeight = freeHeight - rectangleHeight
+            return (min(leftoverWidth, leftoverHeight), max(leftoverWidth, leftoverHeight))
+        elif self.heuristic == "bl":
+            return (y + rectangleHeight, x)
+        else:
+            return (-contactPointScore(x, y, rectangleWidth, rectangleHeight, self.usedRectangles, \
+            self.packingAreaWidth, self.packingAreaHeight), y, x)
+
+    def findBestPlacement(self, rectangleWidth, rectangleHeight):
+        """Finds the best position for a rectangle of the given dimensions
+
+        Returns a Point instance if a valid placement for the rectangle could
+        be found, otherwise returns None"""
+        return self.findBestScoredPlacement(rectangleWidth, rectangleHeight)[1]
+
+    def findBestScoredPlacement(self, rectangleWidth, rectangleHeight):
+        """Finds the best position for a rectangle of the given dimensions
+
+        Returns a tuple of the score and the Point instance, or None if no
+        valid placement for the rectangle could be found"""
+        bestScore = None
+        bestPlacement = None
+
+        for freeRectangle in self.freeRectangles:
+            if rectangleWidth <= freeRectangle[2] and rectangleHeight <= freeRectangle[3]:
+                score = self.scorePlacement(freeRectangle, rectangleWidth, rectangleHeight)
+                if bestScore is None or score < bestScore:
+                    bestScore = score
+                    bestPlacement = Point(freeRectangle[0], freeRectangle[1])
+
+        return (bestScore, bestPlacement)
+
+    def placeRectangle(self, placedRectangle):
+        """Removes a placed rectangle from the free rectangles"""
+        placedX, placedY, placedWidth, placedHeight = placedRectangle
+        placedRight = placedX + placedWidth
+        placedBottom = placedY + placedHeight
+
+        # Split every free rectangle intersecting the placed one into the
+        # maximal rectangles around it.
+        freeRectangles = []
+        for freeRectangle in self.freeRectangles:
+            x, y, width, height = freeRectangle
+            right = x + width
+            bottom = y + height
+
+            if placedX >= right or placedRight <= x or placedY >= bottom or placedBottom <= y:
+                freeRectangles.append(freeRectangle)
+                continue
+
+            if placedX > x:
+                freeRectangles.append((x, y, placedX - x, height))
+            if placedRight < right:
+                freeRectangles.append((placedRight, y, right - placedRight, height))
+            if placedY > y:
+                freeRectangles.append((x, y, width, placedY - y))
+            if placedBottom < bottom:
+                freeRectangles.append((x, placedBottom, width, bottom - placedBottom))
+
+        self.freeRectangles = self.pruneFreeRectangles(freeRectangles)
+        self.usedRectangles.append(placedRectangle)
+
+    def pruneFreeRectangles(self, freeRectangles):
+        """Removes free rectangles that are contained within other free rectangles"""
+        # Larger rectangles can't be contained in smaller ones, so only check
+        # against the rectangles we already kept.
+        freeRectangles = sorted(set(freeRectangles), key=lambda rectangle: (-rectangle[2] * rectangle[3], rectangle[1], rectangle[0], rectangle[2]))
+        prunedRectangles = []
+        for x, y, width, height in freeRectangles:
+            contained = False
+            for keptX, keptY, keptWidth, keptHeight in prunedRectangles:
+                if x >= keptX and y >= keptY and x + width <= keptX + keptWidth and y + height <= keptY + keptHeight:
+                    contained = True
+                    break
+
+            if not contained:
+                prunedRectangles.append((x, y, width, height))
+
+        return prunedRectangles
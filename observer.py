@@ -0,0 +1,120 @@
+"""
+pytex
+Copyright (C) 2015  Gregory Mitrano
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along
+with this program; if not, write to the Free Software Foundation, Inc.,
+51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+import json
+
+class PackObserver(object):
+    """Receives the progress and measurements of AtlasPacker, ignores all of them
+
+    Override the methods you're interested in."""
+
+    def Message(self, text):
+        """A human readable progress message"""
+        pass
+
+    def StageStarted(self, name):
+        pass
+
+    def StageFinished(self, name, seconds):
+        pass
+
+    def ImageCropped(self, path, decodeSeconds, trimSeconds):
+        pass
+
+    def SizeAttempted(self, size, placedCount, imageCount, success):
+        """An attempt to pack images into an atlas of the given size, placedCount
+        is the number of images placed before the packer succeeded or gave up"""
+        pass
+
+    def PagePacked(self, pageIndex, size, occupancy):
+        pass
+
+    def FileWritten(self, path, byteCount):
+        pass
+
+    def ImageEncoded(self, path, encodeProfile, seconds, byteCount):
+        pass
+
+class PrintObserver(PackObserver):
+    """Prints the progress messages"""
+
+    def Message(self, text):
+        print text
+
+class StatsObserver(PackObserver):
+    """Collects the measurements so they can be saved as json"""
+
+    def __init__(self):
+        self.stages = dict()
+        self.images = dict()
+        self.sizeAttempts = []
+        self.pages = []
+        self.files = dict()
+        self.encodes = dict()
+
+    def StageFinished(self, name, seconds):
+        # Stages can run more than once, e.g. when slicing several images.
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def ImageCropped(self, path, decodeSeconds, trimSeconds):
+        self.images[path] = {"decodeSeconds": decodeSeconds, "trimSeconds": trimSeconds}
+
+    def SizeAttempted(self, size, placedCount, imageCount, success):
+        self.sizeAttempts.append({"width": size[0], "height": size[1], "placedCount": placedCount, "imageCount": imageCount, "success": success})
+
+    def PagePacked(self, pageIndex, size, occupancy):
+        self.pages.append({"index": pageIndex, "width": size[0], "height": size[1], "occupancy": occupancy})
+
+    def FileWritten(self, path, byteCount):
+        self.files[path] = byteCount
+
+    def ImageEncoded(self, path, encodeProfile, seconds, byteCount):
+        self.encodes[path] = {"encodeProfile": encodeProfile, "seconds": seconds, "byteCount": byteCount}
+
+    def GetStats(self):
+        return {
+            "stages": self.stages,
+            "images": self.images,
+            "decodeSeconds": sum(image["decodeSeconds"] for image in self.images.values()),
+            "trimSeconds": sum(image["trimSeconds"] for image in self.images.values()),
+            "sizeAttempts": self.sizeAttempts,
+            "placementCount": sum(sizeAttempt["placedCount"] for sizeAttempt in self.sizeAttempts),
+            "pages": self.pages,
+            "files": self.files,
+            "bytesWritten": sum(self.files.values()),
+            "encodes": self.encodes,
+            "encodeSeconds": sum(encode["seconds"] for encode in self.encodes.values()),
+            "encodedBytes": sum(encode["byteCount"] for encode in self.encodes.values()),
+        }
+
+    def Save(self, path):
+        with open(path, "wb") as file:
+            json.dump(self.GetStats(), file, indent=2, sort_keys=True)
+
+class ObserverGroup(object):
+    """Hands everything to several observers"""
+
+    def __init__(self, observers):
+        self._observers = observers
+
+    def __getattr__(self, name):
+        def Forward(*args):
+            for observer in self._observers:
+                getattr(observer, name)(*args)
+        return Forward
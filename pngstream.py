@@ -0,0 +1,127 @@
+"""
+pytex
+Copyright (C) 2015  Gregory Mitrano
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along
+with this program; if not, write to the Free Software Foundation, Inc.,
+51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+import struct
+import zlib
+
+# Rows are only filtered when numpy is around, filtering them in Python would be far too slow.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+PNG_SIGNATURE = "\x89PNG\r\n\x1a\n"
+
+# PNG color types and bytes per pixel for the supported image modes.
+PNG_COLOR_TYPES = {"L": (0, 1), "RGB": (2, 3), "P": (3, 1), "LA": (4, 2), "RGBA": (6, 4)}
+
+# PNG row filter types.
+PNG_FILTER_NONE = 0
+PNG_FILTER_SUB = 1
+PNG_FILTER_UP = 2
+PNG_FILTER_PAETH = 4
+
+class PngStreamWriter(object):
+    """Writes a PNG image a few rows at a time, so the whole image never has to be in memory
+
+    Every row is filtered with whichever of the None, Sub, Up and Paeth
+    filters leaves the smallest sum of absolute differences, like libpng
+    does. The last row is kept between calls, so rows are filtered against
+    the ones before them no matter how the image is split up. Without numpy
+    the rows aren't filtered. Palette images take their palette as a list
+    of up to 256 RGBA colors, and are never filtered since their values
+    are indices."""
+
+    def __init__(self, file, size, mode="RGBA", compressionLevel=6, strategy=zlib.Z_DEFAULT_STRATEGY, palette=None):
+        assert(mode in PNG_COLOR_TYPES)
+        assert((mode == "P") == (palette is not None))
+        self._file = file
+        self._size = size
+        self._rowBytes = size[0] * PNG_COLOR_TYPES[mode][1]
+        self._pixelBytes = PNG_COLOR_TYPES[mode][1]
+        self._rowsWritten = 0
+
+        # The row above the first one is taken to be zero.
+        self._filterRows = numpy is not None and mode != "P"
+        self._previousRow = numpy.zeros(self._rowBytes, numpy.uint8) if self._filterRows else None
+        self._compressor = zlib.compressobj(compressionLevel, zlib.DEFLATED, zlib.MAX_WBITS, 8, strategy)
+
+        # Write the signature and header.
+        self._file.write(PNG_SIGNATURE)
+        self._WriteChunk("IHDR", struct.pack(">IIBBBBB", size[0], size[1], 8, PNG_COLOR_TYPES[mode][0], 0, 0, 0))
+
+        # The alpha of the palette entries goes into its own chunk, which is only needed if any of them is transparent.
+        if palette is not None:
+            assert(0 < len(palette) <= 256)
+            self._WriteChunk("PLTE", "".join(struct.pack("BBB", *color[:3]) for color in palette))
+            if any(color[3] != 255 for color in palette):
+                self._WriteChunk("tRNS", "".join(chr(color[3]) for color in palette))
+
+    def _WriteChunk(self, chunkType, data):
+        self._file.write(struct.pack(">I", len(data)))
+        self._file.write(chunkType)
+        self._file.write(data)
+        self._file.write(struct.pack(">I", zlib.crc32(chunkType + data) & 0xffffffff))
+
+    def WriteRows(self, data):
+        """Writes the raw pixel data of one or more complete rows"""
+        assert(len(data) % self._rowBytes == 0)
+        rowCount = len(data) / self._rowBytes
+        assert(self._rowsWritten + rowCount <= self._size[1])
+
+        # Every row starts with its filter type.
+        if self._filterRows and rowCount > 0:
+            filteredData = self._FilterRows(data, rowCount)
+        else:
+            filteredData = "".join(chr(PNG_FILTER_NONE) + data[offset:offset + self._rowBytes] for offset in xrange(0, len(data), self._rowBytes))
+        self._rowsWritten += rowCount
+
+        compressedData = self._compressor.compress(filteredData)
+        if compressedData:
+            self._WriteChunk("IDAT", compressedData)
+
+    def _FilterRows(self, data, rowCount):
+        rows = numpy.frombuffer(data, numpy.uint8).reshape(rowCount, self._rowBytes)
+        previousRows = numpy.vstack((self._previousRow[None, :], rows[:-1]))
+        self._previousRow = rows[-1].copy()
+
+        # The bytes of the pixels to the left, and above left, are zero at the start of a row.
+        left = numpy.zeros_like(rows)
+        left[:, self._pixelBytes:] = rows[:, :-self._pixelBytes]
+        upLeft = numpy.zeros_like(rows)
+        upLeft[:, self._pixelBytes:] = previousRows[:, :-self._pixelBytes]
+
+        # Paeth predicts from whichever neighbour is closest to left + up - upLeft.
+        leftDistance = numpy.abs(previousRows.astype(numpy.int16) - upLeft)
+        upDistance = numpy.abs(left.astype(numpy.int16) - upLeft)
+        upLeftDistance = numpy.abs(left.astype(numpy.int16) + previousRows - 2 * upLeft.astype(numpy.int16))
+        paeth = numpy.where((leftDistance <= upDistance) & (leftDistance <= upLeftDistance), left, numpy.where(upDistance <= upLeftDistance, previousRows, upLeft))
+
+        # Keep the filter with the smallest sum of the bytes taken as signed differences for every row.
+        filterTypes = numpy.array([PNG_FILTER_NONE, PNG_FILTER_SUB, PNG_FILTER_UP, PNG_FILTER_PAETH], numpy.uint8)
+        candidates = numpy.array([rows, rows - left, rows - previousRows, rows - paeth])
+        costs = numpy.abs(candidates.view(numpy.int8).astype(numpy.int32)).sum(axis=2)
+        choices = costs.argmin(axis=0)
+        filteredRows = candidates[choices, numpy.arange(rowCount)]
+        return numpy.hstack((filterTypes[choices][:, None], filteredRows)).tobytes()
+
+    def Close(self):
+        assert(self._rowsWritten == self._size[1])
+        self._WriteChunk("IDAT", self._compressor.flush())
+        self._WriteChunk("IEND", "")
@@ -17,11 +17,34 @@ with this program; if not, write to the Free Software Foundation, Inc.,
 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 """
 
-from PIL import Image, ImageOps
-from cygon import CygonRectanglePacker
-from xml.etree.cElementTree import Element, ElementTree, SubElement, tostring
-import xml.dom.minidom
+from PIL import Image, ImageChops, ImageOps
+from guillotine import GuillotineRectanglePacker
+from maxrects import MaxRectsRectanglePacker
+from skyline import SkylineRectanglePacker
+from imagecache import ImageCache
+from observer import PackObserver, StatsObserver
+from manifest import ManifestGrid, ManifestImage, ManifestTile, MANIFEST_WRITERS, WriteTileIndex
+from pngstream import PngStreamWriter
+from spritecache import SpriteCache
+from workerpool import WorkerPool
+import contextlib
+import hashlib
+import io
+import multiprocessing.pool
 import os
+import time
+import zlib
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Block compression is written with numpy, so it's only around when numpy is.
+try:
+    import texcompress
+except ImportError:
+    texcompress = None
 
 class ImageInfo(object):
     """A small data structure for holding information about images"""
@@ -31,132 +54,481 @@ class ImageInfo(object):
         self.path = ""
         self.containsAlpha = False
         self.boundingBox = [0, 0, 0, 0]
+        self.contentHash = None
+        self.aliasOf = None
+        self.polygon = None
 
 class PackedImageInfo(object):
     """A small data structure for holding information about packed images"""
     
-    def __init__(self, packPosition, packedBoundingBox):
+    def __init__(self, packPosition, packedBoundingBox, imagePosition, rotated=False):
         self.packPosition = packPosition
         self.packedBoundingBox = packedBoundingBox
+        self.imagePosition = imagePosition
+        self.rotated = rotated
+        self.page = 0
+
+class PackResult(object):
+    """A small data structure for holding the outcome of packing an atlas"""
+
+    def __init__(self):
+        self.success = False
+        self.imageCount = 0
+        self.duplicateCount = 0
+        self.pages = []
+        self.manifestPath = None
+        self.bytesWritten = 0
+        self.pixelFormat = None
+
+        # The page images and manifest of atlases packed in memory.
+        self.images = []
+        self.manifestData = None
+
+# zlib's run length encoding strategy, which the zlib module doesn't name.
+Z_RLE = 3
+
+# PIL save options for the supported encode profiles. Balanced matches PIL's defaults.
+ENCODE_PROFILES = {
+    "fast": {"compress_level": 1, "compress_type": Z_RLE},
+    "balanced": {"compress_level": 6},
+    "smallest": {"compress_level": 9, "optimize": True},
+}
+
+# Resampling filters for building mip levels.
+MIP_FILTERS = {"box": Image.BOX, "lanczos": Image.LANCZOS}
+
+# How many source pixels each filter reaches to either side of a halved pixel, in source pixels per output pixel.
+MIP_FILTER_SUPPORT = {"box": 0.5, "lanczos": 3.0}
+
+# Non power of two atlas dimensions are kept to multiples of this.
+NON_POWER_OF_TWO_STEP = 4
+
+# Block aligned images are padded out to multiples of the compression block size.
+BLOCK_ALIGNMENT = 4
+
+# Rows of pixels each thread compresses at a time, a multiple of the block size.
+COMPRESSION_BAND_HEIGHT = 256
+
+# Trimming polygons covering more of their rectangle than this aren't worth the extra vertices.
+POLYGON_MAX_COVERAGE = 0.9
+
+# PIL modes of the atlas pixel formats. The lossy ones are rounded to fewer bits per channel first.
+PIXEL_FORMATS = {
+    "rgba8888": "RGBA",
+    "rgb888": "RGB",
+    "la88": "LA",
+    "l8": "L",
+    "p8": "P",
+    "rgba4444": "RGBA",
+    "rgb565": "RGB",
+}
+
+# Bits kept of every channel by the lossy pixel formats.
+LOSSY_PIXEL_FORMATS = {"rgba4444": (4, 4, 4, 4), "rgb565": (5, 6, 5, 8)}
+
+# Ordered dither thresholds for the lossy pixel formats.
+BAYER_MATRIX = [[0, 8, 2, 10], [12, 4, 14, 6], [3, 11, 1, 9], [15, 7, 13, 5]]
+
+# Sort keys for the supported packing orders, taking the image width and height.
+SORT_MODES = {
+    "name": lambda width, height: 0,
+    "height": lambda width, height: (-height, -width),
+    "area": lambda width, height: -width * height,
+    "maxside": lambda width, height: (-max(width, height), -min(width, height)),
+    "perimeter": lambda width, height: -(width + height),
+}
+
+# Rectangle packers by name, taking the packing area width and height.
+PACKERS = {
+    "skyline": SkylineRectanglePacker,
+    "maxrects": lambda width, height: MaxRectsRectanglePacker(width, height, "bssf"),
+    "maxrects-bl": lambda width, height: MaxRectsRectanglePacker(width, height, "bl"),
+    "maxrects-cp": lambda width, height: MaxRectsRectanglePacker(width, height, "cp"),
+    "guillotine": lambda width, height: GuillotineRectanglePacker(width, height, "bssf"),
+    "guillotine-baf": lambda width, height: GuillotineRectanglePacker(width, height, "baf"),
+    "guillotine-bl": lambda width, height: GuillotineRectanglePacker(width, height, "bl"),
+    "guillotine-cp": lambda width, height: GuillotineRectanglePacker(width, height, "cp"),
+}
+
+# The packer used by each worker process.
+_workerPacker = None
+
+def _InitWorker():
+    global _workerPacker
+    _workerPacker = AtlasPacker(0)
+
+def _GetWorkerPacker():
+    if _workerPacker is None:
+        _InitWorker()
+    return _workerPacker
+
+def NewWorkerPool(workers):
+    """Starts a pool of worker processes that several AtlasPackers can share, see AtlasPacker's workerPool"""
+    return WorkerPool(workers, _InitWorker)
+
+def _HasAlpha(image):
+    # Palette and gray images can be transparent through their transparency entry.
+    return image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+
+def _ReadImageHeaderWorker(filepath):
+    try:
+        image = Image.open(filepath)
+        return (image.mode, image.size, _HasAlpha(image))
+    except IOError:
+        return None
+
+def _OpenImageSource(source):
+    # Accept decoded images as well as encoded image data.
+    if isinstance(source, Image.Image):
+        return source
+    if isinstance(source, memoryview):
+        source = source.tobytes()
+    return Image.open(io.BytesIO(source))
+
+def _HashImage(image, imageData=None):
+    # Include the layout of the pixels so only truly identical images share a hash.
+    if imageData is None:
+        imageData = image.tobytes()
+    return hashlib.sha1("%s %dx%d " % (image.mode, image.size[0], image.size[1]) + imageData).hexdigest()
+
+def _CropImageWorker(args):
+    filepath, cropColor, bufferPath, fallbackBufferPath = args
+    try:
+        start = time.time()
+        image = Image.open(filepath)
+        image.load()
+        if image.mode != "RGBA":
+            image = image.convert("RGBA")
+        decodeSeconds = time.time() - start
+
+        start = time.time()
+        boundingBox = _GetWorkerPacker()._FindBBox(image, cropColor)
+        image = image.crop(boundingBox)
+        trimSeconds = time.time() - start
+    except IOError:
+        return None
+
+    # Hand the cropped pixels back through a raw buffer instead of pickling them. Shared memory
+    # can run full before the disk does, so fall back to the disk when the buffer can't be written.
+    imageData = image.tobytes()
+    for path in [bufferPath, fallbackBufferPath]:
+        try:
+            with open(path, "wb") as file:
+                file.write(imageData)
+            break
+        except (IOError, OSError):
+            if os.path.exists(path):
+                os.remove(path)
+            if path == fallbackBufferPath:
+                return None
+
+    return (boundingBox, image.mode, image.size, _HashImage(image, imageData), decodeSeconds, trimSeconds, path)
+
+def _GetTemporaryPath(path):
+    # Keep the extension so PIL still knows which format to write.
+    outputRoot, outputExt = os.path.splitext(path)
+    return "%s.tmp%s" % (outputRoot, outputExt)
+
+def _ReplaceFile(temporaryPath, path):
+    # Renaming is atomic, so readers never see a partially written file.
+    if os.name == "nt" and os.path.exists(path):
+        os.remove(path)
+    os.rename(temporaryPath, path)
+
+def _PackAtlasWorker(args):
+    # Record the size attempts so the parent can hand them to its own observer.
+    packer = _GetWorkerPacker()
+    packer._observer = StatsObserver()
+    try:
+        return (packer._PackAtlasSorted(*args), packer._observer.sizeAttempts)
+    finally:
+        packer._observer = PackObserver()
+
+class OutputFormat(object):
+    """A small data structure describing the pixel format the atlas is written in"""
+
+    def __init__(self, name, palette=None, dither=False):
+        self.name = name
+        self.palette = palette
+        self.dither = dither
+
+class PackSettings(object):
+    """A small data structure for holding the settings used to pack an atlas"""
+
+    def __init__(self, minImageSize, maxImageSize, padding=2, allowNonPowerOfTwo=False, sortMode="name", packer="skyline", allowRotation=False, deduplicate=False, multiPage=False, stripHeight=None, encodeProfile="balanced", extrude=False, mipFilter=None, textureFormat=None, blockAlign=False, polygonVertices=None, gridLayout=None, pixelFormat=None, dither=False):
+        self.minImageSize = minImageSize
+        self.maxImageSize = maxImageSize
+        self.padding = padding
+        self.allowNonPowerOfTwo = allowNonPowerOfTwo
+        self.sortMode = sortMode
+        self.packer = packer
+        self.allowRotation = allowRotation
+        self.deduplicate = deduplicate
+        self.multiPage = multiPage
+        self.stripHeight = stripHeight
+        self.encodeProfile = encodeProfile
+        self.extrude = extrude
+        self.mipFilter = mipFilter
+        self.textureFormat = textureFormat
+        self.blockAlign = blockAlign
+        self.polygonVertices = polygonVertices
+        self.gridLayout = gridLayout
+        self.pixelFormat = pixelFormat
+        self.dither = dither
 
 class AtlasPacker(object):
     """A class for packing texture atlases"""
     
-    def __init__(self):
-        pass
+    def __init__(self, cacheSize=256 * 1024 * 1024, workerPool=None):
+        # Cropped images from the trimming pass, reused when compositing.
+        self._imageCache = ImageCache(cacheSize)
+
+        # The pool used for per image work, if any. A pool handed in is shared with other packers,
+        # it's used whatever the workers of an operation are and outlives it.
+        self._pool = None
+        self._workers = 1
+        self._sharedPool = workerPool
+
+        # Receives the progress and measurements of the current operation.
+        self._observer = PackObserver()
+
+        # The sprite cache of the previous build, if any.
+        self._spriteCache = None
     
+    def _StartWorkers(self, workers):
+        if self._sharedPool is not None:
+            self._pool = self._sharedPool
+            self._workers = self._sharedPool.workers
+        elif workers > 1:
+            self._pool = NewWorkerPool(workers)
+            self._workers = workers
+
+    def _StopWorkers(self):
+        if self._pool is not None and self._pool is not self._sharedPool:
+            self._pool.close()
+            self._pool.join()
+        self._pool = None
+        self._workers = 1
+
+    def _Map(self, function, items):
+        # Run the function on the worker pool if there is one.
+        if self._pool is None:
+            return map(function, items)
+
+        chunkSize = max(1, len(items) / (self._workers * 4))
+        return self._pool.map(function, items, chunkSize)
+
+    @contextlib.contextmanager
+    def _Stage(self, name):
+        # Time a stage of the current operation.
+        self._observer.StageStarted(name)
+        start = time.time()
+        try:
+            yield
+        finally:
+            self._observer.StageFinished(name, time.time() - start)
+
+    def _CheckSettings(self, settings):
+        # Catch misspelled options before any image is read.
+        if settings.packer not in PACKERS:
+            raise ValueError("Unknown packer %s, expected one of %s" % (settings.packer, ", ".join(sorted(PACKERS.keys()))))
+        if settings.sortMode not in SORT_MODES and settings.sortMode != "best":
+            raise ValueError("Unknown sort mode %s, expected best or one of %s" % (settings.sortMode, ", ".join(sorted(SORT_MODES.keys()))))
+        if settings.pixelFormat not in [None, "auto"] + LOSSY_PIXEL_FORMATS.keys():
+            raise ValueError("Unknown pixel format %s, expected auto or one of %s" % (settings.pixelFormat, ", ".join(sorted(LOSSY_PIXEL_FORMATS.keys()))))
+        if settings.pixelFormat is not None and settings.textureFormat is not None:
+            raise ValueError("Pixel format %s can't be combined with texture format %s" % (settings.pixelFormat, settings.textureFormat))
+
+        # Polygons and dithering are written with numpy, without it they would only fail halfway through.
+        if numpy is None and settings.polygonVertices is not None:
+            raise ValueError("Trimming images to polygons needs numpy")
+        if numpy is None and settings.dither:
+            raise ValueError("Dithering needs numpy")
+
+    def _CheckTextureContainer(self, textureFormat, outputImagePath):
+        # Compressed atlases go into a container picked by the extension, which has to be able to hold the format.
+        if texcompress is None:
+            raise ValueError("Texture format %s needs numpy" % textureFormat)
+        if textureFormat not in texcompress.TEXTURE_FORMATS:
+            raise ValueError("Unknown texture format %s, expected one of %s" % (textureFormat, ", ".join(sorted(texcompress.TEXTURE_FORMATS.keys()))))
+        extension = os.path.splitext(outputImagePath)[1].lower()
+        if extension not in texcompress.CONTAINER_WRITERS:
+            raise ValueError("Texture format %s can't be written to %s, expected one of %s" % (textureFormat, outputImagePath, ", ".join(sorted(texcompress.CONTAINER_WRITERS.keys()))))
+        if extension == ".dds" and texcompress.TEXTURE_FORMATS[textureFormat].fourCC is None:
+            raise ValueError("Texture format %s has no DDS format, write it to .ktx instead" % textureFormat)
+
     def _Lerp(self, x, max):
         return float( x ) / float( max )
     
+    def _CropBoundingBoxesCached(self, imageInfoList, cropColor, spriteCache):
+        # Pick up the cropped images that are still valid in the sprite cache.
+        uncachedImageInfoList = []
+        for imageInfo in imageInfoList:
+            entry = spriteCache.Lookup(imageInfo.path, cropColor)
+            if entry is None:
+                uncachedImageInfoList.append(imageInfo)
+                continue
+
+            imageInfo.boundingBox = tuple(entry["boundingBox"])
+            imageInfo.contentHash = str(entry["contentHash"])
+            self._imageCache.PutBuffer(imageInfo.path, spriteCache.GetBlobPath(entry), str(entry["mode"]), tuple(entry["size"]), False)
+
+        self._observer.Message("Found %d of %d images in the sprite cache." % (len(imageInfoList) - len(uncachedImageInfoList), len(imageInfoList)))
+
+        # Crop the remaining images and remember them for the next build.
+        result = self._CropBoundingBoxes(uncachedImageInfoList, cropColor)
+        for imageInfo in uncachedImageInfoList:
+            image = self._imageCache.Get(imageInfo.path)
+            if image is not None:
+                spriteCache.Store(imageInfo.path, cropColor, imageInfo, image)
+
+        return result
+
     def _FindBBox(self, image, color=(0,0,0,0)):
-        alphaTestMode = ( color[3] is 0 )
-        img = image.load()
-        bbox = [0,0,image.size[0],image.size[1]]
-        
-        # Find top
-        for y in xrange( image.size[1] ):
-            emptyRow = True
-            for x in xrange( image.size[0] ):
-                pixel = img[x, y]
-                
-                if alphaTestMode:
-                    if pixel[3] != 0:
-                        emptyRow = False
-                        break
-                else:
-                    if pixel != color:
-                        emptyRow = False
-                        break
-            
-            if not emptyRow:
-                bbox[1] = y
-                break
-            
-        # Find bottom
-        for y in reversed( xrange( image.size[1] ) ):
-            emptyRow = True
-            for x in reversed( xrange( image.size[0] ) ):
-                pixel = img[x, y]
-                
-                if alphaTestMode:
-                    if pixel[3] != 0:
-                        emptyRow = False
-                        break
-                else:
-                    if pixel != color:
-                        emptyRow = False
-                        break
-            
-            if not emptyRow:
-                bbox[3] = y+1
-                break
-            
-        # Find left
-        for x in xrange( image.size[0] ):
-            emptyRow = True
-            for y in xrange( image.size[1] ):
-                pixel = img[x, y]
-                
-                if alphaTestMode:
-                    if pixel[3] != 0:
-                        emptyRow = False
-                        break
-                else:
-                    if pixel != color:
-                        emptyRow = False
-                        break
-            
-            if not emptyRow:
-                bbox[0] = x
-                break
-            
-        # Find right
-        for x in reversed( xrange( image.size[0] ) ):
-            emptyRow = True
-            for y in reversed( xrange( image.size[1] ) ):
-                pixel = img[x, y]
-                
-                if alphaTestMode:
-                    if pixel[3] != 0:
-                        emptyRow = False
-                        break
-                else:
-                    if pixel != color:
-                        emptyRow = False
-                        break
-            
-            if not emptyRow:
-                bbox[2] = x+1
-                break
-        
+        alphaTestMode = ( color[3] == 0 )
+
+        if alphaTestMode:
+            # Any pixel with a non-zero alpha value belongs to the image.
+            bbox = image.getchannel("A").getbbox()
+        elif numpy is not None:
+            # Reduce the color key mask over rows and columns.
+            mask = self._GetContentMask(image, color)
+            rows = numpy.flatnonzero(mask.any(axis=1))
+            columns = numpy.flatnonzero(mask.any(axis=0))
+            bbox = None
+            if rows.size > 0:
+                bbox = (int(columns[0]), int(rows[0]), int(columns[-1]) + 1, int(rows[-1]) + 1)
+        else:
+            # Collapse the per band difference from the color key into a single band.
+            keyImage = Image.new("RGBA", image.size, tuple(color))
+            bands = ImageChops.difference(image, keyImage).split()
+            bbox = reduce(ImageChops.lighter, bands).getbbox()
+
+        # Images without any content keep their full bounds.
+        if bbox is None:
+            return (0, 0, image.size[0], image.size[1])
+
         return tuple( bbox )
-                    
+
+    def _GetContentMask(self, image, color=(0,0,0,0)):
+        # Mark the pixels that belong to the image, using the same test as _FindBBox.
+        pixels = numpy.asarray(image)
+        if color[3] == 0:
+            return pixels[..., 3] != 0
+        return (pixels != numpy.asarray(color, dtype=pixels.dtype)).any(axis=2)
+
+    def _GetConvexHull(self, points):
+        # Andrew's monotone chain, the hull comes out with a positive signed area.
+        points = sorted(set(points))
+        if len(points) < 3:
+            return points
+
+        def Cross(origin, a, b):
+            return (a[0] - origin[0]) * (b[1] - origin[1]) - (a[1] - origin[1]) * (b[0] - origin[0])
+
+        lowerHull = []
+        for point in points:
+            while len(lowerHull) >= 2 and Cross(lowerHull[-2], lowerHull[-1], point) <= 0:
+                lowerHull.pop()
+            lowerHull.append(point)
+
+        upperHull = []
+        for point in reversed(points):
+            while len(upperHull) >= 2 and Cross(upperHull[-2], upperHull[-1], point) <= 0:
+                upperHull.pop()
+            upperHull.append(point)
+
+        return lowerHull[:-1] + upperHull[:-1]
+
+    def _GetPolygonArea(self, polygon):
+        return 0.5 * sum(polygon[i - 1][0] * polygon[i][1] - polygon[i][0] * polygon[i - 1][1] for i in xrange(len(polygon)))
+
+    def _SimplifyPolygon(self, polygon, maxVertices, size):
+        # Repeatedly drop the edge whose neighbours, extended until they meet, add the least area. The
+        # polygon only ever grows, so it keeps covering the whole image. Returns None if it can't get
+        # down to maxVertices without leaving the image rectangle.
+        polygon = list(polygon)
+        while len(polygon) > maxVertices:
+            bestArea, bestIndex, bestPoint = (None, None, None)
+            for i in xrange(len(polygon)):
+                previous, start, end, next = [polygon[(i + offset) % len(polygon)] for offset in [-1, 0, 1, 2]]
+                startDirection = (start[0] - previous[0], start[1] - previous[1])
+                endDirection = (next[0] - end[0], next[1] - end[1])
+
+                # The extended edges only meet beyond the dropped edge if they turn towards each other.
+                denominator = float(startDirection[0] * endDirection[1] - startDirection[1] * endDirection[0])
+                if denominator <= 1e-9:
+                    continue
+                t = ((end[0] - start[0]) * endDirection[1] - (end[1] - start[1]) * endDirection[0]) / denominator
+                point = (start[0] + t * startDirection[0], start[1] + t * startDirection[1])
+                if not (-1e-6 <= point[0] <= size[0] + 1e-6 and -1e-6 <= point[1] <= size[1] + 1e-6):
+                    continue
+
+                area = abs((point[0] - start[0]) * (end[1] - start[1]) - (point[1] - start[1]) * (end[0] - start[0])) * 0.5
+                if bestArea is None or area < bestArea:
+                    bestArea, bestIndex, bestPoint = (area, i, point)
+
+            if bestIndex is None:
+                return None
+
+            # Replace both ends of the dropped edge with the point where its neighbours meet.
+            polygon[bestIndex] = bestPoint
+            del polygon[(bestIndex + 1) % len(polygon)]
+
+        return polygon
+
+    def _FindPolygon(self, image, color=(0,0,0,0), maxVertices=8):
+        # Returns a convex polygon of at most maxVertices around the content of a cropped image, in pixels
+        # relative to its top left corner, or None if the rectangle is about as good.
+        mask = self._GetContentMask(image, color)
+        rows = numpy.flatnonzero(mask.any(axis=1))
+        if rows.size == 0:
+            return None
+
+        # The hull around the outer corners of the leftmost and rightmost content pixel of every row covers every pixel.
+        rowMask = mask[rows]
+        left = rowMask.argmax(axis=1)
+        right = mask.shape[1] - rowMask[:, ::-1].argmax(axis=1)
+        points = zip(numpy.concatenate([left, left, right, right]).tolist(), numpy.concatenate([rows, rows + 1, rows, rows + 1]).tolist())
+        polygon = self._SimplifyPolygon(self._GetConvexHull(points), maxVertices, image.size)
+
+        if polygon is None or self._GetPolygonArea(polygon) > image.size[0] * image.size[1] * POLYGON_MAX_COVERAGE:
+            return None
+        return [(round(x, 2), round(y, 2)) for x, y in polygon]
+
+    def _FindPolygons(self, imageInfoList, cropColor, maxVertices):
+        # Trace the cropped images, the vertices only end up in the manifest.
+        for imageInfo in imageInfoList:
+            try:
+                imageInfo.polygon = self._FindPolygon(self._LoadCroppedImage(imageInfo), cropColor, maxVertices)
+            except IOError:
+                imageInfo.polygon = None
+
     def _GetImageInfo(self, imagePaths):
         # A list of the resulting ImageInfo objects
         imageInfoList = []
 
-        # Collect information about the images
-        for filepath in imagePaths:
-            try:
-                # Set up some basic info about the image.
-                imageInfo = ImageInfo()
-                imageInfo.name = os.path.basename(filepath)
-                imageInfo.path = filepath
+        # Read the image headers. This doesn't decode any pixels.
+        imageHeaders = self._Map(_ReadImageHeaderWorker, imagePaths)
 
-                # Open the image.
-                image = Image.open(filepath)
+        # Collect information about the images
+        for filepath, imageHeader in zip(imagePaths, imageHeaders):
+            if imageHeader is None:
+                continue
 
-                # Check if the image has alpha.
-                imageInfo.containsAlpha = (image.mode == "RGBA")
+            # Set up some basic info about the image.
+            imageInfo = ImageInfo()
+            imageInfo.name = os.path.basename(filepath)
+            imageInfo.path = filepath
 
-                # Extract the dimensions of the image.
-                imageInfo.boundingBox =  [0, 0, image.size[0], image.size[1]]
+            # Check if the image has alpha.
+            imageInfo.containsAlpha = imageHeader[2]
 
-                # Collect the result
-                imageInfoList.append(imageInfo)
+            # Extract the dimensions of the image.
+            imageInfo.boundingBox =  [0, 0, imageHeader[1][0], imageHeader[1][1]]
 
-            except IOError:
-                pass
+            # Collect the result
+            imageInfoList.append(imageInfo)
 
         # Sort the image info list so we get constant results.
         imageInfoList = sorted(imageInfoList, key=lambda imageInfo: imageInfo.name)
@@ -168,69 +540,692 @@ class AtlasPacker(object):
         # Keep track of the result.
         result = True
 
+        # Hand the images out to the workers if we have any.
+        if self._pool is not None:
+            # The uncropped RGBA size is all the budget a buffer can take up, the disk path is used when it can't be written.
+            cropArgs = [(imageInfo.path, cropColor, self._imageCache.NewBufferPath(imageInfo.boundingBox[2] * imageInfo.boundingBox[3] * 4), self._imageCache.NewBufferPath(shared=False)) \
+                for imageInfo in imageInfoList]
+            for imageInfo, cropArg, cropResult in zip(imageInfoList, cropArgs, self._Map(_CropImageWorker, cropArgs)):
+                # Let go of the buffers that weren't used.
+                for bufferPath in cropArg[2:]:
+                    if cropResult is None or bufferPath != cropResult[6]:
+                        self._imageCache.DiscardBuffer(bufferPath)
+                if cropResult is None:
+                    result = False
+                    continue
+
+                imageInfo.boundingBox = cropResult[0]
+                imageInfo.contentHash = cropResult[3]
+                self._imageCache.PutBuffer(imageInfo.path, cropResult[6], cropResult[1], cropResult[2])
+                self._observer.ImageCropped(imageInfo.path, cropResult[4], cropResult[5])
+
+            return result
+
         # Crop bounding box for each image in the list.
         for imageInfo in imageInfoList:
             try:
                 # Load the image
+                start = time.time()
                 image = Image.open(imageInfo.path)
+                image.load()
 
                 # Make sure it's in RGBA format.
                 if image.mode != "RGBA":
                     image = image.convert("RGBA")
+                decodeSeconds = time.time() - start
 
-                # Crop the bounding box using the image data.
-                imageInfo.boundingBox = self._FindBBox(image, cropColor)
+                self._CropImage(imageInfo, image, cropColor, decodeSeconds)
             
             except IOError:
                 result = False
 
         return result
 
-    def _PackImages(self, imageInfoList, padding, size):
+    def _CropImage(self, imageInfo, image, cropColor, decodeSeconds=0.0):
+        # Crop the bounding box using the image data.
+        start = time.time()
+        if cropColor is not None:
+            imageInfo.boundingBox = self._FindBBox(image, cropColor)
+
+        # Keep the cropped pixels around so compositing doesn't have to decode the image again.
+        image = image.crop(imageInfo.boundingBox)
+        self._observer.ImageCropped(imageInfo.path, decodeSeconds, time.time() - start)
+        imageInfo.contentHash = _HashImage(image)
+        self._imageCache.Put(imageInfo.path, image)
+
+    def _CropImagesInMemory(self, images, cropColor):
+        # Build the image info straight from the decoded images, they are named instead of having a path.
+        imageInfoList = []
+        for name, source in images:
+            start = time.time()
+            image = _OpenImageSource(source)
+            image.load()
+
+            imageInfo = ImageInfo()
+            imageInfo.name = name
+            imageInfo.path = name
+            imageInfo.containsAlpha = _HasAlpha(image)
+            imageInfo.boundingBox = [0, 0, image.size[0], image.size[1]]
+
+            # Make sure it's in RGBA format.
+            if image.mode != "RGBA":
+                image = image.convert("RGBA")
+
+            self._CropImage(imageInfo, image, cropColor, time.time() - start)
+            imageInfoList.append(imageInfo)
+
+        # Sort the image info list so we get constant results.
+        return sorted(imageInfoList, key=lambda imageInfo: imageInfo.name)
+
+    def _LoadCroppedImage(self, imageInfo):
+        # Use the cropped image from the trimming pass if we have one.
+        image = self._imageCache.Get(imageInfo.path)
+        if image is not None:
+            return image
+
+        # Otherwise decode the image.
+        image = Image.open(imageInfo.path)
+
+        # Make sure it's an RGBA image.
+        if image.mode != "RGBA":
+            image = image.convert("RGBA")
+
+        # Crop the image to its bounding box.
+        return image.crop(imageInfo.boundingBox)
+
+    def _DeduplicateImages(self, imageInfoList):
+        # Split the images into unique ones and aliases of identical images.
+        uniqueImageInfoList = []
+        aliasImageInfoList = []
+        imagePathsByHash = dict()
+
+        for imageInfo in imageInfoList:
+            # Images that weren't cropped haven't been hashed yet.
+            if imageInfo.contentHash is None:
+                try:
+                    image = self._LoadCroppedImage(imageInfo)
+                except IOError:
+                    uniqueImageInfoList.append(imageInfo)
+                    continue
+
+                imageInfo.contentHash = _HashImage(image)
+                self._imageCache.Put(imageInfo.path, image)
+
+            if imageInfo.contentHash in imagePathsByHash:
+                imageInfo.aliasOf = imagePathsByHash[imageInfo.contentHash]
+                aliasImageInfoList.append(imageInfo)
+            else:
+                imagePathsByHash[imageInfo.contentHash] = imageInfo.path
+                uniqueImageInfoList.append(imageInfo)
+
+        return (uniqueImageInfoList, aliasImageInfoList)
+
+    def _AddAliases(self, packedImageDict, aliasImageInfoList):
+        # Aliases share the packed image of the image they duplicate.
+        for imageInfo in aliasImageInfoList:
+            packedImageDict[imageInfo.path] = (imageInfo, packedImageDict[imageInfo.aliasOf][1])
+
+    def _GetImageSize(self, imageInfo):
+        return (imageInfo.boundingBox[2] - imageInfo.boundingBox[0], imageInfo.boundingBox[3] - imageInfo.boundingBox[1])
+
+    def _GetAtlasDimensions(self, minDimension, maxDimension, minimumFit):
+        # Double the dimension until we reach the maximum, skipping sizes that can't fit the largest image.
+        dimensions = []
+        dimension = minDimension
+        while dimension <= maxDimension:
+            if dimension >= minimumFit:
+                dimensions.append(dimension)
+            dimension *= 2
+
+        # A maximum that isn't reached by doubling is still the last resort.
+        if maxDimension >= max(minDimension, minimumFit) and maxDimension not in dimensions:
+            dimensions.append(maxDimension)
+
+        return dimensions
+
+    def _GetPaddedSize(self, imageWidth, imageHeight, padding, blockAlign=False):
+        # Block aligned images take up whole compression blocks, so no block is shared by two images.
+        paddedWidth = imageWidth + padding * 2
+        paddedHeight = imageHeight + padding * 2
+        if blockAlign:
+            paddedWidth = (paddedWidth + BLOCK_ALIGNMENT - 1) / BLOCK_ALIGNMENT * BLOCK_ALIGNMENT
+            paddedHeight = (paddedHeight + BLOCK_ALIGNMENT - 1) / BLOCK_ALIGNMENT * BLOCK_ALIGNMENT
+        return (paddedWidth, paddedHeight)
+
+    def _GetPackingBounds(self, imageInfoList, padding, allowRotation=False, blockAlign=False):
+        # Find the padded area of all images and the largest padded image dimensions.
+        totalArea = 0
+        maxWidth = 0
+        maxHeight = 0
+        for imageInfo in imageInfoList:
+            imageWidth, imageHeight = self._GetImageSize(imageInfo)
+
+            # Rotated images only need their shorter side to fit either way.
+            if allowRotation:
+                imageWidth = imageHeight = min(imageWidth, imageHeight)
+            paddedWidth, paddedHeight = self._GetPaddedSize(imageWidth, imageHeight, padding, blockAlign)
+            totalArea += paddedWidth * paddedHeight
+            maxWidth = max(maxWidth, paddedWidth)
+            maxHeight = max(maxHeight, paddedHeight)
+
+        return (totalArea, maxWidth, maxHeight)
+
+    def _GetAtlasSizes(self, imageInfoList, settings):
+        totalArea, maxWidth, maxHeight = self._GetPackingBounds(imageInfoList, settings.padding, settings.allowRotation, settings.blockAlign)
+        minImageSize, maxImageSize = (settings.minImageSize, settings.maxImageSize)
+
+        # Pair up every power of two width and height that could possibly hold all the images.
+        widths = self._GetAtlasDimensions(minImageSize[0], maxImageSize[0], maxWidth)
+        heights = self._GetAtlasDimensions(minImageSize[1], maxImageSize[1], maxHeight)
+        sizes = [(width, height) for width in widths for height in heights if width * height >= totalArea]
+
+        # Try the smallest areas first, preferring square sizes.
+        return sorted(sizes, key=lambda size: (size[0] * size[1], abs(size[0] - size[1]), -size[0]))
+
+    def _PackAtlas(self, imageInfoList, settings):
+        minImageSize, maxImageSize = (settings.minImageSize, settings.maxImageSize)
+        imageSize = None
+        packedImageDict = dict()
+
+        # Take the first power of two size that fits.
+        for size in self._GetAtlasSizes(imageInfoList, settings):
+            self._observer.Message("Packing into %dx%d image..." % size)
+            packResult, sizePackedImageDict = self._PackImages(imageInfoList, settings.padding, size, settings.packer, settings.allowRotation, settings.blockAlign)
+            if packResult:
+                self._observer.Message("Packing into %dx%d image successful!" % size)
+                imageSize, packedImageDict = size, sizePackedImageDict
+                break
+            else:
+                self._observer.Message("Packing into %dx%d image failed!" % size)
+
+        if imageSize is None or not settings.allowNonPowerOfTwo:
+            return (imageSize, packedImageDict)
+
+        # Binary search each power of two width for the smallest height that still fits.
+        totalArea, maxWidth, maxHeight = self._GetPackingBounds(imageInfoList, settings.padding, settings.allowRotation, settings.blockAlign)
+        for width in self._GetAtlasDimensions(minImageSize[0], imageSize[0], maxWidth):
+            minHeight = max(minImageSize[1], maxHeight, (totalArea + width - 1) / width)
+            lowStep = (minHeight + NON_POWER_OF_TWO_STEP - 1) / NON_POWER_OF_TWO_STEP
+            highStep = min(maxImageSize[1], (imageSize[0] * imageSize[1] - 1) / width) / NON_POWER_OF_TWO_STEP
+            while lowStep <= highStep:
+                size = (width, ((lowStep + highStep) / 2) * NON_POWER_OF_TWO_STEP)
+                self._observer.Message("Packing into %dx%d image..." % size)
+                packResult, sizePackedImageDict = self._PackImages(imageInfoList, settings.padding, size, settings.packer, settings.allowRotation, settings.blockAlign)
+                if packResult:
+                    self._observer.Message("Packing into %dx%d image successful!" % size)
+                    imageSize, packedImageDict = size, sizePackedImageDict
+                    highStep = size[1] / NON_POWER_OF_TWO_STEP - 1
+                else:
+                    self._observer.Message("Packing into %dx%d image failed!" % size)
+                    lowStep = size[1] / NON_POWER_OF_TWO_STEP + 1
+
+        return (imageSize, packedImageDict)
+
+    def _SortImageInfo(self, imageInfoList, sortMode):
+        # The list is already sorted by name, so ties keep their name order.
+        sortKey = SORT_MODES[sortMode]
+        return sorted(imageInfoList, key=lambda imageInfo: sortKey(*self._GetImageSize(imageInfo)))
+
+    def _GetOccupancy(self, imageInfoList, size):
+        # Calculate the percentage of the atlas covered by images.
+        imageArea = sum(imageSize[0] * imageSize[1] for imageSize in map(self._GetImageSize, imageInfoList))
+        return 100.0 * imageArea / (size[0] * size[1])
+
+    def _PackAtlasSorted(self, imageInfoList, settings, sortMode):
+        return self._PackAtlas(self._SortImageInfo(imageInfoList, sortMode), settings)
+
+    def _PackAtlasBest(self, imageInfoList, settings):
+        # Pack with every sort mode, spread over the workers if we have any.
+        sortModes = sorted(SORT_MODES.keys())
+        if self._pool is None:
+            packResults = [self._PackAtlasSorted(imageInfoList, settings, sortMode) for sortMode in sortModes]
+        else:
+            packResults = []
+            for packResult, sizeAttempts in self._Map(_PackAtlasWorker, [(imageInfoList, settings, sortMode) for sortMode in sortModes]):
+                for sizeAttempt in sizeAttempts:
+                    self._observer.SizeAttempted((sizeAttempt["width"], sizeAttempt["height"]), sizeAttempt["placedCount"], sizeAttempt["imageCount"], sizeAttempt["success"])
+                packResults.append(packResult)
+
+        # Keep the smallest atlas, which is also the densest one.
+        bestSize, bestPackedImageDict = (None, dict())
+        for sortMode, (imageSize, packedImageDict) in zip(sortModes, packResults):
+            if imageSize is None:
+                self._observer.Message("Sort mode %s failed to pack images." % sortMode)
+                continue
+
+            self._observer.Message("Sort mode %s packed into %dx%d image with %.1f%% occupancy." % ((sortMode,) + imageSize + (self._GetOccupancy(imageInfoList, imageSize),)))
+            if bestSize is None or imageSize[0] * imageSize[1] < bestSize[0] * bestSize[1]:
+                bestSize, bestPackedImageDict = (imageSize, packedImageDict)
+
+        return (bestSize, bestPackedImageDict)
+
+    def _FillPage(self, imageInfoList, settings):
+        # Pack as many images as possible into a page of the maximum size.
+        packer = PACKERS[settings.packer](*settings.maxImageSize)
+        pageImageInfoList = []
+        remainingImageInfoList = []
+
+        for imageInfo in imageInfoList:
+            imageWidth, imageHeight = self._GetImageSize(imageInfo)
+            effectiveImageWidth, effectiveImageHeight = map(float, self._GetPaddedSize(imageWidth, imageHeight, settings.padding, settings.blockAlign))
+
+            if settings.allowRotation:
+                point = packer.TryPackWithRotation(effectiveImageWidth, effectiveImageHeight)[0]
+            else:
+                point = packer.Pack(effectiveImageWidth, effectiveImageHeight)
+
+            if point is not None:
+                pageImageInfoList.append(imageInfo)
+            else:
+                remainingImageInfoList.append(imageInfo)
+
+        return (pageImageInfoList, remainingImageInfoList)
+
+    def _PackPages(self, imageInfoList, settings):
+        # Try to fit everything into a single atlas first.
+        if settings.sortMode == "best":
+            imageSize, packedImageDict = self._PackAtlasBest(imageInfoList, settings)
+        else:
+            imageSize, packedImageDict = self._PackAtlasSorted(imageInfoList, settings, settings.sortMode)
+
+        if imageSize is not None:
+            return [(imageSize, packedImageDict)]
+        if not settings.multiPage:
+            return None
+
+        # Fill up pages of the maximum size one after another. Trying every sort mode for each
+        # page would be too slow, so the best mode packs the pages by height.
+        sortMode = "height" if settings.sortMode == "best" else settings.sortMode
+        remainingImageInfoList = self._SortImageInfo(imageInfoList, sortMode)
+        pages = []
+        while remainingImageInfoList:
+            self._observer.Message("Filling page %d with %d remaining images..." % (len(pages), len(remainingImageInfoList)))
+            pageImageInfoList, remainingImageInfoList = self._FillPage(remainingImageInfoList, settings)
+
+            # Give up on images that don't even fit on an empty page.
+            if not pageImageInfoList:
+                return None
+
+            # Shrink the page to the smallest size that still fits its images.
+            imageSize, packedImageDict = self._PackAtlas(pageImageInfoList, settings)
+            if imageSize is None:
+                return None
+
+            for packedImageInfo in [packedImageData[1] for packedImageData in packedImageDict.values()]:
+                packedImageInfo.page = len(pages)
+            pages.append((imageSize, packedImageDict))
+
+        return pages
+
+    def _PackLayout(self, imageInfoList, settings):
+        # Images of a single size are simply placed in a grid, everything else goes through the packer.
+        grid = self._GetGrid(imageInfoList, settings)
+        if grid is None:
+            return (self._PackPages(imageInfoList, settings), None)
+
+        self._observer.Message("Placing %d images in a grid of %dx%d cells..." % ((len(imageInfoList),) + grid.cellSize))
+        # Say so when the grid was picked on its own and pushes aside packing options that were asked for.
+        if settings.gridLayout is None and (settings.packer != "skyline" or settings.sortMode != "name" or settings.allowRotation):
+            self._observer.Message("The images all have the same size, so the grid layout overrides packer %s, sort mode %s and rotation %s; pass gridLayout=False to pack them instead" % (settings.packer, settings.sortMode, "on" if settings.allowRotation else "off"))
+        return (self._PackGrid(imageInfoList, grid, settings), grid)
+
+    def _GetPagePath(self, outputImagePath, pageIndex, pageCount):
+        if pageCount == 1:
+            return outputImagePath
+
+        outputRoot, outputExt = os.path.splitext(outputImagePath)
+        return "%s_%d%s" % (outputRoot, pageIndex, outputExt)
+
+    def _CompositePages(self, outputImagePath, pages, padding, stripHeight=None, encodeProfile="balanced", extrude=False, mipFilter=None, textureFormat=None, outputFormat=None):
+        compositeArgs = [(self._GetPagePath(outputImagePath, pageIndex, len(pages)), imageSize, padding, packedImageDict, stripHeight, encodeProfile, extrude, mipFilter, textureFormat, outputFormat) for pageIndex, (imageSize, packedImageDict) in enumerate(pages)]
+
+        # Composite the pages on threads when we have several, PIL releases the GIL while encoding.
+        if self._workers > 1 and len(pages) > 1:
+            threadPool = multiprocessing.pool.ThreadPool(min(self._workers, len(pages)))
+            try:
+                results = threadPool.map(lambda args: self._CompositePackedImages(*args), compositeArgs)
+            finally:
+                threadPool.close()
+                threadPool.join()
+        else:
+            results = [self._CompositePackedImages(*args) for args in compositeArgs]
+
+        return all(results)
+
+    def _GetLayout(self, pages, padding, packedImageDict, extrude=False, outputFormat=None):
+        # Describe where every image ended up, along with the pixels that went there.
+        layout = dict()
+        layout["padding"] = padding
+        layout["extrude"] = extrude
+        layout["pixelFormat"] = [outputFormat.name, [list(color) for color in outputFormat.palette or []]] if outputFormat is not None else None
+        layout["pages"] = [list(imageSize) for imageSize, pagePackedImageDict in pages]
+        layout["images"] = dict()
+        layout["hashes"] = dict()
+        for imagePath, (imageInfo, packedImageInfo) in packedImageDict.iteritems():
+            # The size matters too, pasting a smaller image would leave the edges of the old one behind.
+            imageWidth, imageHeight = self._GetImageSize(imageInfo)
+            layout["images"][imagePath] = [packedImageInfo.page, packedImageInfo.packPosition[0], packedImageInfo.packPosition[1], imageWidth, imageHeight, packedImageInfo.rotated, imageInfo.aliasOf]
+            layout["hashes"][imagePath] = imageInfo.contentHash
+
+        return layout
+
+    def _GetChangedImagePaths(self, outputImagePath, pages, previousLayout, layout):
+        # Returns the images that need to be composited again, or None if the whole atlas has to be rebuilt.
+        if previousLayout is None or any(layout[key] != previousLayout.get(key) for key in ["padding", "extrude", "pixelFormat", "pages", "images"]):
+            return None
+
+        # The previous atlas needs to still be around.
+        for pageIndex in xrange(len(pages)):
+            if not os.path.exists(self._GetPagePath(outputImagePath, pageIndex, len(pages))):
+                return None
+
+        return [imagePath for imagePath, contentHash in layout["hashes"].iteritems() if contentHash is None or contentHash != previousLayout["hashes"].get(imagePath)]
+
+    def _UpdateCompositedImages(self, outputImagePath, pages, padding, packedImageDict, changedImagePaths, encodeProfile="balanced", extrude=False, mipFilter=None, outputFormat=None):
+        # Keep track of the result.
+        result = True
+
+        for pageIndex in xrange(len(pages)):
+            pageImagePaths = [imagePath for imagePath in changedImagePaths if packedImageDict[imagePath][1].page == pageIndex and packedImageDict[imagePath][0].aliasOf is None]
+            if not pageImagePaths:
+                continue
+
+            # Paste the changed images over the previous atlas, the padding clears out the old pixels.
+            pagePath = self._GetPagePath(outputImagePath, pageIndex, len(pages))
+            outImage = Image.open(pagePath).convert("RGBA")
+            for imagePath in pageImagePaths:
+                imageInfo, packedImageInfo = packedImageDict[imagePath]
+                try:
+                    outImage.paste(self._LoadPaddedImage(imageInfo, packedImageInfo, padding, extrude), packedImageInfo.packPosition)
+                except IOError:
+                    result = False
+
+            self._SaveImage(outImage, pagePath, encodeProfile, outputFormat)
+            if mipFilter is not None:
+                self._WriteMipChain(pagePath, self._Downsample(outImage.convert("RGBa"), mipFilter), mipFilter, encodeProfile, outputFormat)
+
+        return result
+
+    def _PackImages(self, imageInfoList, padding, size, packer="skyline", allowRotation=False, blockAlign=False):
         # Create a dictionary of imagePaths to tuples of ImageInfo and PackedImageInfo
         packedImageDict = dict()
 
         # A bool that indicates success or failure.
         packingResult = True
 
-        # Create a rectangle packer for the current size.
-        packer = CygonRectanglePacker(*size)
+        # Count the images placed so far.
+        placedCount = 0
 
-        # Calculate the texel width and height for the current size.
-        texelWidth = 1.0 / float( size[0] )
-        texelHeight = 1.0 / float( size[1] )
+        # Create a rectangle packer for the current size.
+        packer = PACKERS[packer](*size)
 
         # Attempt to pack each image.
         for imageInfo in imageInfoList:
             assert imageInfo.path not in packedImageDict
 
             # Get the image dimensions
-            imageWidth = imageInfo.boundingBox[2]
-            imageHeight = imageInfo.boundingBox[3]
+            imageWidth, imageHeight = self._GetImageSize(imageInfo)
 
             # Calculate the effective image dimensions.
-            effectiveImageWidth = imageWidth + (padding * 2.0)
-            effectiveImageHeight = imageHeight + (padding * 2.0)
+            effectiveImageWidth, effectiveImageHeight = map(float, self._GetPaddedSize(imageWidth, imageHeight, padding, blockAlign))
 
             # Send the image over to the packing algorithm
-            packingResult = packer.Pack(effectiveImageWidth, effectiveImageHeight)
+            rotated = False
+            if allowRotation:
+                packingResult, rotated = packer.TryPackWithRotation(effectiveImageWidth, effectiveImageHeight)
+            else:
+                packingResult = packer.Pack(effectiveImageWidth, effectiveImageHeight)
+
             if packingResult is not None:
+                # Rotated images take up the image dimensions swapped.
+                if rotated:
+                    imageWidth, imageHeight = (imageHeight, imageWidth)
+
                 # The pack was successful, calculate the values for the packed bounding box.
-                packedX = self._Lerp(packingResult.x + padding, size[0])
-                packedY = self._Lerp(packingResult.y + padding, size[1])
-                packedWidth = float(imageWidth * texelWidth)
-                packedHeight = float(imageHeight * texelHeight)
-                packedImageDict[imageInfo.path] = (imageInfo, PackedImageInfo((int(packingResult.x), int(packingResult.y)), [packedX, packedY, packedWidth, packedHeight]))
+                packPosition = (int(packingResult.x), int(packingResult.y))
+                packedImageDict[imageInfo.path] = (imageInfo, self._GetPackedImageInfo(packPosition, (imageWidth, imageHeight), padding, size, rotated))
+                placedCount += 1
             else:
                 # The pack failed. Destroy all results and return.
                 packedImageDict.clear()
                 packingResult = False
                 break
 
+        # Report how far the packer got with this size.
+        self._observer.SizeAttempted(size, placedCount, len(imageInfoList), packingResult is not False)
+
         # Return the results.
         return (packingResult, packedImageDict)
 
-    def _CompositePackedImages(self, outputPath, size, padding, packedImageDict):
+    def _GetPackedImageInfo(self, packPosition, imageSize, padding, size, rotated=False):
+        # Calculate the texel width and height for the current size.
+        texelWidth = 1.0 / float( size[0] )
+        texelHeight = 1.0 / float( size[1] )
+
+        packedX = self._Lerp(packPosition[0] + padding, size[0])
+        packedY = self._Lerp(packPosition[1] + padding, size[1])
+        packedWidth = float(imageSize[0] * texelWidth)
+        packedHeight = float(imageSize[1] * texelHeight)
+        imagePosition = (packPosition[0] + padding, packPosition[1] + padding)
+        return PackedImageInfo(packPosition, [packedX, packedY, packedWidth, packedHeight], imagePosition, rotated)
+
+    def _GetGridPageSize(self, grid, imageCount, settings):
+        # Round the cells up to an atlas size, non power of two heights go in steps just like packed atlases.
+        rows = (imageCount + grid.columns - 1) / grid.columns
+        neededWidth = min(grid.columns, imageCount) * grid.cellSize[0]
+        neededHeight = rows * grid.cellSize[1]
+
+        width = settings.minImageSize[0]
+        while width < neededWidth:
+            width *= 2
+
+        if settings.allowNonPowerOfTwo:
+            height = max(settings.minImageSize[1], (neededHeight + NON_POWER_OF_TWO_STEP - 1) / NON_POWER_OF_TWO_STEP * NON_POWER_OF_TWO_STEP)
+        else:
+            height = settings.minImageSize[1]
+            while height < neededHeight:
+                height *= 2
+
+        # Rounding past a maximum that isn't a power of two falls back to the maximum, just like packed atlases.
+        if neededWidth <= settings.maxImageSize[0]:
+            width = min(width, settings.maxImageSize[0])
+        if neededHeight <= settings.maxImageSize[1]:
+            height = min(height, settings.maxImageSize[1])
+
+        return (width, height)
+
+    def _GetGrid(self, imageInfoList, settings):
+        # Returns the grid for images of a single size, or for any images if a grid was asked for. Returns None
+        # if they should be packed instead.
+        if settings.gridLayout is False or not imageInfoList:
+            return None
+
+        paddedSizes = set(self._GetPaddedSize(*(self._GetImageSize(imageInfo) + (settings.padding, settings.blockAlign))) for imageInfo in imageInfoList)
+        if settings.gridLayout is None and (len(paddedSizes) > 1 or len(imageInfoList) < 2):
+            return None
+
+        # Every cell fits the largest image.
+        cellSize = (max(paddedSize[0] for paddedSize in paddedSizes), max(paddedSize[1] for paddedSize in paddedSizes))
+        maxColumns = min(len(imageInfoList), settings.maxImageSize[0] / cellSize[0])
+        maxRows = settings.maxImageSize[1] / cellSize[1]
+        if maxColumns == 0 or maxRows == 0:
+            return None
+
+        # Try every number of columns and keep the smallest atlas, preferring square ones.
+        bestSize, bestGrid = (None, None)
+        for columns in xrange(1, maxColumns + 1):
+            grid = ManifestGrid(cellSize, settings.padding, columns, len(imageInfoList))
+            size = self._GetGridPageSize(grid, len(imageInfoList), settings)
+            if size[0] > settings.maxImageSize[0] or size[1] > settings.maxImageSize[1]:
+                continue
+            if bestSize is None or (size[0] * size[1], abs(size[0] - size[1])) < (bestSize[0] * bestSize[1], abs(bestSize[0] - bestSize[1])):
+                bestSize, bestGrid = (size, grid)
+
+        # Fill pages of the maximum size when they don't fit into one.
+        if bestGrid is None and settings.multiPage:
+            bestGrid = ManifestGrid(cellSize, settings.padding, maxColumns, maxColumns * maxRows)
+
+        return bestGrid
+
+    def _PackGrid(self, imageInfoList, grid, settings):
+        # Place the images by their index in the manifest, row by row and page by page.
+        imageInfoList = sorted(imageInfoList, key=lambda imageInfo: os.path.basename(imageInfo.path))
+        pages = []
+        for pageStart in xrange(0, len(imageInfoList), grid.imagesPerPage):
+            pageImageInfoList = imageInfoList[pageStart:pageStart + grid.imagesPerPage]
+            size = self._GetGridPageSize(grid, len(pageImageInfoList), settings)
+
+            packedImageDict = dict()
+            for index, imageInfo in enumerate(pageImageInfoList):
+                packPosition = ((index % grid.columns) * grid.cellSize[0], (index / grid.columns) * grid.cellSize[1])
+                packedImageInfo = self._GetPackedImageInfo(packPosition, self._GetImageSize(imageInfo), settings.padding, size)
+                packedImageInfo.page = len(pages)
+                packedImageDict[imageInfo.path] = (imageInfo, packedImageInfo)
+
+            self._observer.SizeAttempted(size, len(pageImageInfoList), len(pageImageInfoList), True)
+            pages.append((size, packedImageDict))
+
+        return pages
+
+    def _ExtrudeImage(self, image, padding):
+        # Stretch the outermost columns and then the outermost rows over the padding, which fills the corners too.
+        width, height = image.size
+        extrudedImage = Image.new(image.mode, (width + padding * 2, height))
+        extrudedImage.paste(image, (padding, 0))
+        extrudedImage.paste(image.crop((0, 0, 1, height)).resize((padding, height)), (0, 0))
+        extrudedImage.paste(image.crop((width - 1, 0, width, height)).resize((padding, height)), (width + padding, 0))
+
+        image = extrudedImage
+        width = image.size[0]
+        extrudedImage = Image.new(image.mode, (width, height + padding * 2))
+        extrudedImage.paste(image, (0, padding))
+        extrudedImage.paste(image.crop((0, 0, width, 1)).resize((width, padding)), (0, 0))
+        extrudedImage.paste(image.crop((0, height - 1, width, height)).resize((width, padding)), (0, height + padding))
+        return extrudedImage
+
+    def _LoadPaddedImage(self, imageInfo, packedImageInfo, padding, extrude=False):
+        # Load the cropped image.
+        image = self._LoadCroppedImage(imageInfo)
+
+        # Rotated images are turned 90 degrees clockwise.
+        if packedImageInfo.rotated:
+            image = image.transpose(Image.ROTATE_270)
+
+        # Pad the image, repeating its edges so filtering doesn't pull in the neighbouring images.
+        if extrude and padding > 0:
+            return self._ExtrudeImage(image, padding)
+        return ImageOps.expand(image, padding, 0)
+
+    def _GetMipPath(self, outputPath, level):
+        outputRoot, outputExt = os.path.splitext(outputPath)
+        return "%s_mip%d%s" % (outputRoot, level, outputExt)
+
+    def _GetMipSize(self, size):
+        return (max(1, size[0] / 2), max(1, size[1] / 2))
+
+    def _GetMipPaths(self, outputPath, size):
+        # Every level halves the size until it's down to a single pixel.
+        mipPaths = []
+        while size != (1, 1):
+            size = self._GetMipSize(size)
+            mipPaths.append(self._GetMipPath(outputPath, len(mipPaths) + 1))
+        return mipPaths
+
+    def _Downsample(self, image, mipFilter):
+        # The images are kept in premultiplied alpha, so transparent pixels don't bleed their color.
+        return image.resize(self._GetMipSize(image.size), MIP_FILTERS[mipFilter])
+
+    def _BuildMipChain(self, firstMipImage, mipFilter):
+        # Build every level from the previous one, starting with the premultiplied first level.
+        mipImages = [firstMipImage]
+        while mipImages[-1].size != (1, 1):
+            mipImages.append(self._Downsample(mipImages[-1], mipFilter))
+        return [mipImage.convert("RGBA") for mipImage in mipImages]
+
+    def _WriteMipChain(self, outputPath, firstMipImage, mipFilter, encodeProfile="balanced", outputFormat=None):
+        # Filtering mixes colors that aren't in the palette, so palette atlases get RGBA mip levels.
+        if outputFormat is not None and outputFormat.name == "p8":
+            outputFormat = None
+
+        saveArgs = [(mipImage, self._GetMipPath(outputPath, level + 1), encodeProfile, outputFormat) for level, mipImage in enumerate(self._BuildMipChain(firstMipImage, mipFilter))]
+
+        # Encode the levels on threads when we have workers, PIL releases the GIL while encoding.
+        if self._workers > 1:
+            threadPool = multiprocessing.pool.ThreadPool(min(self._workers, len(saveArgs)))
+            try:
+                threadPool.map(lambda args: self._SaveImage(*args), saveArgs)
+            finally:
+                threadPool.close()
+                threadPool.join()
+        else:
+            for args in saveArgs:
+                self._SaveImage(*args)
+
+    def _SaveImage(self, image, outputPath, encodeProfile="balanced", outputFormat=None):
+        if outputFormat is not None:
+            image = self._ConvertPixelFormat(image, outputFormat)
+
+        # Encode into a temporary file and move it into place once it's complete.
+        start = time.time()
+        image.save(_GetTemporaryPath(outputPath), **ENCODE_PROFILES[encodeProfile])
+        _ReplaceFile(_GetTemporaryPath(outputPath), outputPath)
+        self._observer.ImageEncoded(outputPath, encodeProfile, time.time() - start, os.path.getsize(outputPath))
+
+    def _CompressImage(self, image, textureFormat):
+        # Compress bands of block rows on threads when we have workers, numpy releases the GIL for the heavy lifting.
+        pixels = numpy.asarray(image.convert("RGBA"))
+        if self._workers > 1 and pixels.shape[0] > COMPRESSION_BAND_HEIGHT:
+            bands = [pixels[bandTop:bandTop + COMPRESSION_BAND_HEIGHT] for bandTop in xrange(0, pixels.shape[0], COMPRESSION_BAND_HEIGHT)]
+            threadPool = multiprocessing.pool.ThreadPool(min(self._workers, len(bands)))
+            try:
+                return "".join(threadPool.map(lambda band: texcompress.Encode(band, textureFormat), bands))
+            finally:
+                threadPool.close()
+                threadPool.join()
+
+        return texcompress.Encode(pixels, textureFormat)
+
+    def _SaveCompressedImage(self, image, outputPath, textureFormat, mipFilter=None):
+        # The container is picked by the file extension.
+        assert(texcompress is not None)
+        writeContainer = texcompress.CONTAINER_WRITERS[os.path.splitext(outputPath)[1].lower()]
+
+        # Compressed textures keep their mip levels in the same file.
+        start = time.time()
+        levels = [image]
+        if mipFilter is not None:
+            levels += self._BuildMipChain(self._Downsample(image.convert("RGBa"), mipFilter), mipFilter)
+        levelData = [self._CompressImage(level, textureFormat) for level in levels]
+
+        # Write into a temporary file and move it into place once it's complete.
+        with open(_GetTemporaryPath(outputPath), "wb") as file:
+            writeContainer(file, image.size, texcompress.TEXTURE_FORMATS[textureFormat], levelData)
+        _ReplaceFile(_GetTemporaryPath(outputPath), outputPath)
+        self._observer.ImageEncoded(outputPath, textureFormat, time.time() - start, os.path.getsize(outputPath))
+
+    def _CompositePackedImages(self, outputPath, size, padding, packedImageDict, stripHeight=None, encodeProfile="balanced", extrude=False, mipFilter=None, textureFormat=None, outputFormat=None):
+        # Compressed textures are encoded a whole page at a time, since every mip level goes into the same file.
+        if textureFormat is not None:
+            result, outImage = self._CompositeImage(size, padding, packedImageDict, extrude)
+            self._SaveCompressedImage(outImage, outputPath, textureFormat, mipFilter)
+            return result
+
+        # Build large atlases a strip at a time if asked to.
+        if stripHeight is not None:
+            return self._CompositePackedImagesStreamed(outputPath, size, padding, packedImageDict, stripHeight, encodeProfile, extrude, mipFilter, outputFormat)
+
+        result, outImage = self._CompositeImage(size, padding, packedImageDict, extrude)
+
+        # Save the output image
+        self._SaveImage(outImage, outputPath, encodeProfile, outputFormat)
+
+        # Build the mip levels while we still have the atlas in memory.
+        if mipFilter is not None:
+            self._WriteMipChain(outputPath, self._Downsample(outImage.convert("RGBa"), mipFilter), mipFilter, encodeProfile, outputFormat)
+
+        return result
+
+    def _CompositeImage(self, size, padding, packedImageDict, extrude=False):
         # Keep track of the result.
         result = True
 
@@ -239,71 +1234,269 @@ class AtlasPacker(object):
 
         # Composite all packed images into the output image.
         for packedImagePath, packedImageData in packedImageDict.iteritems():
-            try:
-                # Open the image
-                image = Image.open(packedImageData[0].path)
-
-                # Make sure it's an RGBA image.
-                if image.mode != "RGBA":
-                    image = image.convert("RGBA")
-
-                # Crop the image to its bounding box.
-                image = image.crop(packedImageData[0].boundingBox)
-
-                # Pad the image.
-                image = ImageOps.expand(image, padding, 0)
+            # Aliases are already composited through the image they duplicate.
+            if packedImageData[0].aliasOf is not None:
+                continue
 
-                # Paste the image into the output image.
-                outImage.paste(image, packedImageData[1].packPosition)
+            try:
+                # Paste the padded image into the output image.
+                outImage.paste(self._LoadPaddedImage(packedImageData[0], packedImageData[1], padding, extrude), packedImageData[1].packPosition)
 
             except IOError:
                 result = False
 
-        # Save the output image
-        outImage.save(outputPath)
+        return (result, outImage)
+
+    def _CompositePackedImagesStreamed(self, outputPath, size, padding, packedImageDict, stripHeight, encodeProfile="balanced", extrude=False, mipFilter=None, outputFormat=None):
+        # Keep track of the result.
+        result = True
+
+        # Walk the images from top to bottom, aliases are already composited through the image they duplicate.
+        packedImageList = sorted([packedImageData for packedImageData in packedImageDict.values() if packedImageData[0].aliasOf is None], \
+            key=lambda packedImageData: packedImageData[1].packPosition[1])
+        nextImageIndex = 0
+
+        # The padded images overlapping the current strip.
+        activeImages = []
+
+        # Only the time spent in the encoder counts as encoding.
+        encodeOptions = ENCODE_PROFILES[encodeProfile]
+        encodeSeconds = 0.0
+
+        # The first mip level is built from the strips as they go by. The filter reaches past the edges
+        # of a strip, so the atlas rows are kept until every mip row that samples them is done.
+        firstMipImage = None
+        if mipFilter is not None:
+            firstMipImage = Image.new("RGBa", self._GetMipSize(size))
+            mipScale = float(size[1]) / firstMipImage.size[1]
+            mipSupport = MIP_FILTER_SUPPORT[mipFilter] * mipScale
+            mipSourceImage = Image.new("RGBa", (size[0], 0))
+            mipSourceTop = 0
+            nextMipRow = 0
+
+        # Strips are converted to the pixel format on their own, the dither pattern follows the atlas rows.
+        outputMode = PIXEL_FORMATS[outputFormat.name] if outputFormat is not None else "RGBA"
+        palette = outputFormat.palette if outputFormat is not None else None
+
+        with open(_GetTemporaryPath(outputPath), "wb") as file:
+            writer = PngStreamWriter(file, size, outputMode, encodeOptions["compress_level"], encodeOptions.get("compress_type", zlib.Z_DEFAULT_STRATEGY), palette)
+
+            for stripTop in xrange(0, size[1], stripHeight):
+                stripBottom = min(stripTop + stripHeight, size[1])
+
+                # Drop the images above this strip and load the ones starting in it.
+                activeImages = [(image, position) for image, position in activeImages if position[1] + image.size[1] > stripTop]
+                while nextImageIndex < len(packedImageList) and packedImageList[nextImageIndex][1].packPosition[1] < stripBottom:
+                    imageInfo, packedImageInfo = packedImageList[nextImageIndex]
+                    nextImageIndex += 1
+                    try:
+                        activeImages.append((self._LoadPaddedImage(imageInfo, packedImageInfo, padding, extrude), packedImageInfo.packPosition))
+                    except IOError:
+                        result = False
+
+                # Paste the part of each image that falls into the strip and hand the rows to the encoder.
+                stripImage = Image.new("RGBA", (size[0], stripBottom - stripTop))
+                for image, position in activeImages:
+                    stripImage.paste(image, (position[0], position[1] - stripTop))
+                outputStripImage = self._ConvertPixelFormat(stripImage, outputFormat, stripTop) if outputFormat is not None else stripImage
+                start = time.time()
+                writer.WriteRows(outputStripImage.tobytes())
+                encodeSeconds += time.time() - start
+
+                if firstMipImage is not None:
+                    # Add the strip to the rows waiting to be filtered.
+                    sourceImage = Image.new("RGBa", (size[0], stripBottom - mipSourceTop))
+                    sourceImage.paste(mipSourceImage, (0, 0))
+                    sourceImage.paste(stripImage.convert("RGBa"), (0, stripTop - mipSourceTop))
+                    mipSourceImage = sourceImage
+
+                    # Filter the mip rows that don't reach below the rows we have, the same way a resize of the whole atlas would.
+                    lastMipRow = nextMipRow
+                    while lastMipRow < firstMipImage.size[1] and (stripBottom == size[1] or int((lastMipRow + 0.5) * mipScale + mipSupport + 0.5) <= stripBottom):
+                        lastMipRow += 1
+                    if lastMipRow > nextMipRow:
+                        box = (0, nextMipRow * mipScale - mipSourceTop, size[0], lastMipRow * mipScale - mipSourceTop)
+                        firstMipImage.paste(mipSourceImage.resize((firstMipImage.size[0], lastMipRow - nextMipRow), MIP_FILTERS[mipFilter], box), (0, nextMipRow))
+                        nextMipRow = lastMipRow
+
+                        # Drop the rows no remaining mip row reaches.
+                        firstNeededRow = min(max(0, int((nextMipRow + 0.5) * mipScale - mipSupport + 0.5)), stripBottom)
+                        if firstNeededRow > mipSourceTop:
+                            mipSourceImage = mipSourceImage.crop((0, firstNeededRow - mipSourceTop, size[0], stripBottom - mipSourceTop))
+                            mipSourceTop = firstNeededRow
+
+            start = time.time()
+            writer.Close()
+            encodeSeconds += time.time() - start
+        _ReplaceFile(_GetTemporaryPath(outputPath), outputPath)
+        self._observer.ImageEncoded(outputPath, encodeProfile, encodeSeconds, os.path.getsize(outputPath))
+
+        if firstMipImage is not None:
+            self._WriteMipChain(outputPath, firstMipImage, mipFilter, encodeProfile, outputFormat)
 
         return result
 
-    def _WriteManifestForImages(self, outputPath, size, mode, packedImageDict):
+    def _ChooseOutputFormat(self, packedImageDict, settings):
+        # The lossy formats are only ever used when asked for.
+        if settings.pixelFormat != "auto":
+            return OutputFormat(settings.pixelFormat, dither=settings.dither)
+
+        # Find out what the images need. The empty space between them is transparent black.
+        opaque = True
+        gray = True
+        colors = set([(0, 0, 0, 0)]) if numpy is not None else None
+        for imageInfo, packedImageInfo in packedImageDict.itervalues():
+            # Aliases share their pixels with the image they duplicate.
+            if imageInfo.aliasOf is not None:
+                continue
+
+            image = self._LoadCroppedImage(imageInfo)
+            if opaque and imageInfo.containsAlpha:
+                opaque = image.getextrema()[3][0] == 255
+            if gray:
+                red, green, blue, alpha = image.split()
+                gray = ImageChops.difference(red, green).getbbox() is None and ImageChops.difference(green, blue).getbbox() is None
+            if colors is not None:
+                imageColors = image.getcolors(256)
+                if imageColors is not None:
+                    colors.update(color for count, color in imageColors)
+                if imageColors is None or len(colors) > 256:
+                    colors = None
+
+        # Pick the smallest format holding every pixel exactly.
+        if gray and opaque:
+            return OutputFormat("l8")
+        if colors is not None:
+            return OutputFormat("p8", sorted(colors))
+        if gray:
+            return OutputFormat("la88")
+        if opaque:
+            return OutputFormat("rgb888")
+        return OutputFormat("rgba8888")
+
+    def _ConvertPixelFormat(self, image, outputFormat, top=0):
+        # Convert the RGBA image, top is the atlas row it starts at so dithering lines up between strips.
+        if outputFormat.name == "p8":
+            return self._GetPaletteImage(image, outputFormat.palette)
+        if outputFormat.name in LOSSY_PIXEL_FORMATS:
+            image = self._QuantizeImage(image, LOSSY_PIXEL_FORMATS[outputFormat.name], outputFormat.dither, top)
+        return image.convert(PIXEL_FORMATS[outputFormat.name])
+
+    def _GetPaletteImage(self, image, palette):
+        # Look up every pixel in the sorted palette, comparing the colors as big endian integers.
+        paletteKeys = numpy.array([(red << 24) | (green << 16) | (blue << 8) | alpha for red, green, blue, alpha in palette], numpy.uint32)
+        pixelKeys = numpy.ascontiguousarray(numpy.asarray(image)).view(">u4")[:, :, 0]
+        paletteImage = Image.fromarray(numpy.searchsorted(paletteKeys, pixelKeys).astype(numpy.uint8), "P")
+        paletteImage.putpalette([value for color in palette for value in color[:3]])
+        paletteImage.info["transparency"] = "".join(chr(color[3]) for color in palette)
+        return paletteImage
+
+    def _QuantizeImage(self, image, channelBits, dither=False, top=0):
+        # Round every channel to its bits and widen it back by repeating the high bits, like the GPU does.
+        def Widen(value, bits):
+            return (value << (8 - bits)) | (value >> (2 * bits - 8))
+
+        if not dither:
+            lut = []
+            for bits in channelBits:
+                levels = (1 << bits) - 1
+                lut += [Widen(int(value * levels / 255.0 + 0.5), bits) for value in xrange(256)]
+            return image.point(lut)
+
+        # Nudge every pixel by its threshold in the ordered dither before rounding.
+        pixels = numpy.asarray(image, numpy.float32)
+        rows = (numpy.arange(image.size[1]) + top) % 4
+        columns = numpy.arange(image.size[0]) % 4
+        thresholds = (numpy.array(BAYER_MATRIX, numpy.float32)[rows[:, None], columns[None, :]] + 0.5) / 16 - 0.5
+        channels = []
+        for channel, bits in enumerate(channelBits):
+            levels = (1 << bits) - 1
+            values = numpy.clip(numpy.floor(pixels[:, :, channel] * levels / 255.0 + 0.5 + thresholds), 0, levels).astype(numpy.uint32)
+            channels.append(Widen(values, bits).astype(numpy.uint8))
+        return Image.fromarray(numpy.dstack(channels), "RGBA")
+
+    def _WriteManifestForImages(self, outputPath, size, mode, packedImageDict, pages=None, manifestFormat="xml", grid=None, pixelFormat=None):
+        # Write the entries to a temporary file and move it into place once it's complete.
+        with open( _GetTemporaryPath(outputPath), "wb" ) as file:
+            self._WriteManifest(file, size, mode, packedImageDict, pages, manifestFormat, grid, pixelFormat)
+        _ReplaceFile(_GetTemporaryPath(outputPath), outputPath)
+
+    def _WriteManifest(self, file, size, mode, packedImageDict, pages=None, manifestFormat="xml", grid=None, pixelFormat=None):
         ACCEPTED_MODES = {"uv", "pixel"}
         assert(mode in ACCEPTED_MODES)
-        
-        # Create the root node.
-        rootNode = Element("atlas")
-        rootNode.set("width", str(size[0]))
-        rootNode.set("height", str(size[1]))
+        assert(manifestFormat in MANIFEST_WRITERS)
+
+        # Only list the page images when the atlas is split over several of them.
+        pageSizes = [pageSize for pageFilename, pageSize in pages] if pages else [size]
+        if pages is not None and len(pages) < 2:
+            pages = None
 
         # Sort the image paths by their basename so we get constant ordering.
         sortedImagePathList = sorted(packedImageDict.keys(), key=lambda path: os.path.basename(path))
-        
-        # Append all image nodes.
+
+        # Gather the entries of all images.
+        images = []
         for imagePath in sortedImagePathList:
             imageInfo = packedImageDict[imagePath][0]
             packedImageInfo = packedImageDict[imagePath][1]
-            imageNode = SubElement(rootNode, "image")
-            imageNode.set("name", os.path.basename(imagePath))
-            
+
             if mode == "uv":
-                imageNode.set("u1", str(packedImageInfo.packedBoundingBox[0]))
-                imageNode.set("v1", str(packedImageInfo.packedBoundingBox[1]))
-                imageNode.set("u2", str(packedImageInfo.packedBoundingBox[0] + packedImageInfo.packedBoundingBox[2]))
-                imageNode.set("v2", str(packedImageInfo.packedBoundingBox[1] + packedImageInfo.packedBoundingBox[3]))
+                packedBoundingBox = packedImageInfo.packedBoundingBox
+                coordinates = (packedBoundingBox[0], packedBoundingBox[1], packedBoundingBox[0] + packedBoundingBox[2], packedBoundingBox[1] + packedBoundingBox[3])
             elif mode == "pixel":
-                imageNode.set("x1", str(packedImageInfo.packPosition[0]))
-                imageNode.set("y1", str(packedImageInfo.packPosition[1]))
-                imageNode.set("x2", str(packedImageInfo.packPosition[0] + imageInfo.boundingBox[2]))
-                imageNode.set("y2", str(packedImageInfo.packPosition[1] + imageInfo.boundingBox[3]))
-
-        # Prettify the xml
-        xmlData = tostring( rootNode )
-        dom = xml.dom.minidom.parseString( xmlData )
-        xmlText = dom.toprettyxml()
-
-        # Write the xml to the output file.
-        with open( outputPath, "wb" ) as file:
-            file.write( xmlText )
-
-    def _SliceImage(self, imageFilepath, tileSize):
+                imageWidth, imageHeight = self._GetImageSize(imageInfo)
+                if packedImageInfo.rotated:
+                    imageWidth, imageHeight = (imageHeight, imageWidth)
+                imagePosition = packedImageInfo.imagePosition
+                coordinates = (imagePosition[0], imagePosition[1], imagePosition[0] + imageWidth, imagePosition[1] + imageHeight)
+
+            # Move the polygon into the atlas, turning it along with rotated images.
+            vertices = None
+            uvVertices = None
+            if imageInfo.polygon is not None:
+                imageHeight = self._GetImageSize(imageInfo)[1]
+                imagePosition = packedImageInfo.imagePosition
+                vertices = []
+                for x, y in imageInfo.polygon:
+                    if packedImageInfo.rotated:
+                        x, y = (imageHeight - y, x)
+                    vertices.append((imagePosition[0] + x, imagePosition[1] + y))
+                pageSize = pageSizes[packedImageInfo.page]
+                uvVertices = [(x / float(pageSize[0]), y / float(pageSize[1])) for x, y in vertices]
+
+            images.append(ManifestImage(os.path.basename(imagePath), packedImageInfo.rotated, packedImageInfo.page, coordinates, vertices, uvVertices))
+
+        # Write the entries straight to the file.
+        MANIFEST_WRITERS[manifestFormat](file, mode, size, pages, images, grid, pixelFormat)
+
+    def _GetUniformColor(self, image):
+        # Returns the color of an image that only contains a single color, or None.
+        extrema = image.getextrema()
+        if image.mode in ["1", "L", "P", "I", "F"]:
+            extrema = [extrema]
+
+        if any(minimum != maximum for minimum, maximum in extrema):
+            return None
+
+        return tuple(minimum for minimum, maximum in extrema)
+
+    def _SliceTile(self, image, tileSize, position, outputPath, skipUniformTiles, encodeProfile):
+        # Cut the tile straight out of the decoded image, the parts outside of the image are padded with zeros.
+        tileImage = image.crop((position[0], position[1], position[0] + tileSize[0], position[1] + tileSize[1]))
+
+        # Tiles of a single color are only recorded in the index.
+        if skipUniformTiles:
+            color = self._GetUniformColor(tileImage)
+            if color is not None:
+                if os.path.exists(outputPath):
+                    os.remove(outputPath)
+                return ManifestTile(position, None, color)
+
+        self._SaveImage(tileImage, outputPath, encodeProfile)
+        self._ReportFileWritten(outputPath)
+        return ManifestTile(position, os.path.basename(outputPath))
+
+    def _SliceImage(self, imageFilepath, tileSize, workers=1, skipUniformTiles=False, encodeProfile="balanced"):
         # Keep track of the result of the operation.
         result = True
 
@@ -322,31 +1515,36 @@ class AtlasPacker(object):
             os.mkdir(outputDir)
         
         try:
-            # Open the image.
+            # Open and decode the image once, every tile is cut out of it.
             image = Image.open(imageFilepath)
+            image.load()
 
-            # Make sure the tile sizes are valid.
-            assert(image.size[0] % tileSize[0] == 0)
-            assert(image.size[1] % tileSize[1] == 0)
+            # Calculate the total size in tiles, the tiles on the right and bottom edges are padded.
+            sizeInTiles = ((image.size[0] + tileSize[0] - 1) / tileSize[0], (image.size[1] + tileSize[1] - 1) / tileSize[1])
 
-            # Calculate the total size in tiles.
-            sizeInTiles = (image.size[0] / tileSize[0], image.size[1] / tileSize[1])
-
-            # Iterate over each tile.
+            # Calculate the top left corner of each tile in pixel coordinates.
+            tileArgs = []
             for y in xrange(sizeInTiles[1]):
                 for x in xrange(sizeInTiles[0]):
-                    # Calculate the top left corner of each tile in pixel coordinates.
-                    xPos = x * tileSize[0]
-                    yPos = y * tileSize[1]
-
-                    # Make a copy of the original image so we can crop it to the correct region.
-                    tileImage = image.crop([xPos, yPos, xPos + tileSize[0], yPos + tileSize[1]])
-
-                    # Create the output image, paste the cropped image into it, and save it in the output directory.
-                    outputTileImage = Image.new(tileImage.mode, tileSize)
-                    outputTileImage.paste(tileImage, [0, 0, tileImage.size[0], tileImage.size[1]])
-                    outputTileImage.save(os.path.join(outputDir, "%d_%d%s" % (xPos, yPos, imageExt)))
+                    position = (x * tileSize[0], y * tileSize[1])
+                    tileArgs.append((image, tileSize, position, os.path.join(outputDir, "%d_%d%s" % (position + (imageExt,))), skipUniformTiles, encodeProfile))
+
+            # Encode the tiles on threads, PIL releases the GIL while encoding.
+            if workers > 1 and len(tileArgs) > 1:
+                threadPool = multiprocessing.pool.ThreadPool(min(workers, len(tileArgs)))
+                try:
+                    tiles = threadPool.map(lambda args: self._SliceTile(*args), tileArgs)
+                finally:
+                    threadPool.close()
+                    threadPool.join()
+            else:
+                tiles = [self._SliceTile(*args) for args in tileArgs]
 
+            # Write the index of all tiles.
+            indexPath = os.path.join(outputDir, "index.xml")
+            with open(indexPath, "wb") as file:
+                WriteTileIndex(file, image.size, tileSize, tiles)
+            self._ReportFileWritten(indexPath)
 
         except IOError:
             result = False
@@ -354,59 +1552,281 @@ class AtlasPacker(object):
         # Return the result.
         return result
 
-    def Pack(self, imageFilenames, minImageSize, maxImageSize, manifestMode, outputImagePath, outputManifestPath, padding=2, cropColor=(0,0,0,0)):
-        print "Packing %d images..." % len(imageFilenames)
+    def Pack(self, imageFilenames, minImageSize, maxImageSize, manifestMode, outputImagePath, outputManifestPath, padding=2, cropColor=(0,0,0,0), workers=1, allowNonPowerOfTwo=False, sortMode="name", packer="skyline", allowRotation=False, deduplicate=False, multiPage=False, cacheDir=None, stripHeight=None, manifestFormat="xml", observer=None, encodeProfile="balanced", extrude=False, mipFilter=None, textureFormat=None, blockAlign=False, polygonVertices=None, gridLayout=None, pixelFormat=None, dither=False):
+        """Packs the images into an atlas and writes its manifest
+
+        observer: A PackObserver receiving the progress and measurements
+        textureFormat: Block compress the atlas into one of texcompress.TEXTURE_FORMATS,
+        written as DDS or KTX depending on the extension of outputImagePath
+        blockAlign: Pad every image to whole 4x4 blocks so no compression block is shared
+        polygonVertices: Also trim every image to a convex polygon of at most this many
+        vertices, written to the manifest next to its rectangle. Needs numpy
+        gridLayout: Place the images in a grid of equal cells instead of packing them. By
+        default a grid is used when all images have the same size, which takes precedence
+        over packer, sortMode and allowRotation and is reported to the observer. True forces
+        one and False never uses one
+        pixelFormat: Write the atlas in fewer bits per pixel. "auto" picks the smallest
+        of PIXEL_FORMATS holding the images exactly, "rgba4444" and "rgb565" round
+        them. The chosen format is recorded in the manifest
+        dither: Dither the lossy pixel formats instead of rounding. Needs numpy
+
+        Raises a ValueError for an unknown packer, sort mode or pixel format, a pixel
+        format combined with a texture format, a texture format the extension of
+        outputImagePath can't hold, or polygons or dithering without numpy.
+
+        Returns a PackResult instance"""
+        settings = PackSettings(minImageSize, maxImageSize, padding, allowNonPowerOfTwo, sortMode, packer, allowRotation, deduplicate, multiPage, stripHeight, encodeProfile, extrude, mipFilter, textureFormat, blockAlign, polygonVertices, gridLayout, pixelFormat, dither)
+        self._CheckSettings(settings)
+        if textureFormat is not None:
+            self._CheckTextureContainer(textureFormat, outputImagePath)
+        self._observer = observer if observer is not None else PackObserver()
+
+        # Reuse the trimmed images and layout of previous builds.
+        spriteCache = self._GetSpriteCache(cacheDir)
+
+        # Spread the per image work over a pool of worker processes.
+        self._StartWorkers(workers)
+
+        try:
+            result = self._Pack(imageFilenames, settings, manifestMode, manifestFormat, outputImagePath, outputManifestPath, cropColor, spriteCache)
+            self._observer.Message("Packing complete!")
+        finally:
+            # Release the workers and the cropped images.
+            self._StopWorkers()
+            self._imageCache.Clear()
+            self._observer = PackObserver()
+
+        return result
+
+    def _GetSpriteCache(self, cacheDir):
+        # Keep the sprite cache loaded between builds into the same directory.
+        if cacheDir is None:
+            return None
+
+        if self._spriteCache is None or self._spriteCache.cacheDir != cacheDir:
+            self._spriteCache = SpriteCache(cacheDir)
+
+        return self._spriteCache
+
+    def _CollectPages(self, pages, aliasImageInfoList, outputImagePath, result):
+        # Gather the packed images of all pages.
+        packedImageDict = dict()
+        for pageIndex, (imageSize, pagePackedImageDict) in enumerate(pages):
+            pageImageInfoList = [packedImageData[0] for packedImageData in pagePackedImageDict.values()]
+            occupancy = self._GetOccupancy(pageImageInfoList, imageSize)
+            self._observer.PagePacked(pageIndex, imageSize, occupancy)
+            self._observer.Message("Packed page %d into %dx%d image with %.1f%% occupancy." % ((pageIndex,) + imageSize + (occupancy,)))
+            result.pages.append((self._GetPagePath(outputImagePath, pageIndex, len(pages)), imageSize, occupancy))
+            packedImageDict.update(pagePackedImageDict)
+        self._AddAliases(packedImageDict, aliasImageInfoList)
+
+        return packedImageDict
+
+    def _ReportFileWritten(self, path):
+        byteCount = os.path.getsize(path)
+        self._observer.FileWritten(path, byteCount)
+        return byteCount
+
+    def _Pack(self, imageFilenames, settings, manifestMode, manifestFormat, outputImagePath, outputManifestPath, cropColor, spriteCache):
+        result = PackResult()
+        result.imageCount = len(imageFilenames)
+        self._observer.Message("Packing %d images..." % len(imageFilenames))
 
         # Calculate information for each image.
-        imageInfoList = self._GetImageInfo(imageFilenames)
+        with self._Stage("info"):
+            imageInfoList = self._GetImageInfo(imageFilenames)
 
         # Crop the images
         if cropColor is not None:
-            print "Cropping images..."
-            if self._CropBoundingBoxes(imageInfoList, cropColor):
-                print "Cropping successful!"
+            self._observer.Message("Cropping images...")
+            with self._Stage("crop"):
+                if spriteCache is not None:
+                    cropResult = self._CropBoundingBoxesCached(imageInfoList, cropColor, spriteCache)
+                else:
+                    cropResult = self._CropBoundingBoxes(imageInfoList, cropColor)
+
+            if cropResult:
+                self._observer.Message("Cropping successful!")
             else:
-                print "Cropping failed!"
+                self._observer.Message("Cropping failed!")
+
+        # Trace a tighter polygon around every trimmed image if asked to.
+        if cropColor is not None and settings.polygonVertices is not None:
+            with self._Stage("polygon"):
+                self._FindPolygons(imageInfoList, cropColor, settings.polygonVertices)
+
+        # Only pack one copy of identical images.
+        aliasImageInfoList = []
+        if settings.deduplicate:
+            with self._Stage("deduplicate"):
+                imageInfoList, aliasImageInfoList = self._DeduplicateImages(imageInfoList)
+            result.duplicateCount = len(aliasImageInfoList)
+            self._observer.Message("Found %d duplicate images." % len(aliasImageInfoList))
 
         # Pack the images.
-        print "Packing images..."
-        imageSize = minImageSize
-        packResult = False
-        while (imageSize[0] <= maxImageSize[0] and imageSize[1] <= maxImageSize[1]):
-            print "Packing into %dx%d image..." % imageSize
-            packResult, packedImageDict = self._PackImages(imageInfoList, padding, imageSize)
-            if packResult:
-                print "Packing into %dx%d image successful!" % imageSize
-                break
-            else:
-                print "Packing into %dx%d image failed!" % imageSize
-                imageSize = (imageSize[0] * 2, imageSize[1] * 2)
-        
+        self._observer.Message("Packing images...")
+        with self._Stage("pack"):
+            pages, grid = self._PackLayout(imageInfoList, settings)
+
         # Only continue if the packing was successful.
-        if packResult:
-            # Composite the images into the output image.
-            print "Compositing Images to %s..." % os.path.basename(outputImagePath)
-            if self._CompositePackedImages(outputImagePath, imageSize, padding, packedImageDict):
-                print "Compositing successful!"
+        if pages is not None:
+            packedImageDict = self._CollectPages(pages, aliasImageInfoList, outputImagePath, result)
+
+            # Pick the pixel format of the atlas.
+            outputFormat = None
+            if settings.pixelFormat is not None:
+                with self._Stage("format"):
+                    outputFormat = self._ChooseOutputFormat(packedImageDict, settings)
+                result.pixelFormat = outputFormat.name
+                self._observer.Message("Writing the atlas as %s." % outputFormat.name)
+
+            # Find out which images changed since the previous build. Compressed atlases are always rebuilt whole,
+            # and so are lossy ones since rounding the previous atlas again could move its pixels.
+            layout = self._GetLayout(pages, settings.padding, packedImageDict, settings.extrude, outputFormat)
+            changedImagePaths = None
+            if spriteCache is not None and settings.textureFormat is None and settings.pixelFormat not in LOSSY_PIXEL_FORMATS:
+                changedImagePaths = self._GetChangedImagePaths(outputImagePath, pages, spriteCache.GetLayout(outputImagePath), layout)
+
+            # Composite the images into the output images.
+            with self._Stage("composite"):
+                if changedImagePaths is not None:
+                    self._observer.Message("Compositing %d changed images into %s..." % (len(changedImagePaths), os.path.basename(outputImagePath)))
+                    compositeResult = self._UpdateCompositedImages(outputImagePath, pages, settings.padding, packedImageDict, changedImagePaths, settings.encodeProfile, settings.extrude, settings.mipFilter, outputFormat)
+                else:
+                    self._observer.Message("Compositing Images to %s..." % os.path.basename(outputImagePath))
+                    compositeResult = self._CompositePages(outputImagePath, pages, settings.padding, settings.stripHeight, settings.encodeProfile, settings.extrude, settings.mipFilter, settings.textureFormat, outputFormat)
+
+            if compositeResult:
+                self._observer.Message("Compositing successful!")
+                for pagePath, imageSize, occupancy in result.pages:
+                    result.bytesWritten += self._ReportFileWritten(pagePath)
+                    if settings.mipFilter is not None and settings.textureFormat is None:
+                        for mipPath in self._GetMipPaths(pagePath, imageSize):
+                            result.bytesWritten += self._ReportFileWritten(mipPath)
+                if spriteCache is not None:
+                    spriteCache.SetLayout(outputImagePath, layout)
             else:
-                print "Compositing failed!"
+                self._observer.Message("Compositing failed!")
 
             # Write the manifest file.
-            print "Writing manifest to %s..." % os.path.basename(outputManifestPath)
-            self._WriteManifestForImages(outputManifestPath, imageSize, manifestMode, packedImageDict)
-            print "Writing successful!"
+            self._observer.Message("Writing manifest to %s..." % os.path.basename(outputManifestPath))
+            pageFiles = [(os.path.basename(self._GetPagePath(outputImagePath, pageIndex, len(pages))), pages[pageIndex][0]) for pageIndex in xrange(len(pages))]
+            with self._Stage("manifest"):
+                self._WriteManifestForImages(outputManifestPath, pages[0][0], manifestMode, packedImageDict, pageFiles, manifestFormat, grid if not aliasImageInfoList else None, result.pixelFormat)
+            result.manifestPath = outputManifestPath
+            result.bytesWritten += self._ReportFileWritten(outputManifestPath)
+            result.success = bool(compositeResult)
+            self._observer.Message("Writing successful!")
         else:
-            print "Failed to pack images into image of desired dimensions."
+            self._observer.Message("Failed to pack images into image of desired dimensions.")
+
+        if spriteCache is not None:
+            spriteCache.Save()
 
-        print "Packing complete!"
+        return result
 
+    def PackInMemory(self, images, minImageSize, maxImageSize, manifestMode, outputImageName="atlas.png", padding=2, cropColor=(0,0,0,0), allowNonPowerOfTwo=False, sortMode="name", packer="skyline", allowRotation=False, deduplicate=False, multiPage=False, manifestFormat="xml", observer=None, extrude=False, blockAlign=False, polygonVertices=None, gridLayout=None, pixelFormat=None, dither=False):
+        """Packs images held in memory into an atlas without touching the disk
 
-    def Slice(self, imageFilepath, tileSize):
-        print "Slicing image %s..." % os.path.basename(imageFilepath)
+        images: A list of (name, image) tuples, where image is a PIL image or
+        the encoded image data as a string, bytearray or memoryview
+        outputImageName: Name of the atlas image in the manifest, pages are
+        numbered just like the files written by Pack
+        observer: A PackObserver receiving the progress and measurements
+        pixelFormat: Convert the page images to fewer bits per pixel, just like Pack
 
-        if self._SliceImage(imageFilepath, tileSize):
-            print "Slicing successful!"
-        else:
-            print "Slicing failed!"
+        Returns a PackResult instance holding the page images in images and
+        the manifest in manifestData"""
+        settings = PackSettings(minImageSize, maxImageSize, padding, allowNonPowerOfTwo, sortMode, packer, allowRotation, deduplicate, multiPage, extrude=extrude, blockAlign=blockAlign, polygonVertices=polygonVertices, gridLayout=gridLayout, pixelFormat=pixelFormat, dither=dither)
+        self._CheckSettings(settings)
+        self._observer = observer if observer is not None else PackObserver()
+
+        try:
+            result = self._PackInMemory(images, settings, manifestMode, manifestFormat, outputImageName, cropColor)
+        finally:
+            # Release the cropped images.
+            self._imageCache.Clear()
+            self._observer = PackObserver()
+
+        return result
+
+    def _PackInMemory(self, images, settings, manifestMode, manifestFormat, outputImageName, cropColor):
+        result = PackResult()
+        result.imageCount = len(images)
+        assert(len(set(name for name, source in images)) == len(images))
+
+        # Decode and crop the images.
+        with self._Stage("crop"):
+            imageInfoList = self._CropImagesInMemory(images, cropColor)
+
+        # Trace a tighter polygon around every trimmed image if asked to.
+        if cropColor is not None and settings.polygonVertices is not None:
+            with self._Stage("polygon"):
+                self._FindPolygons(imageInfoList, cropColor, settings.polygonVertices)
+
+        # Only pack one copy of identical images.
+        aliasImageInfoList = []
+        if settings.deduplicate:
+            with self._Stage("deduplicate"):
+                imageInfoList, aliasImageInfoList = self._DeduplicateImages(imageInfoList)
+            result.duplicateCount = len(aliasImageInfoList)
+
+        # Pack the images.
+        with self._Stage("pack"):
+            pages, grid = self._PackLayout(imageInfoList, settings)
+
+        if pages is None:
+            self._observer.Message("Failed to pack images into image of desired dimensions.")
+            return result
+
+        packedImageDict = self._CollectPages(pages, aliasImageInfoList, outputImageName, result)
+
+        # Pick the pixel format of the pages.
+        outputFormat = None
+        if settings.pixelFormat is not None:
+            with self._Stage("format"):
+                outputFormat = self._ChooseOutputFormat(packedImageDict, settings)
+            result.pixelFormat = outputFormat.name
+
+        # Composite the pages.
+        compositeResult = True
+        with self._Stage("composite"):
+            for imageSize, pagePackedImageDict in pages:
+                pageResult, outImage = self._CompositeImage(imageSize, settings.padding, pagePackedImageDict, settings.extrude)
+                compositeResult = compositeResult and pageResult
+                result.images.append(self._ConvertPixelFormat(outImage, outputFormat) if outputFormat is not None else outImage)
+
+        # Write the manifest into a buffer.
+        pageFiles = [(pagePath, imageSize) for pagePath, imageSize, occupancy in result.pages]
+        manifestFile = io.BytesIO()
+        with self._Stage("manifest"):
+            self._WriteManifest(manifestFile, pages[0][0], manifestMode, packedImageDict, pageFiles, manifestFormat, grid if not aliasImageInfoList else None, result.pixelFormat)
+        result.manifestData = manifestFile.getvalue()
+        result.success = compositeResult
 
-        print "Slicing complete!"
+        return result
+
+    def Slice(self, imageFilepath, tileSize, workers=1, skipUniformTiles=False, observer=None, encodeProfile="balanced"):
+        """Slices an image into tiles
+
+        observer: A PackObserver receiving the progress and measurements
+
+        Returns whether slicing succeeded"""
+        self._observer = observer if observer is not None else PackObserver()
+
+        try:
+            self._observer.Message("Slicing image %s..." % os.path.basename(imageFilepath))
+
+            with self._Stage("slice"):
+                result = self._SliceImage(imageFilepath, tileSize, workers, skipUniformTiles, encodeProfile)
+
+            if result:
+                self._observer.Message("Slicing successful!")
+            else:
+                self._observer.Message("Slicing failed!")
+
+            self._observer.Message("Slicing complete!")
+        finally:
+            self._observer = PackObserver()
+
+        return result
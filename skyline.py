@@ -0,0 +1,206 @@
+"""This library is free software; you can redistribute it and/or
+modify it under the terms of the IBM Common Public License as
+published by the IBM Corporation; either version 1.0 of the
+License, or (at your option) any later version.
+
+This library is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+IBM Common Public License for more details.
+
+You should have received a copy of the IBM Common Public
+License along with this library
+"""
+from array import array
+from bisect import bisect_left
+from collections import deque
+from cygon import Point, RectanglePacker
+
+class SkylineRectanglePacker(RectanglePacker):
+    """Array backed implementation of the Cygon skyline packer
+
+    Places rectangles exactly where CygonRectanglePacker would, but keeps the
+    silhouette in two parallel arrays of slice starts and heights instead of
+    a list of Point objects. Instead of rescanning every covered slice for
+    each candidate position, the highest covered slice is tracked with a
+    sliding window maximum, so finding a placement is linear in the number of
+    slices rather than quadratic."""
+
+    def __init__(self, packingAreaWidth, packingAreaHeight):
+        """Initializes a new rectangle packer
+
+        packingAreaWidth: Maximum width of the packing area
+        packingAreaHeight: Maximum height of the packing area"""
+        RectanglePacker.__init__(self, packingAreaWidth, packingAreaHeight)
+
+        # Stores the height silhouette of the rectangles. At the beginning,
+        # the packing area is a single slice of height 0
+        self.sliceStarts = array("d", [0])
+        self.sliceHeights = array("d", [0])
+
+    def TryPack(self, rectangleWidth, rectangleHeight):
+        """Tries to allocate space for a rectangle in the packing area
+
+        rectangleWidth: Width of the rectangle to allocate
+        rectangleHeight: Height of the rectangle to allocate
+
+        Returns a Point instance if space for the rectangle could be allocated
+        be found, otherwise returns None"""
+        # If the rectangle is larger than the packing area in any dimension,
+        # it will never fit!
+        if rectangleWidth > self.packingAreaWidth or rectangleHeight > \
+        self.packingAreaHeight:
+            return None
+
+        # Determine the placement for the new rectangle
+        placement = self.tryFindBestPlacement(rectangleWidth, rectangleHeight)
+
+        # If a place for the rectangle could be found, update the height slice
+        # table to mark the region of the rectangle as being taken.
+        if placement:
+            self.integrateRectangle(placement.x, rectangleWidth, placement.y \
+            + rectangleHeight)
+
+        return placement
+
+    def TryPackWithRotation(self, rectangleWidth, rectangleHeight):
+        """Tries to allocate space for a rectangle in the packing area in
+        whichever orientation ends up lower
+
+        rectangleWidth: Width of the rectangle to allocate
+        rectangleHeight: Height of the rectangle to allocate
+
+        Returns a tuple of the Point instance or None and whether the rectangle
+        was rotated"""
+        bestPlacement = (None, False)
+        bestBottom = None
+
+        for rotated in [False, True]:
+            width, height = (rectangleHeight, rectangleWidth) if rotated else (rectangleWidth, rectangleHeight)
+            if width > self.packingAreaWidth or height > self.packingAreaHeight:
+                continue
+
+            placement = self.tryFindBestPlacement(width, height)
+            if placement is not None and (bestBottom is None or placement.y + height < bestBottom):
+                bestPlacement = (placement, rotated)
+                bestBottom = placement.y + height
+
+        placement, rotated = bestPlacement
+        if placement is not None:
+            width, height = (rectangleHeight, rectangleWidth) if rotated else (rectangleWidth, rectangleHeight)
+            self.integrateRectangle(placement.x, width, placement.y + height)
+
+        return bestPlacement
+
+    def tryFindBestPlacement(self, rectangleWidth, rectangleHeight):
+        """Finds the best position for a rectangle of the given dimensions
+
+        rectangleWidth: Width of the rectangle to find a position for
+        rectangleHeight: Height of the rectangle to find a position for
+
+        Returns a Point instance if a valid placement for the rectangle could
+        be found, otherwise returns None"""
+        sliceStarts = self.sliceStarts
+        sliceHeights = self.sliceHeights
+        sliceCount = len(sliceStarts)
+
+        # Slice index, vertical position and score of the best placement we
+        # could find. lower == better!
+        bestSliceIndex = -1
+        bestSliceY = 0
+        bestScore = self.packingAreaWidth * self.packingAreaHeight
+
+        # The rectangle covers the slices from leftSliceIndex up to, but not
+        # including, rightSliceIndex.
+        leftSliceIndex = 0
+        rightSliceIndex = bisect_left(sliceStarts, rectangleWidth)
+
+        # Indices of the covered slices in order of decreasing height, so the
+        # highest covered slice is always at the front of the window.
+        window = deque()
+        windowEnd = 0
+
+        while rightSliceIndex <= sliceCount:
+            # Slide the window over the slices covered by the rectangle.
+            coveredEnd = max(rightSliceIndex, leftSliceIndex + 1)
+            while windowEnd < coveredEnd:
+                height = sliceHeights[windowEnd]
+                while window and sliceHeights[window[-1]] <= height:
+                    window.pop()
+                window.append(windowEnd)
+                windowEnd += 1
+            while window[0] < leftSliceIndex:
+                window.popleft()
+
+            # We cannot put the rectangle any lower than the highest slice it
+            # covers without overlapping the other rectangles.
+            highest = sliceHeights[window[0]]
+
+            # Only process this position if it doesn't leave the packing area
+            if highest + rectangleHeight < self.packingAreaHeight:
+                if highest < bestScore:
+                    bestSliceIndex = leftSliceIndex
+                    bestSliceY = highest
+                    bestScore = highest
+
+            # Advance the starting slice to the next slice start
+            leftSliceIndex += 1
+            if leftSliceIndex >= sliceCount:
+                break
+
+            # Advance the ending slice until we're on the proper slice again,
+            # given the new starting position of the rectangle.
+            rightRectangleEnd = sliceStarts[leftSliceIndex] + rectangleWidth
+            while rightSliceIndex <= sliceCount:
+                if rightSliceIndex == sliceCount:
+                    rightSliceStart = self.packingAreaWidth
+                else:
+                    rightSliceStart = sliceStarts[rightSliceIndex]
+
+                # Is this the slice we're looking for?
+                if rightSliceStart > rightRectangleEnd:
+                    break
+
+                rightSliceIndex += 1
+
+            # If we crossed the end of the slice array, the rectangle's right
+            # end has left the packing area, and thus, our search ends.
+            if rightSliceIndex > sliceCount:
+                break
+
+        if bestSliceIndex == -1:
+            return None
+        else:
+            return Point(sliceStarts[bestSliceIndex], bestSliceY)
+
+    def integrateRectangle(self, left, width, bottom):
+        """Integrates a new rectangle into the height slice table
+
+        left: Position of the rectangle's left side
+        width: Width of the rectangle
+        bottom: Position of the rectangle's lower side"""
+        sliceStarts = self.sliceStarts
+        sliceHeights = self.sliceHeights
+
+        # Placements always start on a slice, so replace the slice we hit
+        startSlice = bisect_left(sliceStarts, left)
+        firstSliceOriginalHeight = sliceHeights[startSlice]
+        sliceStarts[startSlice] = left
+        sliceHeights[startSlice] = bottom
+
+        right = left + width
+        startSlice += 1
+
+        if startSlice >= len(sliceStarts):
+            # The rectangle started on the last slice, so add another slice
+            # to return to the original height at the end of the rectangle
+            # unless it reaches the end of the packing area.
+            if right < self.packingAreaWidth:
+                sliceStarts.append(right)
+                sliceHeights.append(firstSliceOriginalHeight)
+        else:
+            # Remove all slices starting below the rectangle, just like
+            # CygonRectanglePacker does.
+            endSlice = bisect_left(sliceStarts, right, startSlice, len(sliceStarts))
+            del sliceStarts[startSlice:endSlice]
+            del sliceHeights[startSlice:endSlice]
@@ -0,0 +1,125 @@
+"""
+pytex
+Copyright (C) 2015  Gregory Mitrano
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along
+with this program; if not, write to the Free Software Foundation, Inc.,
+51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+import hashlib
+import json
+import os
+
+# Bump this whenever the layout of the cache changes.
+CACHE_VERSION = 1
+
+class SpriteCache(object):
+    """A persistent cache of trimmed images and atlas layouts
+
+    Every image is keyed by its path, file size and modification time. When
+    the size or modification time changed, the content hash of the file
+    decides whether the cached bounding box and cropped pixels are still
+    valid."""
+
+    def __init__(self, cacheDir):
+        self.cacheDir = cacheDir
+        self._indexPath = os.path.join(cacheDir, "index.json")
+        self._sprites = dict()
+        self._layouts = dict()
+
+        if not os.path.exists(cacheDir):
+            os.makedirs(cacheDir)
+
+        # Load the index, starting over if it's missing, broken or outdated.
+        try:
+            with open(self._indexPath, "rb") as file:
+                index = json.load(file)
+            if index.get("version") == CACHE_VERSION:
+                self._sprites = index["sprites"]
+                self._layouts = index["layouts"]
+        except (IOError, ValueError, KeyError):
+            pass
+
+    def _HashFile(self, path):
+        with open(path, "rb") as file:
+            return hashlib.sha1(file.read()).hexdigest()
+
+    def GetBlobPath(self, entry):
+        return os.path.join(self.cacheDir, entry["contentHash"] + ".raw")
+
+    def Lookup(self, path, cropColor):
+        """Returns the cache entry for an image, or None if there is no valid one"""
+        entry = self._sprites.get(path)
+        if entry is None or entry["cropColor"] != list(cropColor) or not os.path.exists(self.GetBlobPath(entry)):
+            return None
+
+        try:
+            fileStat = os.stat(path)
+            if entry["fileSize"] == fileStat.st_size and entry["fileTime"] == fileStat.st_mtime:
+                return entry
+
+            # The file was touched, only its contents tell whether it really changed.
+            if entry["fileHash"] != self._HashFile(path):
+                return None
+        except (IOError, OSError):
+            return None
+
+        entry["fileSize"] = fileStat.st_size
+        entry["fileTime"] = fileStat.st_mtime
+        return entry
+
+    def Store(self, path, cropColor, imageInfo, image):
+        """Stores the bounding box and cropped pixels of an image"""
+        fileStat = os.stat(path)
+        entry = {
+            "fileSize": fileStat.st_size,
+            "fileTime": fileStat.st_mtime,
+            "fileHash": self._HashFile(path),
+            "cropColor": list(cropColor),
+            "boundingBox": list(imageInfo.boundingBox),
+            "containsAlpha": imageInfo.containsAlpha,
+            "contentHash": imageInfo.contentHash,
+            "mode": image.mode,
+            "size": list(image.size),
+        }
+
+        # Identical images share their pixel data.
+        blobPath = self.GetBlobPath(entry)
+        if not os.path.exists(blobPath):
+            with open(blobPath, "wb") as file:
+                file.write(image.tobytes())
+
+        self._sprites[path] = entry
+
+    def GetLayout(self, outputPath):
+        return self._layouts.get(outputPath)
+
+    def SetLayout(self, outputPath, layout):
+        # Round trip the layout so it compares equal to the one loaded next time.
+        self._layouts[outputPath] = json.loads(json.dumps(layout))
+
+    def Save(self):
+        # Remove the pixel data nobody refers to anymore.
+        usedBlobs = set(os.path.basename(self.GetBlobPath(entry)) for entry in self._sprites.values())
+        for filename in os.listdir(self.cacheDir):
+            if filename.endswith(".raw") and filename not in usedBlobs:
+                os.remove(os.path.join(self.cacheDir, filename))
+
+        # Write the index to a temporary file first so a crash can't leave a broken index behind.
+        temporaryPath = self._indexPath + ".tmp"
+        with open(temporaryPath, "wb") as file:
+            json.dump({"version": CACHE_VERSION, "sprites": self._sprites, "layouts": self._layouts}, file)
+        if os.name == "nt" and os.path.exists(self._indexPath):
+            os.remove(self._indexPath)
+        os.rename(temporaryPath, self._indexPath)
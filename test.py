@@ -1,6 +1,28 @@
+import io
+import json
 import os
+import random
+import shutil
+import struct
+import tempfile
 import unittest
+import batch
+import imagecache
+import manifest
+import numpy
+import observer
+import pngstream
 import pytex
+import texcompress
+import watch
+import workerpool
+from benchmark import ScanBBox
+from cygon import CygonRectanglePacker
+from guillotine import GuillotineRectanglePacker
+from maxrects import MaxRectsRectanglePacker
+from skyline import SkylineRectanglePacker
+from PIL import Image, ImageDraw
+from xml.etree import ElementTree
 
 class TestPyTex(unittest.TestCase):
 
@@ -18,7 +40,11 @@ class TestPyTex(unittest.TestCase):
         self._padding = 2
         self._cropColor = (0, 0, 0, 0)
         self._outputImageName = "Test.png"
+        self._streamedOutputImageName = "TestStreamed.png"
+        self._compressedOutputImageName = "TestCompressed.dds"
         self._outputManifestName = "Test.xml"
+        self._outputJsonManifestName = "Test.json"
+        self._outputBinaryManifestName = "Test.bin"
         self._sliceTestImage = "SliceTest.png"
 
     def tearDown(self):
@@ -26,6 +52,81 @@ class TestPyTex(unittest.TestCase):
         self._imageFilenames = None
         self._packer = None
 
+    def test_FindBBox(self):
+        for filename in self._imageFilenames:
+            image = Image.open(filename).convert("RGBA")
+            for color in [self._cropColor, image.getpixel((0, 0))]:
+                self.assertEqual(self._packer._FindBBox(image, color), ScanBBox(image, color), "Mismatched bounding box for filename %s!" % filename)
+
+        emptyImage = Image.new("RGBA", (16, 8))
+        self.assertEqual(self._packer._FindBBox(emptyImage, self._cropColor), (0, 0, 16, 8), "Empty images should keep their full bounds!")
+
+    def test_ImageCache(self):
+        images = dict((filename, Image.open(filename).convert("RGBA")) for filename in self._imageFilenames)
+        cache = pytex.ImageCache(max(image.size[0] * image.size[1] * 4 for image in images.values()))
+        for filename, image in images.iteritems():
+            cache.Put(filename, image)
+        for filename, image in images.iteritems():
+            self.assertEqual(cache.Get(filename).tobytes(), image.tobytes(), "Cached image for filename %s doesn't match!" % filename)
+        cache.Clear()
+
+        # Worker buffers in shared memory count against the budget, the rest go to the disk.
+        cache = pytex.ImageCache(100)
+        try:
+            image = Image.new("RGBA", (4, 4), (255, 0, 0, 255))
+            sharedPath = cache.NewBufferPath(80)
+            diskPath = cache.NewBufferPath(80)
+            self.assertEqual(os.path.dirname(sharedPath) != os.path.dirname(diskPath), imagecache.SHARED_MEMORY_DIR is not None)
+            for key, bufferPath in [("shared", sharedPath), ("disk", diskPath)]:
+                with open(bufferPath, "wb") as file:
+                    file.write(image.tobytes())
+                cache.PutBuffer(key, bufferPath, image.mode, image.size)
+                self.assertEqual(cache.Get(key).tobytes(), image.tobytes())
+            self.assertEqual(os.path.dirname(cache.NewBufferPath(36)), os.path.dirname(sharedPath))
+            cache.Put("image", image)
+            self.assertEqual(cache._bytes, 0, "Image was kept in memory beyond the budget!")
+
+            # A buffer that can't be written goes to the disk path instead.
+            fallbackPath = cache.NewBufferPath(shared=False)
+            cropResult = pytex._CropImageWorker((self._imageFilenames[0], self._cropColor, os.path.join(tempfile.gettempdir(), "missing", "buffer.raw"), fallbackPath))
+            self.assertEqual(cropResult[6], fallbackPath)
+            cache.PutBuffer("fallback", fallbackPath, cropResult[1], cropResult[2])
+            self.assertEqual(cache.Get("fallback").size, cropResult[2])
+        finally:
+            cache.Clear()
+
+    def test_SpriteCache(self):
+        cacheDir = tempfile.mkdtemp()
+        imageFilename = os.path.join(cacheDir, "image.png")
+        shutil.copyfile(self._imageFilenames[0], imageFilename)
+
+        try:
+            imageInfoList = self._packer._GetImageInfo([imageFilename])
+            self._packer._CropBoundingBoxesCached(imageInfoList, self._cropColor, pytex.SpriteCache(cacheDir))
+            croppedImage = self._packer._LoadCroppedImage(imageInfoList[0])
+
+            # A touched but unchanged image is still valid.
+            os.utime(imageFilename, (0, 0))
+            spriteCache = pytex.SpriteCache(cacheDir)
+            self.assertTrue(spriteCache.Lookup(imageFilename, self._cropColor) is None, "Sprite cache wasn't saved, but it has an entry!")
+            spriteCache.Store(imageFilename, self._cropColor, imageInfoList[0], croppedImage)
+            spriteCache.Save()
+            os.utime(imageFilename, None)
+
+            spriteCache = pytex.SpriteCache(cacheDir)
+            entry = spriteCache.Lookup(imageFilename, self._cropColor)
+            self.assertTrue(entry is not None, "Missing sprite cache entry for touched image!")
+            self.assertEqual(tuple(entry["boundingBox"]), tuple(imageInfoList[0].boundingBox))
+            with open(spriteCache.GetBlobPath(entry), "rb") as file:
+                self.assertEqual(file.read(), croppedImage.tobytes(), "Cached pixels don't match!")
+
+            # A changed image isn't.
+            Image.new("RGBA", (3, 3), (255, 0, 0, 255)).save(imageFilename)
+            self.assertTrue(spriteCache.Lookup(imageFilename, self._cropColor) is None, "Sprite cache entry for changed image is still valid!")
+        finally:
+            self._packer._imageCache.Clear()
+            shutil.rmtree(cacheDir)
+
     def test_GetImageInfo(self):
         for imageInfo in self._packer._GetImageInfo(self._imageFilenames):
             self.assertTrue(imageInfo.path in self._imageFilenames, "Missing ImageInfo for filename %s!" % imageInfo.path)
@@ -34,12 +135,114 @@ class TestPyTex(unittest.TestCase):
         imageInfoList = self._packer._GetImageInfo(self._imageFilenames)
         self.assertTrue(self._packer._CropBoundingBoxes(imageInfoList, self._cropColor), "Failed to calculate crop bounding boxes!")
 
+    def test_CropBoundingBoxesParallel(self):
+        imageInfoList = self._packer._GetImageInfo(self._imageFilenames)
+        self._packer._CropBoundingBoxes(imageInfoList, self._cropColor)
+        serialImages = dict((imageInfo.path, (imageInfo.boundingBox, self._packer._LoadCroppedImage(imageInfo).tobytes())) for imageInfo in imageInfoList)
+
+        parallelPacker = pytex.AtlasPacker()
+        parallelPacker._StartWorkers(2)
+        try:
+            imageInfoList = parallelPacker._GetImageInfo(self._imageFilenames)
+            self.assertTrue(parallelPacker._CropBoundingBoxes(imageInfoList, self._cropColor), "Failed to calculate crop bounding boxes in parallel!")
+            for imageInfo in imageInfoList:
+                parallelImage = (imageInfo.boundingBox, parallelPacker._LoadCroppedImage(imageInfo).tobytes())
+                self.assertEqual(parallelImage, serialImages[imageInfo.path], "Mismatched parallel crop for filename %s!" % imageInfo.path)
+        finally:
+            parallelPacker._StopWorkers()
+            parallelPacker._imageCache.Clear()
+
+    def test_DeduplicateImages(self):
+        # Make a copy of every image under a different name.
+        aliasDir = tempfile.mkdtemp()
+        aliasFilenames = []
+        for filename in self._imageFilenames:
+            aliasFilenames.append(os.path.join(aliasDir, "alias_" + os.path.basename(filename)))
+            shutil.copyfile(filename, aliasFilenames[-1])
+
+        try:
+            imageInfoList = self._packer._GetImageInfo(self._imageFilenames + aliasFilenames)
+            self._packer._CropBoundingBoxes(imageInfoList, self._cropColor)
+            uniqueImageInfoList, aliasImageInfoList = self._packer._DeduplicateImages(imageInfoList)
+            self.assertTrue(len(aliasImageInfoList) >= len(self._imageFilenames), "Duplicate images weren't detected!")
+            self.assertEqual(len(uniqueImageInfoList) + len(aliasImageInfoList), len(imageInfoList))
+
+            packedImageDict = self._packer._PackImages(uniqueImageInfoList, self._padding, self._imageSize)[1]
+            self._packer._AddAliases(packedImageDict, aliasImageInfoList)
+            for imageInfo in aliasImageInfoList:
+                self.assertTrue(packedImageDict[imageInfo.path][1] is packedImageDict[imageInfo.aliasOf][1], "Alias doesn't share its packed image!")
+        finally:
+            shutil.rmtree(aliasDir)
+
     def test_PackImages(self):
         imageInfoList = self._packer._GetImageInfo(self._imageFilenames)
         self._packer._CropBoundingBoxes(imageInfoList, self._cropColor)
         packingResult = self._packer._PackImages(imageInfoList, self._padding, self._imageSize)[0]
         self.assertTrue(packingResult, "Failed to pack images into atlas!")
 
+    def test_PackAtlas(self):
+        imageInfoList = self._packer._GetImageInfo(self._imageFilenames)
+        self._packer._CropBoundingBoxes(imageInfoList, self._cropColor)
+
+        # The area driven search should never do worse than doubling a square size.
+        squareSize = (128, 128)
+        while not self._packer._PackImages(imageInfoList, self._padding, squareSize)[0]:
+            squareSize = (squareSize[0] * 2, squareSize[1] * 2)
+        imageSize = self._packer._PackAtlas(imageInfoList, pytex.PackSettings((128, 128), self._imageSize, self._padding))[0]
+        self.assertTrue(imageSize[0] * imageSize[1] <= squareSize[0] * squareSize[1], "Power of two search found a larger atlas than doubling!")
+
+        nonPowerOfTwoSize = self._packer._PackAtlas(imageInfoList, pytex.PackSettings((128, 128), self._imageSize, self._padding, True))[0]
+        self.assertTrue(nonPowerOfTwoSize[0] * nonPowerOfTwoSize[1] <= imageSize[0] * imageSize[1], "Non power of two search found a larger atlas!")
+
+    def test_PackAtlasBest(self):
+        imageInfoList = self._packer._GetImageInfo(self._imageFilenames)
+        self._packer._CropBoundingBoxes(imageInfoList, self._cropColor)
+        settings = pytex.PackSettings((128, 128), self._imageSize, self._padding)
+        bestSize = self._packer._PackAtlasBest(imageInfoList, settings)[0]
+        for sortMode in pytex.SORT_MODES:
+            imageSize = self._packer._PackAtlasSorted(imageInfoList, settings, sortMode)[0]
+            self.assertTrue(bestSize[0] * bestSize[1] <= imageSize[0] * imageSize[1], "Best packing is larger than sort mode %s!" % sortMode)
+
+    def test_PackImagesWithPackers(self):
+        imageInfoList = self._packer._GetImageInfo(self._imageFilenames)
+        self._packer._CropBoundingBoxes(imageInfoList, self._cropColor)
+        for packer in pytex.PACKERS:
+            packingResult = self._packer._PackImages(imageInfoList, self._padding, self._imageSize, packer)[0]
+            self.assertTrue(packingResult, "Failed to pack images into atlas with packer %s!" % packer)
+
+    def test_PackImagesWithRotation(self):
+        imageInfoList = self._packer._GetImageInfo(self._imageFilenames)
+        self._packer._CropBoundingBoxes(imageInfoList, self._cropColor)
+        for packer in pytex.PACKERS:
+            packingResult, packedImageDict = self._packer._PackImages(imageInfoList, self._padding, self._imageSize, packer, True)
+            self.assertTrue(packingResult, "Failed to pack images into atlas with rotation using packer %s!" % packer)
+
+            # Rotated images swap their packed dimensions.
+            for imageInfo, packedImageInfo in packedImageDict.values():
+                imageWidth, imageHeight = self._packer._GetImageSize(imageInfo)
+                if packedImageInfo.rotated:
+                    imageWidth, imageHeight = (imageHeight, imageWidth)
+                self.assertAlmostEqual(packedImageInfo.packedBoundingBox[2] * self._imageSize[0], imageWidth)
+                self.assertAlmostEqual(packedImageInfo.packedBoundingBox[3] * self._imageSize[1], imageHeight)
+
+    def test_PackPages(self):
+        imageInfoList = self._packer._GetImageInfo(self._imageFilenames)
+        self._packer._CropBoundingBoxes(imageInfoList, self._cropColor)
+
+        # Use maximum sizes that are too small for a single page, including one that isn't a power of two.
+        singlePageSize = self._packer._PackAtlas(imageInfoList, pytex.PackSettings((16, 16), self._imageSize, self._padding))[0]
+        for maxImageSize in [(singlePageSize[0] / 2, singlePageSize[1] / 2), (singlePageSize[0] * 3 / 4, singlePageSize[1] * 3 / 4)]:
+            pages = self._packer._PackPages(imageInfoList, pytex.PackSettings((16, 16), maxImageSize, self._padding, multiPage=True))
+            self.assertTrue(pages is not None and len(pages) > 1, "Failed to pack images into several pages of %dx%d!" % maxImageSize)
+
+            packedImagePaths = set()
+            for pageIndex, (imageSize, packedImageDict) in enumerate(pages):
+                self.assertTrue(imageSize[0] <= maxImageSize[0] and imageSize[1] <= maxImageSize[1], "Page %d exceeds the maximum size!" % pageIndex)
+                for imageInfo, packedImageInfo in packedImageDict.values():
+                    self.assertEqual(packedImageInfo.page, pageIndex)
+                    packedImagePaths.add(imageInfo.path)
+            self.assertEqual(packedImagePaths, set(imageInfo.path for imageInfo in imageInfoList))
+
     def test_CompositePackedImages(self):
         imageInfoList = self._packer._GetImageInfo(self._imageFilenames)
         self._packer._CropBoundingBoxes(imageInfoList, self._cropColor)
@@ -47,6 +250,120 @@ class TestPyTex(unittest.TestCase):
         compositeResult = self._packer._CompositePackedImages(self._outputImageName, self._imageSize, self._padding, packedImageDict)
         self.assertTrue(compositeResult, "Failed to composite images into atlas image!")
 
+    def test_CompositePackedImagesStreamed(self):
+        imageInfoList = self._packer._GetImageInfo(self._imageFilenames)
+        self._packer._CropBoundingBoxes(imageInfoList, self._cropColor)
+        packedImageDict = self._packer._PackImages(imageInfoList, self._padding, self._imageSize)[1]
+        self._packer._CompositePackedImages(self._outputImageName, self._imageSize, self._padding, packedImageDict)
+        compositeResult = self._packer._CompositePackedImages(self._streamedOutputImageName, self._imageSize, self._padding, packedImageDict, 100)
+        self.assertTrue(compositeResult, "Failed to composite images into atlas image in strips!")
+        self.assertEqual(Image.open(self._streamedOutputImageName).tobytes(), Image.open(self._outputImageName).tobytes(), "Atlas composited in strips doesn't match!")
+
+    def test_PngStreamWriter(self):
+        # Smooth gradients only compress well once the rows are filtered.
+        image = Image.merge("RGBA", [Image.linear_gradient("L").resize((300, 200)), Image.radial_gradient("L").resize((300, 200)), \
+            Image.linear_gradient("L").rotate(90).resize((300, 200)), Image.new("L", (300, 200), 255)])
+        for mode in ["RGBA", "RGB", "L"]:
+            modeImage = image.convert(mode)
+            expectedFile = io.BytesIO()
+            modeImage.save(expectedFile, "PNG", compress_level=6)
+
+            # Write the rows in strips of odd sizes, so filtering has to carry across them.
+            streamedFile = io.BytesIO()
+            writer = pngstream.PngStreamWriter(streamedFile, modeImage.size, mode, 6)
+            for stripTop in xrange(0, modeImage.size[1], 37):
+                writer.WriteRows(modeImage.crop((0, stripTop, modeImage.size[0], min(stripTop + 37, modeImage.size[1]))).tobytes())
+            writer.Close()
+
+            streamedFile.seek(0)
+            self.assertEqual(Image.open(streamedFile).tobytes(), modeImage.tobytes(), "Streamed %s image doesn't match!" % mode)
+            self.assertTrue(len(streamedFile.getvalue()) < len(expectedFile.getvalue()) * 1.25, "Streamed %s image is %d bytes, PIL wrote %d!" % (mode, len(streamedFile.getvalue()), len(expectedFile.getvalue())))
+
+    def test_CompositeEncodeProfiles(self):
+        imageInfoList = self._packer._GetImageInfo(self._imageFilenames)
+        self._packer._CropBoundingBoxes(imageInfoList, self._cropColor)
+        packedImageDict = self._packer._PackImages(imageInfoList, self._padding, self._imageSize)[1]
+
+        # Every profile has to produce the same pixels, only the file size differs.
+        statsObserver = observer.StatsObserver()
+        self._packer._observer = statsObserver
+        self._packer._CompositePackedImages(self._outputImageName, self._imageSize, self._padding, packedImageDict)
+        expectedData = Image.open(self._outputImageName).tobytes()
+        for encodeProfile in sorted(pytex.ENCODE_PROFILES.keys()):
+            for stripHeight in [None, 100]:
+                self._packer._CompositePackedImages(self._streamedOutputImageName, self._imageSize, self._padding, packedImageDict, stripHeight, encodeProfile)
+                self.assertEqual(Image.open(self._streamedOutputImageName).tobytes(), expectedData, "Atlas encoded with profile %s doesn't match!" % encodeProfile)
+                self.assertEqual(statsObserver.encodes[self._streamedOutputImageName]["encodeProfile"], encodeProfile)
+
+    def test_LoadPaddedImageExtruded(self):
+        imageInfoList = self._packer._GetImageInfo(self._imageFilenames)
+        self._packer._CropBoundingBoxes(imageInfoList, self._cropColor)
+        imageInfo = imageInfoList[0]
+        image = self._packer._LoadCroppedImage(imageInfo)
+        paddedImage = self._packer._LoadPaddedImage(imageInfo, pytex.PackedImageInfo((0, 0), [0, 0, 0, 0], (0, 0)), self._padding, True)
+
+        # The image sits in the middle and its edges repeat all the way out to the corners.
+        width, height = image.size
+        self.assertEqual(paddedImage.size, (width + self._padding * 2, height + self._padding * 2))
+        self.assertEqual(paddedImage.crop((self._padding, self._padding, self._padding + width, self._padding + height)).tobytes(), image.tobytes())
+        self.assertEqual(paddedImage.getpixel((0, 0)), image.getpixel((0, 0)))
+        self.assertEqual(paddedImage.getpixel((paddedImage.size[0] - 1, paddedImage.size[1] - 1)), image.getpixel((width - 1, height - 1)))
+        self.assertEqual(paddedImage.getpixel((0, self._padding + height / 2)), image.getpixel((0, height / 2)))
+        self.assertEqual(paddedImage.getpixel((self._padding + width / 2, 0)), image.getpixel((width / 2, 0)))
+
+    def test_CompositeMipChain(self):
+        imageInfoList = self._packer._GetImageInfo(self._imageFilenames)
+        self._packer._CropBoundingBoxes(imageInfoList, self._cropColor)
+        packedImageDict = self._packer._PackImages(imageInfoList, self._padding, self._imageSize)[1]
+
+        # The levels have to come out the same whether the atlas is built in strips or not, whatever the filter and strip height.
+        for mipFilter, stripHeight in [("box", 100), ("lanczos", 100), ("lanczos", 7)]:
+            self._packer._CompositePackedImages(self._outputImageName, self._imageSize, self._padding, packedImageDict, None, "fast", True, mipFilter)
+            self._packer._CompositePackedImages(self._streamedOutputImageName, self._imageSize, self._padding, packedImageDict, stripHeight, "fast", True, mipFilter)
+            mipPaths = self._packer._GetMipPaths(self._outputImageName, self._imageSize)
+            streamedMipPaths = self._packer._GetMipPaths(self._streamedOutputImageName, self._imageSize)
+            self.assertEqual(len(mipPaths), 11)
+            for level, (mipPath, streamedMipPath) in enumerate(zip(mipPaths, streamedMipPaths)):
+                mipImage = Image.open(mipPath)
+                self.assertEqual(mipImage.size, (self._imageSize[0] >> (level + 1), self._imageSize[1] >> (level + 1)))
+                self.assertEqual(mipImage.tobytes(), Image.open(streamedMipPath).tobytes(), "Mip level %d built in %s strips of %d rows doesn't match!" % (level + 1, mipFilter, stripHeight))
+
+    def test_PackImagesBlockAligned(self):
+        imageInfoList = self._packer._GetImageInfo(self._imageFilenames)
+        self._packer._CropBoundingBoxes(imageInfoList, self._cropColor)
+        for packer in sorted(pytex.PACKERS.keys()):
+            packedImageDict = self._packer._PackImages(imageInfoList, 1, self._imageSize, packer, blockAlign=True)[1]
+            self.assertEqual(len(packedImageDict), len(imageInfoList))
+            for imageInfo, packedImageInfo in packedImageDict.values():
+                self.assertEqual([coordinate % pytex.BLOCK_ALIGNMENT for coordinate in packedImageInfo.packPosition], [0, 0], "Packer %s placed %s off the block grid!" % (packer, imageInfo.path))
+
+    def test_CompositeCompressed(self):
+        imageInfoList = self._packer._GetImageInfo(self._imageFilenames)
+        self._packer._CropBoundingBoxes(imageInfoList, self._cropColor)
+        packedImageDict = self._packer._PackImages(imageInfoList, self._padding, self._imageSize, blockAlign=True)[1]
+        pngImage = self._packer._CompositeImage(self._imageSize, self._padding, packedImageDict)[1]
+        pixels = numpy.asarray(pngImage).astype(int)
+
+        # Pillow reads the BC formats back from DDS, which have to stay close to the original pixels.
+        for textureFormat in ["bc1", "bc3"]:
+            self._packer._CompositePackedImages(self._compressedOutputImageName, self._imageSize, self._padding, packedImageDict, textureFormat=textureFormat)
+            decodedPixels = numpy.asarray(Image.open(self._compressedOutputImageName).convert("RGBA")).astype(int)
+            opaque = pixels[..., 3] == 255
+            self.assertLess(numpy.abs(decodedPixels - pixels)[opaque].mean(), 8, "Format %s is too far off!" % textureFormat)
+            self.assertTrue((decodedPixels[pixels[..., 3] == 0, 3] == 0).all(), "Format %s lost transparent pixels!" % textureFormat)
+
+        # ETC1 goes through the reference decoder and only has color.
+        decodedPixels = texcompress.DecodeETC1(texcompress.Encode(numpy.asarray(pngImage), "etc1"), self._imageSize).astype(int)
+        self.assertLess(numpy.abs(decodedPixels - pixels[..., :3]).mean(), 8)
+
+        # Mip levels go into the same file, halving down to a single pixel.
+        self._packer._CompositePackedImages(self._compressedOutputImageName, self._imageSize, self._padding, packedImageDict, mipFilter="box", textureFormat="bc1")
+        self.assertEqual(os.path.getsize(self._compressedOutputImageName), 128 + sum(max(1, (size + 3) / 4) ** 2 * 8 for size in [2048 >> level for level in xrange(12)]))
+
+        # Containers that can't hold the format are refused before anything is packed.
+        for outputImageName, textureFormat in [(self._outputImageName, "bc1"), (self._compressedOutputImageName, "etc1"), (self._compressedOutputImageName, "bc7")]:
+            self.assertRaises(ValueError, self._packer.Pack, ["missing.png"], (128, 128), self._imageSize, "uv", outputImageName, self._outputManifestName, textureFormat=textureFormat)
+
     def test_WriteManifestForImages(self):
         imageInfoList = self._packer._GetImageInfo(self._imageFilenames)
         self._packer._CropBoundingBoxes(imageInfoList, self._cropColor)
@@ -54,10 +371,453 @@ class TestPyTex(unittest.TestCase):
         self._packer._WriteManifestForImages(self._outputManifestName, self._imageSize, "uv", packedImageDict)
         self._packer._WriteManifestForImages(self._outputManifestName, self._imageSize, "pixel", packedImageDict) 
 
+    def test_WriteManifestFormats(self):
+        imageInfoList = self._packer._GetImageInfo(self._imageFilenames)
+        self._packer._CropBoundingBoxes(imageInfoList, self._cropColor)
+        packedImageDict = self._packer._PackImages(imageInfoList, self._padding, self._imageSize)[1]
+        self._packer._WriteManifestForImages(self._outputJsonManifestName, self._imageSize, "pixel", packedImageDict, manifestFormat="json")
+        self._packer._WriteManifestForImages(self._outputBinaryManifestName, self._imageSize, "pixel", packedImageDict, manifestFormat="binary")
+
+        # Both formats have to describe the same images.
+        with open(self._outputJsonManifestName, "rb") as file:
+            jsonManifest = json.load(file)
+        with open(self._outputBinaryManifestName, "rb") as file:
+            mode, size, pages, images, grid, pixelFormat = manifest.ReadBinaryManifest(file.read())
+        self.assertEqual(mode, "pixel")
+        self.assertEqual(size, self._imageSize)
+        self.assertEqual(len(images), len(packedImageDict))
+        self.assertTrue(grid is None)
+
+        # The binary records have to be sorted by name.
+        self.assertEqual([image.name for image in images], sorted(image.name for image in images))
+
+        jsonImageDict = dict((image["name"], image) for image in jsonManifest["images"])
+        for image in images:
+            jsonImage = jsonImageDict[image.name]
+            self.assertEqual(image.rotated, jsonImage["rotated"])
+            self.assertEqual(image.coordinates, (jsonImage["x1"], jsonImage["y1"], jsonImage["x2"], jsonImage["y2"]))
+
+        # Version 2 files only lack the grid, so without one they read the same.
+        with open(self._outputBinaryManifestName, "rb") as file:
+            data = file.read()
+        self.assertEqual(manifest.BINARY_HEADER.unpack_from(data, 0)[1], 3)
+        versionTwoData = data[:4] + struct.pack("<H", 2) + data[6:]
+        versionTwoImages = manifest.ReadBinaryManifest(versionTwoData)[3]
+        self.assertEqual([(image.name, image.coordinates) for image in versionTwoImages], [(image.name, image.coordinates) for image in images])
+
+        # Version 3 files carry the grid.
+        packResult = self._packer.PackInMemory([("frame%d.png" % i, Image.new("RGBA", (8, 8), (i, 0, 0, 255))) for i in xrange(4)], (16, 16), (64, 64), "pixel", manifestFormat="binary")
+        self.assertTrue(manifest.ReadBinaryManifest(packResult.manifestData)[4] is not None)
+
+    def test_PackWithObserver(self):
+        tempDir = tempfile.mkdtemp()
+        try:
+            statsObserver = observer.StatsObserver()
+            outputImagePath = os.path.join(tempDir, self._outputImageName)
+            outputManifestPath = os.path.join(tempDir, self._outputManifestName)
+            packResult = self._packer.Pack(self._imageFilenames, (128, 128), self._imageSize, "uv", outputImagePath, outputManifestPath, observer=statsObserver)
+            self.assertTrue(packResult.success, "Failed to pack images!")
+            self.assertEqual(packResult.imageCount, len(self._imageFilenames))
+            self.assertEqual([pagePath for pagePath, imageSize, occupancy in packResult.pages], [outputImagePath])
+            self.assertEqual(packResult.bytesWritten, os.path.getsize(outputImagePath) + os.path.getsize(outputManifestPath))
+
+            # Every stage and image has to be measured.
+            stats = statsObserver.GetStats()
+            self.assertEqual(sorted(stats["stages"].keys()), ["composite", "crop", "info", "manifest", "pack"])
+            self.assertEqual(sorted(stats["images"].keys()), sorted(self._imageFilenames))
+            self.assertTrue(stats["sizeAttempts"][-1]["success"])
+            self.assertEqual(stats["sizeAttempts"][-1]["placedCount"], len(self._imageFilenames))
+            self.assertEqual(stats["bytesWritten"], packResult.bytesWritten)
+
+            # The best sort mode has to report the attempts of every mode, whether they run on workers or not.
+            for workers in [1, 2]:
+                statsObserver = observer.StatsObserver()
+                packResult = self._packer.Pack(self._imageFilenames, (128, 128), self._imageSize, "uv", outputImagePath, outputManifestPath, workers=workers, sortMode="best", observer=statsObserver)
+                self.assertTrue(packResult.success, "Failed to pack images with the best sort mode!")
+                stats = statsObserver.GetStats()
+                self.assertEqual(sum(1 for sizeAttempt in stats["sizeAttempts"] if sizeAttempt["success"]), len(pytex.SORT_MODES))
+                self.assertTrue(stats["placementCount"] >= len(pytex.SORT_MODES) * len(self._imageFilenames))
+        finally:
+            shutil.rmtree(tempDir)
+
+    def test_PackInMemory(self):
+        tempDir = tempfile.mkdtemp()
+        try:
+            outputImagePath = os.path.join(tempDir, self._outputImageName)
+            outputManifestPath = os.path.join(tempDir, self._outputManifestName)
+            self._packer.Pack(self._imageFilenames, (128, 128), self._imageSize, "pixel", outputImagePath, outputManifestPath)
+
+            # Hand the images over as decoded images, strings and memoryviews.
+            images = []
+            for index, imageFilename in enumerate(sorted(self._imageFilenames)):
+                with open(imageFilename, "rb") as file:
+                    imageData = file.read()
+                sources = [Image.open(imageFilename), imageData, memoryview(imageData)]
+                images.append((os.path.basename(imageFilename), sources[index % len(sources)]))
+
+            # The result has to match what Pack wrote to disk.
+            packResult = self._packer.PackInMemory(images, (128, 128), self._imageSize, "pixel", self._outputImageName)
+            self.assertTrue(packResult.success, "Failed to pack images in memory!")
+            self.assertEqual(len(packResult.images), 1)
+            self.assertEqual(packResult.images[0].tobytes(), Image.open(outputImagePath).tobytes(), "Atlas packed in memory doesn't match!")
+            with open(outputManifestPath, "rb") as file:
+                self.assertEqual(packResult.manifestData, file.read(), "Manifest written in memory doesn't match!")
+        finally:
+            shutil.rmtree(tempDir)
+
+    def _GenerateShapes(self, count):
+        # The test images are all rectangles, so draw some ellipses and triangles to trim.
+        rng = random.Random(0)
+        shapes = []
+        for i in xrange(count):
+            image = Image.new("RGBA", (rng.randint(8, 96), rng.randint(8, 96)))
+            box = [0, 0, image.size[0] - 1, image.size[1] - 1]
+            if i % 2 == 0:
+                ImageDraw.Draw(image).ellipse(box, fill=(255, 0, 0, 255))
+            else:
+                ImageDraw.Draw(image).polygon([(rng.randint(0, box[2]), 0), (box[2], box[3]), (0, rng.randint(0, box[3]))], fill=(0, 255, 0, 255))
+            shapes.append(("shape%02d.png" % i, image))
+        return shapes
+
+    def test_FindPolygon(self):
+        polygonCount = 0
+        for name, image in self._GenerateShapes(20):
+            image = image.crop(self._packer._FindBBox(image, self._cropColor))
+            polygon = self._packer._FindPolygon(image, self._cropColor, 8)
+            if polygon is None:
+                continue
+            polygonCount += 1
+            self.assertTrue(3 <= len(polygon) <= 8)
+            self.assertLess(self._packer._GetPolygonArea(polygon), image.size[0] * image.size[1] * pytex.POLYGON_MAX_COVERAGE)
+
+            # Every corner of every content pixel has to be inside all edges of the polygon.
+            rows, columns = numpy.nonzero(self._packer._GetContentMask(image, self._cropColor))
+            for cornerX, cornerY in [(columns, rows), (columns + 1, rows), (columns, rows + 1), (columns + 1, rows + 1)]:
+                for start, end in zip(polygon, polygon[1:] + polygon[:1]):
+                    cross = (end[0] - start[0]) * (cornerY - start[1]) - (end[1] - start[1]) * (cornerX - start[0])
+                    self.assertTrue((cross >= -0.05 * max(abs(end[0] - start[0]), abs(end[1] - start[1]), 1)).all(), "Polygon of %s cuts off content!" % name)
+
+        self.assertTrue(polygonCount > 10, "No image got a polygon!")
+
+    def test_PackWithPolygons(self):
+        images = [(os.path.basename(imageFilename), Image.open(imageFilename)) for imageFilename in sorted(self._imageFilenames)] + self._GenerateShapes(10)
+        for manifestFormat in ["json", "binary"]:
+            packResult = self._packer.PackInMemory(images, (128, 128), self._imageSize, "pixel", allowRotation=True, manifestFormat=manifestFormat, polygonVertices=6)
+            self.assertTrue(packResult.success, "Failed to pack images with polygons!")
+            if manifestFormat == "json":
+                jsonImages = json.loads(packResult.manifestData)["images"]
+            else:
+                binaryImages = manifest.ReadBinaryManifest(packResult.manifestData)[3]
+
+        # The vertices lie inside the rectangle of their image, in both pixels and uvs.
+        polygonImages = [image for image in jsonImages if "vertices" in image]
+        self.assertTrue(polygonImages, "No polygons in the manifest!")
+        for image in polygonImages:
+            self.assertTrue(len(image["vertices"]) <= 6)
+            for (x, y), (u, v) in zip(image["vertices"], image["uvs"]):
+                self.assertTrue(image["x1"] - 0.01 <= x <= image["x2"] + 0.01 and image["y1"] - 0.01 <= y <= image["y2"] + 0.01, "Vertex of %s outside its rectangle!" % image["name"])
+                self.assertAlmostEqual(u, x / float(packResult.pages[0][1][0]))
+                self.assertAlmostEqual(v, y / float(packResult.pages[0][1][1]))
+
+        # The binary manifest has to hold the same polygons.
+        for jsonImage, binaryImage in zip(jsonImages, binaryImages):
+            self.assertEqual(jsonImage["name"], binaryImage.name)
+            if "vertices" in jsonImage:
+                for vertex, binaryVertex in zip(jsonImage["vertices"], binaryImage.vertices):
+                    self.assertAlmostEqual(vertex[0], binaryVertex[0], 3)
+                    self.assertAlmostEqual(vertex[1], binaryVertex[1], 3)
+            else:
+                self.assertTrue(binaryImage.vertices is None)
+
+    def test_PackGrid(self):
+        frames = [("frame%04d.png" % i, Image.new("RGBA", (20, 12), (i % 256, i / 256, 0, 255))) for i in xrange(1000)]
+        for maxImageSize, pageCount in [(self._imageSize, 1), ((256, 256), 7), ((200, 200), 11)]:
+            packResult = self._packer.PackInMemory(frames, (128, 128), maxImageSize, "pixel", manifestFormat="binary", multiPage=True)
+            self.assertTrue(packResult.success, "Failed to pack frames into a grid!")
+            self.assertEqual(len(packResult.pages), pageCount)
+            for pagePath, pageSize, occupancy in packResult.pages:
+                self.assertTrue(pageSize[0] <= maxImageSize[0] and pageSize[1] <= maxImageSize[1], "Grid page %s exceeds the maximum size!" % pagePath)
+            mode, size, pages, images, grid, pixelFormat = manifest.ReadBinaryManifest(packResult.manifestData)
+            self.assertEqual((grid.cellSize, grid.padding), ((24, 16), 2))
+
+            # Every frame has to be where the grid says it is.
+            for index, image in enumerate(images):
+                cell = index % grid.imagesPerPage
+                x = (cell % grid.columns) * grid.cellSize[0] + grid.padding
+                y = (cell / grid.columns) * grid.cellSize[1] + grid.padding
+                self.assertEqual((image.page, tuple(image.coordinates)), (index / grid.imagesPerPage, (x, y, x + 20, y + 12)), "Frame %s is off the grid!" % image.name)
+                pageImage = packResult.images[image.page]
+                self.assertEqual(pageImage.getpixel((x, y)), (index % 256, index / 256, 0, 255))
+
+        # Images of different sizes are only put into a grid when asked to.
+        images = [(os.path.basename(imageFilename), Image.open(imageFilename)) for imageFilename in sorted(self._imageFilenames)]
+        self.assertTrue(manifest.ReadBinaryManifest(self._packer.PackInMemory(images, (128, 128), self._imageSize, "pixel", manifestFormat="binary").manifestData)[4] is None)
+        grid = manifest.ReadBinaryManifest(self._packer.PackInMemory(images, (128, 128), self._imageSize, "pixel", manifestFormat="binary", gridLayout=True).manifestData)[4]
+        self.assertEqual(grid.imagesPerPage, len(images))
+
+        # A grid picked on its own takes precedence over the packing options and has to say so.
+        class MessageObserver(observer.PackObserver):
+            def __init__(self):
+                self.messages = []
+            def Message(self, text):
+                self.messages.append(text)
+        for gridLayout, expectGrid in [(None, True), (False, False)]:
+            messageObserver = MessageObserver()
+            packResult = self._packer.PackInMemory(frames[:16], (128, 128), self._imageSize, "pixel", manifestFormat="binary", packer="maxrects", sortMode="area", allowRotation=True, gridLayout=gridLayout, observer=messageObserver)
+            self.assertEqual(manifest.ReadBinaryManifest(packResult.manifestData)[4] is not None, expectGrid)
+            self.assertEqual(any("overrides packer maxrects" in message for message in messageObserver.messages), expectGrid)
+
+    def test_PixelFormat(self):
+        random.seed(25)
+        def Noise(size, gray, alpha):
+            def Pixel():
+                color = chr(random.randrange(256)) * 3 if gray else "".join(chr(random.randrange(256)) for channel in xrange(3))
+                return color + chr(random.randrange(256) if alpha else 255)
+            return Image.frombytes("RGBA", size, "".join(Pixel() for i in xrange(size[0] * size[1])))
+
+        # Every lossless format has to hold the pixels of the atlas exactly.
+        grayImages = [("gray%d.png" % i, Noise((16, 16), True, False)) for i in xrange(4)]
+        colorImages = [("color%d.png" % i, Noise((16, 16), False, True)) for i in xrange(4)]
+        opaqueImages = [(name, image.convert("RGB")) for name, image in colorImages]
+        fewColorImages = [(os.path.basename(imageFilename), Image.open(imageFilename)) for imageFilename in sorted(self._imageFilenames)]
+        for images, pixelFormat in [(grayImages, "l8"), (opaqueImages, "rgb888"), (colorImages, "rgba8888"), (fewColorImages, "p8")]:
+            packResult = self._packer.PackInMemory(images, (128, 128), self._imageSize, "pixel", manifestFormat="binary", pixelFormat="auto")
+            expectedImage = self._packer.PackInMemory(images, (128, 128), self._imageSize, "pixel").images[0]
+            self.assertEqual(packResult.pixelFormat, pixelFormat)
+            self.assertEqual(manifest.ReadBinaryManifest(packResult.manifestData)[5], pixelFormat)
+            self.assertEqual(packResult.images[0].mode, pytex.PIXEL_FORMATS[pixelFormat])
+
+            # The empty space of opaque atlases turns black.
+            if pixelFormat in ["l8", "rgb888"]:
+                expectedImage = Image.alpha_composite(Image.new("RGBA", expectedImage.size, (0, 0, 0, 255)), expectedImage)
+            self.assertEqual(packResult.images[0].convert("RGBA").tobytes(), expectedImage.tobytes(), "Pixels lost in %s!" % pixelFormat)
+
+        # The lossy formats keep only their bits of every channel, with or without dithering.
+        for dither in [False, True]:
+            packResult = self._packer.PackInMemory(colorImages, (128, 128), self._imageSize, "pixel", pixelFormat="rgba4444", dither=dither)
+            self.assertTrue(all(ord(value) % 17 == 0 for value in packResult.images[0].tobytes()))
+
+        # Unknown formats and pixel formats for compressed atlases are refused up front.
+        self.assertRaises(ValueError, self._packer.PackInMemory, colorImages, (128, 128), self._imageSize, "pixel", pixelFormat="rgb332")
+        self.assertRaises(ValueError, self._packer.Pack, ["missing.png"], (128, 128), self._imageSize, "uv", self._compressedOutputImageName, self._outputManifestName, textureFormat="bc1", pixelFormat="auto")
+
+        # Dithering and polygons are refused up front without numpy.
+        pytex.numpy = None
+        try:
+            self.assertRaises(ValueError, self._packer.PackInMemory, colorImages, (128, 128), self._imageSize, "pixel", pixelFormat="rgb565", dither=True)
+            self.assertRaises(ValueError, self._packer.PackInMemory, colorImages, (128, 128), self._imageSize, "pixel", polygonVertices=8)
+        finally:
+            pytex.numpy = numpy
+
+        # Atlases written in strips have to match the ones written whole, and the manifest has to name the format.
+        tempDir = tempfile.mkdtemp()
+        try:
+            outputImagePath = os.path.join(tempDir, self._outputImageName)
+            streamedOutputImagePath = os.path.join(tempDir, self._streamedOutputImageName)
+            outputManifestPath = os.path.join(tempDir, self._outputManifestName)
+            for pixelFormat in ["auto", "rgb565"]:
+                self._packer.Pack(self._imageFilenames, (128, 128), self._imageSize, "uv", outputImagePath, outputManifestPath, pixelFormat=pixelFormat, dither=True)
+                packResult = self._packer.Pack(self._imageFilenames, (128, 128), self._imageSize, "uv", streamedOutputImagePath, outputManifestPath, stripHeight=30, pixelFormat=pixelFormat, dither=True)
+                self.assertTrue(packResult.success, "Failed to pack atlas as %s!" % pixelFormat)
+                self.assertEqual(ElementTree.parse(outputManifestPath).getroot().get("format"), packResult.pixelFormat)
+                self.assertEqual(Image.open(streamedOutputImagePath).convert("RGBA").tobytes(), Image.open(outputImagePath).convert("RGBA").tobytes(), "Atlas written in strips doesn't match!")
+        finally:
+            shutil.rmtree(tempDir)
+
+    def test_BatchBuilder(self):
+        tempDir = tempfile.mkdtemp()
+        try:
+            # Write a few small images into a directory for each job and describe the jobs, plus two broken ones.
+            random.seed(24)
+            jobImageCounts = [12, 7, 3]
+            jobConfigs = []
+            for jobIndex, imageCount in enumerate(jobImageCounts):
+                jobDir = os.path.join(tempDir, "job%d" % jobIndex)
+                os.mkdir(jobDir)
+                for imageIndex in xrange(imageCount):
+                    color = (random.randrange(256), random.randrange(256), random.randrange(256), 255)
+                    Image.new("RGBA", (random.randint(4, 24), random.randint(4, 24)), color).save(os.path.join(jobDir, "image%02d.png" % imageIndex))
+                jobConfigs.append({"name": "job%d" % jobIndex, "inputs": ["job%d/*.png" % jobIndex], "minSize": [128, 128], "maxSize": list(self._imageSize), \
+                    "outputImage": "job%d.png" % jobIndex, "outputManifest": "job%d.xml" % jobIndex, "options": {"padding": jobIndex}})
+            jobConfigs.append({"name": "broken", "inputs": ["job0/*.png"], "minSize": [128, 128], "maxSize": [128, 128], "outputImage": "broken.png", "outputManifest": "broken.xml", "options": {"packer": "missing"}})
+            jobConfigs.append({"name": "empty", "inputs": ["missing/*.png"], "minSize": [128, 128], "maxSize": [128, 128], "outputImage": "empty.png", "outputManifest": "empty.xml"})
+            configPath = os.path.join(tempDir, "batch.json")
+            with open(configPath, "wb") as file:
+                json.dump({"jobs": jobConfigs}, file)
+
+            # The broken jobs must not take the others down, whether they run on the pool or not.
+            for workers in [1, 2]:
+                results = batch.BatchBuilder(workers).Build(batch.LoadBatchJobs(configPath))
+                self.assertEqual([result.name for result in results], ["job0", "job1", "job2", "broken", "empty"])
+                self.assertEqual([result.Succeeded() for result in results], [True, True, True, False, False])
+                self.assertTrue("ValueError" in results[3].error)
+                for jobIndex, imageCount in enumerate(jobImageCounts):
+                    self.assertEqual(results[jobIndex].packResult.imageCount, imageCount)
+                    self.assertTrue(os.path.exists(os.path.join(tempDir, "job%d.png" % jobIndex)))
+                    os.remove(os.path.join(tempDir, "job%d.png" % jobIndex))
+
+            # The workers belong to the whole batch.
+            jobConfigs[0]["options"]["workers"] = 4
+            with open(configPath, "wb") as file:
+                json.dump({"jobs": jobConfigs}, file)
+            self.assertRaises(ValueError, batch.LoadBatchJobs, configPath)
+        finally:
+            shutil.rmtree(tempDir)
+
+    def test_WorkerPool(self):
+        workerPool = pytex.NewWorkerPool(2)
+        try:
+            self.assertEqual(workerPool.map(abs, range(-20, 0), 3), range(20, 0, -1))
+
+            # Errors come back as they are, a worker dying fails the call instead of hanging it and gets replaced.
+            self.assertRaises(ValueError, workerPool.map, int, ["1", "x"])
+            self.assertRaises(workerpool.WorkerDiedError, workerPool.map, os._exit, [3])
+            self.assertEqual(workerPool.map(abs, [-1, -2], 1), [1, 2])
+
+            # Packers share the pool without closing it.
+            for i in xrange(2):
+                packResult = pytex.AtlasPacker(workerPool=workerPool).Pack(self._imageFilenames, (128, 128), self._imageSize, "uv", self._outputImageName, self._outputManifestName, sortMode="best")
+                self.assertTrue(packResult.success)
+        finally:
+            workerPool.close()
+            workerPool.join()
+
+    def test_PackIncremental(self):
+        tempDir = tempfile.mkdtemp()
+        try:
+            imagePaths = [os.path.join(tempDir, "a.png"), os.path.join(tempDir, "b.png")]
+            Image.new("RGBA", (40, 40), (0, 0, 255, 255)).save(imagePaths[0])
+            Image.new("RGBA", (50, 50), (255, 0, 0, 255)).save(imagePaths[1])
+            cacheDir = os.path.join(tempDir, "cache")
+            outputImagePath = os.path.join(tempDir, self._outputImageName)
+            outputManifestPath = os.path.join(tempDir, self._outputManifestName)
+            self.assertTrue(self._packer.Pack(imagePaths, (128, 128), self._imageSize, "pixel", outputImagePath, outputManifestPath, cacheDir=cacheDir).success)
+
+            # Shrink one of the images without moving it, the rebuild has to match building from scratch.
+            image = Image.new("RGBA", (50, 50))
+            image.paste((0, 255, 0, 255), (0, 0, 30, 30))
+            image.save(imagePaths[1])
+            self.assertTrue(self._packer.Pack(imagePaths, (128, 128), self._imageSize, "pixel", outputImagePath, outputManifestPath, cacheDir=cacheDir).success)
+            fullOutputImagePath = os.path.join(tempDir, self._streamedOutputImageName)
+            self.assertTrue(self._packer.Pack(imagePaths, (128, 128), self._imageSize, "pixel", fullOutputImagePath, outputManifestPath).success)
+            self.assertEqual(Image.open(outputImagePath).tobytes(), Image.open(fullOutputImagePath).tobytes(), "Rebuilt atlas doesn't match a full build!")
+        finally:
+            shutil.rmtree(tempDir)
+
+    def test_AtlasWatcher(self):
+        tempDir = tempfile.mkdtemp()
+        try:
+            imageDir = os.path.join(tempDir, "res")
+            shutil.copytree("res", imageDir)
+            outputImagePath = os.path.join(tempDir, self._outputImageName)
+            outputManifestPath = os.path.join(tempDir, self._outputManifestName)
+
+            watcher = watch.AtlasWatcher(imageDir, (128, 128), self._imageSize, "pixel", outputImagePath, outputManifestPath, debounceInterval=0.5)
+            try:
+                self.assertTrue(watcher.Build().success, "Failed to build atlas!")
+                self.assertEqual(watcher.Poll(), None)
+
+                # Paint over one of the images, the rebuild waits until the changes settle down.
+                imagePath = os.path.join(imageDir, sorted(os.listdir(imageDir))[0])
+                image = Image.open(imagePath).convert("RGBA")
+                image.paste((255, 0, 255, 255), (0, 0) + image.size)
+                image.save(imagePath)
+                os.utime(imagePath, (0, 0))
+
+                now = 1000.0
+                self.assertEqual(watcher.Poll(now), None)
+                self.assertEqual(watcher.Poll(now + 0.25), None)
+                self.assertTrue(watcher.Poll(now + 0.5).success, "Failed to rebuild atlas!")
+                self.assertEqual(watcher.Poll(now + 1.0), None)
+
+                # The atlas has to show the new pixels.
+                imageNode = [node for node in ElementTree.parse(outputManifestPath).getroot().findall("image") if node.get("name") == os.path.basename(imagePath)][0]
+                self.assertEqual(Image.open(outputImagePath).convert("RGBA").getpixel((int(imageNode.get("x1")), int(imageNode.get("y1")))), (255, 0, 255, 255))
+            finally:
+                watcher.Close()
+        finally:
+            shutil.rmtree(tempDir)
+
     def test_SliceImage(self):
         sliceResult = self._packer._SliceImage(self._sliceTestImage, (256, 256))
         self.assertTrue(sliceResult, "Failed to slice image!")
 
+    def test_SliceImageSkipUniformTiles(self):
+        tempDir = tempfile.mkdtemp()
+        try:
+            # An image that isn't a multiple of the tile size with content in one corner only.
+            imagePath = os.path.join(tempDir, "Map.png")
+            image = Image.new("RGBA", (300, 200))
+            image.paste((255, 0, 0, 255), (10, 10, 20, 20))
+            image.save(imagePath)
+
+            sliceResult = self._packer._SliceImage(imagePath, (128, 128), 4, True)
+            self.assertTrue(sliceResult, "Failed to slice image!")
+
+            # Only the tile with content gets written, padded to the full tile size.
+            outputDir = os.path.join(tempDir, "Map")
+            self.assertEqual(sorted(os.listdir(outputDir)), ["0_0.png", "index.xml"])
+            tileImage = Image.open(os.path.join(outputDir, "0_0.png"))
+            self.assertEqual(tileImage.size, (128, 128))
+            self.assertEqual(tileImage.getpixel((15, 15)), (255, 0, 0, 255))
+
+            # The index lists every tile.
+            tileNodes = ElementTree.parse(os.path.join(outputDir, "index.xml")).getroot().findall("tile")
+            self.assertEqual(len(tileNodes), 6)
+            self.assertEqual(len([tileNode for tileNode in tileNodes if tileNode.get("color") == "0,0,0,0"]), 5)
+        finally:
+            shutil.rmtree(tempDir)
+
+class TestRectanglePackers(unittest.TestCase):
+
+    def setUp(self):
+        # Generate a repeatable set of rectangles.
+        rng = random.Random(0)
+        self._rectangles = [(rng.randint(1, 64), rng.randint(1, 64)) for i in xrange(500)]
+        self._packingAreaSize = (1024, 1024)
+
+    def test_SkylineMatchesCygon(self):
+        cygonPacker = CygonRectanglePacker(*self._packingAreaSize)
+        skylinePacker = SkylineRectanglePacker(*self._packingAreaSize)
+        for rectangle in self._rectangles:
+            cygonPoint = cygonPacker.Pack(*rectangle)
+            skylinePoint = skylinePacker.Pack(*rectangle)
+            if cygonPoint is None:
+                self.assertEqual(skylinePoint, None, "Skyline packer placed rectangle %dx%d Cygon couldn't!" % rectangle)
+            else:
+                self.assertEqual((skylinePoint.x, skylinePoint.y), (cygonPoint.x, cygonPoint.y), "Mismatched placement for rectangle %dx%d!" % rectangle)
+
+    def _AssertPackedWithoutOverlaps(self, packer):
+        packedRectangles = []
+        for rectangle in self._rectangles:
+            point = packer.Pack(*rectangle)
+            if point is None:
+                continue
+
+            # Make sure the rectangle stays inside the packing area and doesn't overlap any other.
+            x1, y1, x2, y2 = (point.x, point.y, point.x + rectangle[0], point.y + rectangle[1])
+            self.assertTrue(x1 >= 0 and y1 >= 0 and x2 <= self._packingAreaSize[0] and y2 <= self._packingAreaSize[1], "Rectangle packed outside of the packing area!")
+            for otherX1, otherY1, otherX2, otherY2 in packedRectangles:
+                self.assertFalse(x1 < otherX2 and otherX1 < x2 and y1 < otherY2 and otherY1 < y2, "Packed rectangles overlap!")
+            packedRectangles.append((x1, y1, x2, y2))
+
+        self.assertTrue(len(packedRectangles) > 0, "Failed to pack any rectangles!")
+
+    def test_PackWithRotation(self):
+        # Tall rectangles only fit when rotated.
+        for packerClass in [CygonRectanglePacker, SkylineRectanglePacker, MaxRectsRectanglePacker, GuillotineRectanglePacker]:
+            packer = packerClass(64, 16)
+            point, rotated = packer.TryPackWithRotation(8, 48)
+            self.assertTrue(point is not None and rotated, "%s didn't rotate a rectangle that only fits rotated!" % packerClass.__name__)
+
+    def test_MaxRects(self):
+        for heuristic in MaxRectsRectanglePacker.HEURISTICS:
+            self._AssertPackedWithoutOverlaps(MaxRectsRectanglePacker(self._packingAreaSize[0], self._packingAreaSize[1], heuristic))
+
+    def test_Guillotine(self):
+        for heuristic in GuillotineRectanglePacker.HEURISTICS:
+            self._AssertPackedWithoutOverlaps(GuillotineRectanglePacker(self._packingAreaSize[0], self._packingAreaSize[1], heuristic))
+
 if __name__ == "__main__":
-    suite = unittest.TestLoader().loadTestsFromTestCase(TestPyTex)
+    suite = unittest.TestSuite([unittest.TestLoader().loadTestsFromTestCase(testCase) for testCase in [TestPyTex, TestRectanglePackers]])
     unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,298 @@
+"""
+pytex
+Copyright (C) 2015  Gregory Mitrano
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along
+with this program; if not, write to the Free Software Foundation, Inc.,
+51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+import numpy
+import struct
+
+# Width and height of a compression block in pixels.
+BLOCK_SIZE = 4
+
+# Blocks are encoded in chunks of this many to bound the size of the temporary arrays.
+CHUNK_BLOCKS = 4096
+
+# Intensity modifiers of the ETC1 codeword tables, in pixel index order.
+ETC1_MODIFIERS = numpy.array([
+    [2, 8, -2, -8],
+    [5, 17, -5, -17],
+    [9, 29, -9, -29],
+    [13, 42, -13, -42],
+    [18, 60, -18, -60],
+    [24, 80, -24, -80],
+    [33, 106, -33, -106],
+    [47, 183, -47, -183],
+], numpy.int32)
+
+def _GetBlocks(pixels):
+    # Repeat the last row and column up to whole blocks, then cut the pixels into rows of 4x4 blocks.
+    height, width = pixels.shape[:2]
+    paddedHeight = (height + BLOCK_SIZE - 1) / BLOCK_SIZE * BLOCK_SIZE
+    paddedWidth = (width + BLOCK_SIZE - 1) / BLOCK_SIZE * BLOCK_SIZE
+    if (paddedHeight, paddedWidth) != (height, width):
+        pixels = numpy.pad(pixels, ((0, paddedHeight - height), (0, paddedWidth - width), (0, 0)), "edge")
+
+    blocks = pixels.reshape(paddedHeight / BLOCK_SIZE, BLOCK_SIZE, paddedWidth / BLOCK_SIZE, BLOCK_SIZE, pixels.shape[2])
+    return blocks.transpose(0, 2, 1, 3, 4).reshape(-1, BLOCK_SIZE * BLOCK_SIZE, pixels.shape[2])
+
+def _PackBits(values, bitCount, offset=0):
+    # Pack the values of every block into one integer, the first value in the lowest bits.
+    shifts = numpy.arange(values.shape[1], dtype=numpy.uint64) * bitCount + offset
+    return numpy.bitwise_or.reduce(values.astype(numpy.uint64) << shifts, axis=1)
+
+def _Pack565(colors):
+    red = (colors[..., 0] * 31 + 127) / 255
+    green = (colors[..., 1] * 63 + 127) / 255
+    blue = (colors[..., 2] * 31 + 127) / 255
+    return (red << 11) | (green << 5) | blue
+
+def _Unpack565(packedColors):
+    red = (packedColors >> 11) & 31
+    green = (packedColors >> 5) & 63
+    blue = packedColors & 31
+    return numpy.stack([(red << 3) | (red >> 2), (green << 2) | (green >> 4), (blue << 3) | (blue >> 2)], -1)
+
+def _EncodeColorBlocks(blocks, punchThrough):
+    # Returns the endpoints and packed indices of the BC1 color blocks.
+    colors = blocks[..., :3].astype(numpy.int32)
+    if punchThrough:
+        transparent = blocks[..., 3] < 128
+    else:
+        transparent = numpy.zeros(blocks.shape[:2], bool)
+    hasTransparent = transparent.any(1)
+
+    # Only the opaque pixels decide the endpoints. Insetting the bounding box a little lowers the error of most blocks.
+    minColor = numpy.where(transparent[..., None], 255, colors).min(1)
+    maxColor = numpy.where(transparent[..., None], 0, colors).max(1)
+    empty = (minColor > maxColor).any(-1)
+    minColor[empty] = 0
+    maxColor[empty] = 0
+    inset = (maxColor - minColor) >> 4
+    color0 = _Pack565(maxColor - inset)
+    color1 = _Pack565(minColor + inset)
+
+    # Blocks with transparent pixels need the three color mode, which is picked by color0 <= color1.
+    color0, color1 = (numpy.where(hasTransparent, color1, color0), numpy.where(hasTransparent, color0, color1))
+    endpoint0 = _Unpack565(color0)
+    endpoint1 = _Unpack565(color1)
+    fourColorPalette = numpy.stack([endpoint0, endpoint1, (endpoint0 * 2 + endpoint1) / 3, (endpoint0 + endpoint1 * 2) / 3], 1)
+    threeColorPalette = numpy.stack([endpoint0, endpoint1, (endpoint0 + endpoint1) / 2, endpoint0], 1)
+    palette = numpy.where(hasTransparent[:, None, None], threeColorPalette, fourColorPalette)
+
+    # Pick the closest palette entry for every pixel, index 3 is transparent in three color mode.
+    distances = ((colors[:, :, None, :] - palette[:, None, :, :]) ** 2).sum(-1)
+    distances[:, :, 3] = numpy.where(hasTransparent[:, None], numpy.iinfo(numpy.int32).max, distances[:, :, 3])
+    indices = numpy.where(transparent, 3, distances.argmin(-1))
+
+    return (color0, color1, _PackBits(indices, 2))
+
+def _EncodeAlphaBlocks(blocks):
+    # Returns the BC3 alpha blocks as 64 bit integers.
+    alpha = blocks[..., 3].astype(numpy.int32)
+    alpha0 = alpha.max(1)
+    alpha1 = alpha.min(1)
+
+    # alpha0 > alpha1 picks the mode with six interpolated values. When they're equal every index picks alpha0.
+    weights = numpy.array([7, 0, 6, 5, 4, 3, 2, 1], numpy.int32)
+    palette = (alpha0[:, None] * weights + alpha1[:, None] * (7 - weights)) / 7
+    indices = numpy.abs(alpha[:, :, None] - palette[:, None, :]).argmin(-1)
+
+    return alpha0.astype(numpy.uint64) | (alpha1.astype(numpy.uint64) << 8) | _PackBits(indices, 3, 16)
+
+def _EncodeBC1Blocks(blocks):
+    color0, color1, indices = _EncodeColorBlocks(blocks, True)
+    encodedBlocks = numpy.zeros(len(blocks), [("color0", "<u2"), ("color1", "<u2"), ("indices", "<u4")])
+    encodedBlocks["color0"] = color0
+    encodedBlocks["color1"] = color1
+    encodedBlocks["indices"] = indices
+    return encodedBlocks
+
+def _EncodeBC3Blocks(blocks):
+    color0, color1, indices = _EncodeColorBlocks(blocks, False)
+    encodedBlocks = numpy.zeros(len(blocks), [("alpha", "<u8"), ("color0", "<u2"), ("color1", "<u2"), ("indices", "<u4")])
+    encodedBlocks["alpha"] = _EncodeAlphaBlocks(blocks)
+    encodedBlocks["color0"] = color0
+    encodedBlocks["color1"] = color1
+    encodedBlocks["indices"] = indices
+    return encodedBlocks
+
+def _GetETC1PixelBits(flip):
+    # Position of every subblock pixel in the ETC1 index bits, which run down the columns.
+    if flip:
+        return numpy.array([[x * 4 + y for y in xrange(subblock * 2, subblock * 2 + 2) for x in xrange(4)] for subblock in xrange(2)], numpy.uint64)
+    return numpy.array([[x * 4 + y for y in xrange(4) for x in xrange(subblock * 2, subblock * 2 + 2)] for subblock in xrange(2)], numpy.uint64)
+
+def _GetETC1Subblocks(blocks, flip):
+    # Split the blocks into two 2x4 subblocks side by side, or two 4x2 subblocks on top of each other.
+    pixels = blocks[..., :3].astype(numpy.int32).reshape(-1, 4, 4, 3)
+    if flip:
+        subblocks = [pixels[:, 0:2, :, :], pixels[:, 2:4, :, :]]
+    else:
+        subblocks = [pixels[:, :, 0:2, :], pixels[:, :, 2:4, :]]
+    return numpy.stack([subblock.reshape(-1, 8, 3) for subblock in subblocks], 1)
+
+def _FitETC1Subblocks(subblocks, baseColors):
+    # Find the codeword table and modifiers that best fit each subblock around its base color.
+    bestErrors = numpy.full(subblocks.shape[:2], numpy.iinfo(numpy.int32).max, numpy.int64)
+    bestTables = numpy.zeros(subblocks.shape[:2], numpy.int32)
+    for table in xrange(len(ETC1_MODIFIERS)):
+        candidates = numpy.clip(baseColors[:, :, None, :] + ETC1_MODIFIERS[table][None, None, :, None], 0, 255)
+        errors = ((subblocks[:, :, :, None, :] - candidates[:, :, None, :, :]) ** 2).sum(-1).min(-1).sum(-1)
+        better = errors < bestErrors
+        bestErrors = numpy.where(better, errors, bestErrors)
+        bestTables = numpy.where(better, table, bestTables)
+
+    candidates = numpy.clip(baseColors[:, :, None, :] + ETC1_MODIFIERS[bestTables][:, :, :, None], 0, 255)
+    indices = ((subblocks[:, :, :, None, :] - candidates[:, :, None, :, :]) ** 2).sum(-1).argmin(-1)
+    return (bestErrors.sum(1), bestTables, indices)
+
+def _EncodeETC1Blocks(blocks):
+    bestErrors = None
+    for flip in [0, 1]:
+        subblocks = _GetETC1Subblocks(blocks, flip)
+        averages = subblocks.mean(2)
+
+        # Differential mode stores 5 bit base colors, the second one within -4 and 3 of the first.
+        differentialColors = numpy.rint(averages * 31.0 / 255.0).astype(numpy.int32)
+        deltas = differentialColors[:, 1] - differentialColors[:, 0]
+        differentialValid = ((deltas >= -4) & (deltas <= 3)).all(-1)
+        deltas = numpy.clip(deltas, -4, 3)
+        differentialColors[:, 1] = differentialColors[:, 0] + deltas
+        differentialErrors, differentialTables, differentialIndices = _FitETC1Subblocks(subblocks, (differentialColors << 3) | (differentialColors >> 2))
+        differentialErrors = numpy.where(differentialValid, differentialErrors, numpy.iinfo(numpy.int64).max)
+
+        # Individual mode stores two independent 4 bit base colors.
+        individualColors = numpy.rint(averages * 15.0 / 255.0).astype(numpy.int32)
+        individualErrors, individualTables, individualIndices = _FitETC1Subblocks(subblocks, (individualColors << 4) | individualColors)
+
+        useDifferential = differentialErrors <= individualErrors
+        errors = numpy.where(useDifferential, differentialErrors, individualErrors)
+        tables = numpy.where(useDifferential[:, None], differentialTables, individualTables).astype(numpy.uint32)
+        indices = numpy.where(useDifferential[:, None, None], differentialIndices, individualIndices).astype(numpy.uint64)
+
+        # Put together the upper half of the block with the base colors, tables and mode bits.
+        differentialBits = ((differentialColors[:, 0] << numpy.array([27, 19, 11])) | ((deltas & 7) << numpy.array([24, 16, 8]))).sum(-1)
+        individualBits = ((individualColors[:, 0] << numpy.array([28, 20, 12])) | (individualColors[:, 1] << numpy.array([24, 16, 8]))).sum(-1)
+        high = numpy.where(useDifferential, differentialBits | 2, individualBits).astype(numpy.uint32) | (tables[:, 0] << 5) | (tables[:, 1] << 2) | flip
+
+        # The lower half holds the most significant index bits of all pixels above the least significant ones.
+        pixelBits = _GetETC1PixelBits(flip)
+        low = numpy.bitwise_or.reduce((((indices >> 1) << (pixelBits + 16)) | ((indices & 1) << pixelBits)).reshape(len(blocks), -1), axis=1)
+
+        # Keep the better of the two orientations.
+        if bestErrors is None:
+            bestErrors, bestHigh, bestLow = (errors, high, low)
+        else:
+            better = errors < bestErrors
+            bestErrors = numpy.where(better, errors, bestErrors)
+            bestHigh = numpy.where(better, high, bestHigh)
+            bestLow = numpy.where(better, low, bestLow)
+
+    encodedBlocks = numpy.zeros(len(blocks), [("high", ">u4"), ("low", ">u4")])
+    encodedBlocks["high"] = bestHigh
+    encodedBlocks["low"] = bestLow
+    return encodedBlocks
+
+def DecodeETC1(data, size):
+    """Decodes ETC1 data back into an array of RGB pixels, mostly useful for checking the encoder"""
+    blockCounts = ((size[1] + BLOCK_SIZE - 1) / BLOCK_SIZE, (size[0] + BLOCK_SIZE - 1) / BLOCK_SIZE)
+    encodedBlocks = numpy.frombuffer(data, [("high", ">u4"), ("low", ">u4")], blockCounts[0] * blockCounts[1])
+    high = encodedBlocks["high"].astype(numpy.int32)
+    low = encodedBlocks["low"].astype(numpy.int64)
+
+    # Recover the base colors of both subblocks.
+    differential = (high & 2) != 0
+    shifts = numpy.array([27, 19, 11])
+    color0 = (high[:, None] >> shifts) & 31
+    deltas = ((high[:, None] >> numpy.array([24, 16, 8])) & 7) ^ 4
+    color1 = color0 + deltas - 4
+    differentialColors = numpy.stack([(color0 << 3) | (color0 >> 2), (color1 << 3) | (color1 >> 2)], 1)
+    individual0 = (high[:, None] >> numpy.array([28, 20, 12])) & 15
+    individual1 = (high[:, None] >> numpy.array([24, 16, 8])) & 15
+    individualColors = numpy.stack([(individual0 << 4) | individual0, (individual1 << 4) | individual1], 1)
+    baseColors = numpy.where(differential[:, None, None], differentialColors, individualColors)
+    tables = numpy.stack([(high >> 5) & 7, (high >> 2) & 7], 1)
+
+    # Apply the modifier of every pixel, walking the pixels down the columns.
+    pixels = numpy.zeros((len(encodedBlocks), 4, 4, 3), numpy.int32)
+    flip = (high & 1) != 0
+    for x in xrange(4):
+        for y in xrange(4):
+            bit = x * 4 + y
+            index = (((low >> (bit + 16)) & 1) << 1) | ((low >> bit) & 1)
+            subblock = numpy.where(flip, y >= 2, x >= 2).astype(numpy.int32)
+            modifiers = ETC1_MODIFIERS[tables[numpy.arange(len(encodedBlocks)), subblock], index]
+            pixels[:, y, x] = numpy.clip(baseColors[numpy.arange(len(encodedBlocks)), subblock] + modifiers[:, None], 0, 255)
+
+    image = pixels.reshape(blockCounts[0], blockCounts[1], 4, 4, 3).transpose(0, 2, 1, 3, 4).reshape(blockCounts[0] * 4, blockCounts[1] * 4, 3)
+    return image[:size[1], :size[0]].astype(numpy.uint8)
+
+class TextureFormat(object):
+    """A small data structure describing a block compressed texture format"""
+
+    def __init__(self, blockBytes, encodeBlocks, fourCC, glInternalFormat, glBaseInternalFormat):
+        self.blockBytes = blockBytes
+        self.encodeBlocks = encodeBlocks
+        self.fourCC = fourCC
+        self.glInternalFormat = glInternalFormat
+        self.glBaseInternalFormat = glBaseInternalFormat
+
+# Supported block compressed formats. ETC1 has no standard DDS code, so it can only go into KTX files.
+TEXTURE_FORMATS = {
+    "bc1": TextureFormat(8, _EncodeBC1Blocks, "DXT1", 0x83F1, 0x1908),
+    "bc3": TextureFormat(16, _EncodeBC3Blocks, "DXT5", 0x83F3, 0x1908),
+    "etc1": TextureFormat(8, _EncodeETC1Blocks, None, 0x8D64, 0x1907),
+}
+
+def Encode(pixels, textureFormat):
+    """Compresses an array of RGBA pixels, rows of blocks follow each other from the top
+
+    pixels: A height x width x 4 array of unsigned bytes
+    textureFormat: Name of the format, one of TEXTURE_FORMATS"""
+    blocks = _GetBlocks(pixels)
+    encodeBlocks = TEXTURE_FORMATS[textureFormat].encodeBlocks
+    return "".join(encodeBlocks(blocks[start:start + CHUNK_BLOCKS]).tobytes() for start in xrange(0, len(blocks), CHUNK_BLOCKS))
+
+def WriteDDS(file, size, textureFormat, levels):
+    """Writes compressed mip levels, largest first, into a DDS file"""
+    assert(textureFormat.fourCC is not None)
+
+    # Capabilities, height, width, pixel format and linear size, plus the mip count if there are several levels.
+    flags = 0x1 | 0x2 | 0x4 | 0x1000 | 0x80000
+    caps = 0x1000
+    if len(levels) > 1:
+        flags |= 0x20000
+        caps |= 0x8 | 0x400000
+
+    file.write("DDS ")
+    file.write(struct.pack("<7I44x", 124, flags, size[1], size[0], len(levels[0]), 0, len(levels)))
+    file.write(struct.pack("<2I4s5I", 32, 0x4, textureFormat.fourCC, 0, 0, 0, 0, 0))
+    file.write(struct.pack("<4I4x", caps, 0, 0, 0))
+    for level in levels:
+        file.write(level)
+
+def WriteKTX(file, size, textureFormat, levels):
+    """Writes compressed mip levels, largest first, into a KTX file"""
+    file.write("\xabKTX 11\xbb\r\n\x1a\n")
+    file.write(struct.pack("<13I", 0x04030201, 0, 1, 0, textureFormat.glInternalFormat, textureFormat.glBaseInternalFormat, size[0], size[1], 0, 0, 1, len(levels), 0))
+    for level in levels:
+        # Compressed levels are always a multiple of 8 bytes, so they never need padding.
+        file.write(struct.pack("<I", len(level)))
+        file.write(level)
+
+# Writers for the supported texture containers by file extension.
+CONTAINER_WRITERS = {".dds": WriteDDS, ".ktx": WriteKTX}
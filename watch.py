@@ -0,0 +1,129 @@
+"""
+pytex
+Copyright (C) 2015  Gregory Mitrano
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along
+with this program; if not, write to the Free Software Foundation, Inc.,
+51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+from imagecache import SHARED_MEMORY_DIR
+from observer import PackObserver
+from pytex import AtlasPacker
+import os
+import shutil
+import tempfile
+import time
+
+IMAGE_EXTENSIONS = {".jpg", ".png"}
+
+class AtlasWatcher(object):
+    """Repacks an atlas whenever the images in a directory change
+
+    The trimmed images and the previous layout are kept in a sprite cache,
+    so a rebuild only decodes the images that changed and only recomposites
+    them if the layout stays the same. Changes are found by polling the
+    modification times, and a burst of saves only triggers a single rebuild
+    once the directory has been quiet for the debounce interval."""
+
+    def __init__(self, directoryPath, minImageSize, maxImageSize, manifestMode, outputImagePath, outputManifestPath, pollInterval=0.1, debounceInterval=0.25, **packOptions):
+        self._directoryPath = directoryPath
+        self._packArgs = (minImageSize, maxImageSize, manifestMode, outputImagePath, outputManifestPath)
+        self._pollInterval = pollInterval
+        self._debounceInterval = debounceInterval
+
+        # Only the first build is worth starting the worker processes for.
+        self._workers = packOptions.pop("workers", 1)
+        self._observer = packOptions.pop("observer", None) or PackObserver()
+        self._packOptions = packOptions
+
+        # Keep the sprite cache in memory backed storage unless we were given one.
+        self._temporaryCacheDir = None
+        if packOptions.get("cacheDir") is None:
+            self._temporaryCacheDir = tempfile.mkdtemp(prefix="pytex", dir=SHARED_MEMORY_DIR)
+            self._packOptions["cacheDir"] = self._temporaryCacheDir
+
+        self._packer = AtlasPacker()
+        self._snapshot = None
+        self._lastChangeTime = None
+        self._buildCount = 0
+
+    def _Scan(self):
+        # Map every image in the directory to its modification time and size.
+        snapshot = dict()
+        for filename in os.listdir(self._directoryPath):
+            if os.path.splitext(filename)[1].lower() not in IMAGE_EXTENSIONS:
+                continue
+
+            imagePath = os.path.join(self._directoryPath, filename)
+            try:
+                fileStat = os.stat(imagePath)
+            except OSError:
+                # The file was removed while we were looking at it.
+                continue
+            snapshot[imagePath] = (fileStat.st_mtime, fileStat.st_size)
+
+        return snapshot
+
+    def Build(self):
+        """Packs the images currently in the directory
+
+        Returns a PackResult instance, or None if there are no images"""
+        self._snapshot = self._Scan()
+        self._lastChangeTime = None
+        if not self._snapshot:
+            self._observer.Message("No images found in directory %s!" % self._directoryPath)
+            return None
+
+        workers = self._workers if self._buildCount == 0 else 1
+        self._buildCount += 1
+
+        start = time.time()
+        result = self._packer.Pack(sorted(self._snapshot.keys()), *self._packArgs, workers=workers, observer=self._observer, **self._packOptions)
+        self._observer.Message("Rebuilt atlas in %.0fms." % ((time.time() - start) * 1000.0))
+        return result
+
+    def Poll(self, now=None):
+        """Checks the directory for changes and rebuilds once they settled down
+
+        Returns the PackResult instance of the rebuild, or None if there was none"""
+        if now is None:
+            now = time.time()
+
+        snapshot = self._Scan()
+        if snapshot != self._snapshot:
+            self._snapshot = snapshot
+            self._lastChangeTime = now
+
+        if self._lastChangeTime is None or now - self._lastChangeTime < self._debounceInterval:
+            return None
+
+        return self.Build()
+
+    def Run(self):
+        """Builds the atlas and keeps rebuilding it until interrupted"""
+        try:
+            self.Build()
+            self._observer.Message("Watching %s for changes..." % self._directoryPath)
+            while True:
+                time.sleep(self._pollInterval)
+                self.Poll()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.Close()
+
+    def Close(self):
+        if self._temporaryCacheDir is not None:
+            shutil.rmtree(self._temporaryCacheDir, ignore_errors=True)
+            self._temporaryCacheDir = None
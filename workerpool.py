@@ -0,0 +1,129 @@
+"""
+pytex
+Copyright (C) 2015  Gregory Mitrano
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along
+with this program; if not, write to the Free Software Foundation, Inc.,
+51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+import multiprocessing
+import multiprocessing.pool
+import Queue
+import traceback
+
+class WorkerError(Exception):
+    """An error in a worker that couldn't be handed back as it was, holding its traceback"""
+    pass
+
+class WorkerDiedError(Exception):
+    """A worker process exited while it was working on a task"""
+    pass
+
+def _WorkerMain(connection, initializer):
+    if initializer is not None:
+        initializer()
+
+    # Run tasks until the pool is closed.
+    while True:
+        try:
+            task = connection.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+
+        function, chunk = task
+        try:
+            connection.send((True, [function(item) for item in chunk]))
+        except Exception as error:
+            # Hand the error back as it is, or as text when it can't be pickled.
+            errorText = traceback.format_exc()
+            try:
+                connection.send((False, error))
+            except Exception:
+                connection.send((False, WorkerError(errorText)))
+
+class WorkerPool(object):
+    """A pool of worker processes that can be shared by several threads
+
+    Unlike multiprocessing.Pool, a worker that exits in the middle of a task
+    fails that map call with a WorkerDiedError instead of hanging it, and is
+    replaced by a new worker."""
+
+    def __init__(self, workers, initializer=None):
+        self.workers = workers
+        self._initializer = initializer
+        self._idleWorkers = Queue.Queue()
+        self._closedWorkers = []
+        for i in xrange(workers):
+            self._idleWorkers.put(self._StartWorker())
+
+    def _StartWorker(self):
+        connection, workerConnection = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=_WorkerMain, args=(workerConnection, self._initializer))
+        process.daemon = True
+        process.start()
+        workerConnection.close()
+        return (process, connection)
+
+    def _RunChunk(self, function, chunk):
+        # Wait for the result while keeping an eye on the worker.
+        worker = self._idleWorkers.get()
+        try:
+            process, connection = worker
+            try:
+                connection.send((function, chunk))
+                while not connection.poll(0.1):
+                    if not process.is_alive():
+                        raise EOFError
+                success, value = connection.recv()
+            except (EOFError, IOError):
+                process.join()
+                connection.close()
+                worker = self._StartWorker()
+                raise WorkerDiedError("Worker process exited with code %s while running %s" % (process.exitcode, getattr(function, "__name__", function)))
+        finally:
+            self._idleWorkers.put(worker)
+
+        if not success:
+            raise value
+        return value
+
+    def map(self, function, items, chunkSize=1):
+        """Applies the function to every item on the workers and returns the results in order"""
+        if not items:
+            return []
+
+        # Hand the chunks to the workers from threads, so several can run at once.
+        chunks = [items[i:i + chunkSize] for i in xrange(0, len(items), chunkSize)]
+        threadPool = multiprocessing.pool.ThreadPool(min(self.workers, len(chunks)))
+        try:
+            chunkResults = threadPool.map(lambda chunk: self._RunChunk(function, chunk), chunks)
+        finally:
+            threadPool.close()
+            threadPool.join()
+
+        return [result for chunkResult in chunkResults for result in chunkResult]
+
+    def close(self):
+        """Stops the workers once they're done, no more tasks may be handed out"""
+        self._closedWorkers = [self._idleWorkers.get() for i in xrange(self.workers)]
+        for process, connection in self._closedWorkers:
+            connection.send(None)
+            connection.close()
+
+    def join(self):
+        """Waits for the workers of a closed pool to exit"""
+        for process, connection in self._closedWorkers:
+            process.join()